@@ -0,0 +1,118 @@
+"""
+Per-request token verification cost, before and after the shared key cache.
+
+Runs against a local fake JWKS server, so no Keycloak is needed:
+
+    python bench_verify.py --iterations 2000 --keys 4
+
+"before" is the previous request path: download the JWKS, scan it for the kid, build a JWK dict
+and let jose parse it into a key object. "before (no fetch)" is the same without the download,
+to separate the network cost from the parsing cost. "after" is JWKSKeyCache.decode().
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from key_cache import JWKSKeyCache
+
+
+def make_keys(count: int):
+    """Returns (private PEM of the last key, JWKS with count public keys)."""
+    jwks = {"keys": []}
+    private_pem = None
+    for i in range(count):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        public_jwk = {k: (v.decode() if isinstance(v, bytes) else v)
+                      for k, v in jwk.construct(public_pem, "RS256").to_dict().items()}
+        public_jwk.update({"kid": f"key-{i}", "use": "sig", "alg": "RS256"})
+        jwks["keys"].append(public_jwk)
+    return private_pem, jwks
+
+
+def serve_jwks(jwks: dict) -> HTTPServer:
+    body = json.dumps(jwks).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def decode_before(token: str, jwks: dict) -> dict:
+    """The previous per-request path, minus the download."""
+    header = jwt.get_unverified_header(token)
+    rsa_key = {}
+    for key in jwks["keys"]:
+        if key["kid"] == header["kid"]:
+            rsa_key = {"kty": key["kty"], "kid": key["kid"], "use": key["use"],
+                       "n": key["n"], "e": key["e"], "alg": key["alg"]}
+            break
+    return jwt.decode(token, rsa_key, algorithms=[rsa_key["alg"]], options={"verify_aud": False})
+
+
+async def main(iterations: int, key_count: int) -> None:
+    private_pem, jwks = make_keys(key_count)
+    server = serve_jwks(jwks)
+    url = f"http://127.0.0.1:{server.server_port}/certs"
+    token = jwt.encode(
+        {"sub": "bench", "exp": int(time.time()) + 3600, "realm_access": {"roles": ["etudiant"]}},
+        private_pem, algorithm="RS256", headers={"kid": f"key-{key_count - 1}"},
+    )
+
+    results = {}
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        for _ in range(iterations):
+            response = await client.get(url)
+            decode_before(token, response.json())
+    results["before"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode_before(token, jwks)
+    results["before (no fetch)"] = time.perf_counter() - start
+
+    cache = JWKSKeyCache(jwks_url=url)
+    await cache.refresh(force=True)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await cache.decode(token, verify_aud=False)
+    results["after"] = time.perf_counter() - start
+
+    server.shutdown()
+    print(f"{iterations} verifications, {key_count} keys in the JWKS")
+    for name, elapsed in results.items():
+        print(f"  {name:<18} {elapsed / iterations * 1e6:9.1f} us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark token verification with and without the key cache.")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--keys", type=int, default=3, help="Keys in the fake JWKS; the token uses the last one.")
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.keys))
@@ -2,10 +2,10 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from pydantic import BaseModel
-import httpx
 from typing import List, Optional
 import os
 from dotenv import load_dotenv
+from key_cache import jwks_cache
 
 load_dotenv()
 
@@ -36,50 +36,11 @@ class User(BaseModel):
     roles: List[str]
     is_active: bool = True
 
-async def get_jwks() -> dict:
-    """Fetch JWKS from Keycloak server"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(JWKS_URL)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPError as e:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Could not fetch JWKS from Keycloak"
-            ) from e
-
-def get_rsa_key(jwks: dict, unverified_header: dict) -> dict:
-    """Extract the RSA key from JWKS that matches the token's kid"""
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            return {
-                "kty": key["kty"],
-                "kid": key["kid"],
-                "use": key["use"],
-                "n": key["n"],
-                "e": key["e"],
-                "alg": key["alg"]
-            }
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="No matching RSA key found in JWKS"
-    )
-
 async def decode_token(token: str) -> TokenData:
     """Decode and validate JWT token"""
     try:
-        unverified_header = jwt.get_unverified_header(token)
-        jwks = await get_jwks()
-        rsa_key = get_rsa_key(jwks, unverified_header)
-        
-        payload = jwt.decode(
-            token,
-            rsa_key,
-            algorithms=[rsa_key["alg"]],
-            audience=CLIENT_ID,
-            options={"verify_aud": True}
-        )
+        # Cached key object for the token's kid; no JWKS download per request
+        payload = await jwks_cache.decode(token, audience=CLIENT_ID, verify_aud=True)
         return TokenData(**payload)
     except JWTError as e:
         raise HTTPException(
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+from fastapi import HTTPException, status
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+KEYCLOAK_URL = os.getenv("KEYCLOAK_SERVER_URL", "http://localhost:8080")
+REALM = os.getenv("KEYCLOAK_REALM", "est-realm")
+JWKS_URL = os.getenv("JWKS_URL", f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/certs")
+# Keys are re-fetched in the background after this many seconds
+JWKS_CACHE_TTL = float(os.getenv("JWKS_CACHE_TTL", "3600"))
+# An unknown kid (key rotation) triggers a re-fetch at most this often
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+# Threads checking signatures of batch requests (OpenSSL releases the GIL while verifying)
+VERIFY_THREADS = int(os.getenv("VERIFY_THREADS", str(min(8, os.cpu_count() or 1))))
+
+_verify_executor = ThreadPoolExecutor(max_workers=VERIFY_THREADS, thread_name_prefix="verify")
+
+
+class JWKSKeyCache:
+    """
+    Public keys of the realm, parsed once per JWKS fetch and indexed by kid.
+
+    Each key is stored as a ready-to-use jose key object, so verifying a token is a dict
+    lookup plus the signature check instead of a JWKS download, a linear scan and a key parse.
+    """
+    def __init__(self, jwks_url: str = JWKS_URL, ttl: float = JWKS_CACHE_TTL,
+                 min_refresh_interval: float = JWKS_MIN_REFRESH_INTERVAL):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, Tuple[str, Any]] = {}  # kid -> (algorithm, key object)
+        self._fetched_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._background_refresh: Optional[asyncio.Task] = None
+
+    def load_jwks(self, jwks: dict) -> None:
+        """Replaces the cached keys with the signing keys of a JWKS document."""
+        keys = {}
+        for key in jwks.get("keys", []):
+            if key.get("use", "sig") != "sig" or "kid" not in key:
+                continue
+            algorithm = key.get("alg", "RS256")
+            keys[key["kid"]] = (algorithm, jwk.construct(key, algorithm))
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    async def refresh(self, force: bool = False) -> None:
+        """Fetches the JWKS, unless another refresh happened less than min_refresh_interval ago."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not force and time.monotonic() - self._fetched_at < self.min_refresh_interval:
+                return
+            try:
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(self.jwks_url)
+                    response.raise_for_status()
+                    jwks = response.json()
+            except httpx.HTTPError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"Unable to fetch JWKS: {str(e)}"
+                )
+            self.load_jwks(jwks)
+
+    async def refresh_quietly(self) -> None:
+        """Refreshes the keys, keeping the current ones if Keycloak is unreachable."""
+        try:
+            await self.refresh(force=True)
+        except HTTPException:
+            pass  # keep serving the current keys; the next expiry retries
+
+    async def get_key(self, kid: str) -> Tuple[str, Any]:
+        """
+        Returns (algorithm, key object) for a kid.
+
+        Raises:
+            HTTPException: 401 if no key matches, 503 if the JWKS could not be fetched on first use.
+        """
+        entry = self._keys.get(kid)
+        if entry is None:
+            await self.refresh()
+            entry = self._keys.get(kid)
+            if entry is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="No matching RSA key found in JWKS"
+                )
+        elif time.monotonic() - self._fetched_at > self.ttl:
+            if self._background_refresh is None or self._background_refresh.done():
+                self._background_refresh = asyncio.ensure_future(self.refresh_quietly())
+        return entry
+
+    async def decode(self, token: str, audience: Optional[str] = None, verify_aud: bool = True,
+                     algorithms: Optional[list] = None) -> dict:
+        """
+        Verifies a token with the cached key for its kid and returns the claims.
+
+        Raises:
+            JWTError: If the token is malformed, expired or its signature or audience is invalid.
+            HTTPException: If no key matches the token's kid.
+        """
+        header = jwt.get_unverified_header(token)
+        algorithm, key = await self.get_key(header.get("kid", ""))
+        return jwt.decode(
+            token,
+            key,
+            algorithms=algorithms or [algorithm],
+            audience=audience,
+            options={"verify_aud": verify_aud}
+        )
+
+    async def decode_many(self, tokens: List[str], audience: Optional[str] = None, verify_aud: bool = True,
+                          algorithms: Optional[list] = None) -> List[Union[dict, Exception]]:
+        """
+        Verifies many tokens at once, in the order given.
+
+        Keys are looked up once per distinct kid, identical tokens are verified once, and the
+        signature checks are spread over the verification threads.
+
+        Returns:
+            List[Union[dict, Exception]]: The claims of each token, or the error it failed with.
+        """
+        keys: Dict[str, Union[Tuple[str, Any], Exception]] = {}
+        headers: Dict[str, Union[dict, Exception]] = {}
+        for token in tokens:
+            if token in headers:
+                continue
+            try:
+                headers[token] = jwt.get_unverified_header(token)
+            except JWTError as e:
+                headers[token] = e
+        kids = {h.get("kid", "") for h in headers.values() if isinstance(h, dict)}
+        for kid in kids:
+            try:
+                keys[kid] = await self.get_key(kid)
+            except HTTPException as e:
+                keys[kid] = e
+
+        def verify(batch: List[str]) -> List[Union[dict, Exception]]:
+            results = []
+            for token in batch:
+                header = headers[token]
+                entry = header if isinstance(header, Exception) else keys[header.get("kid", "")]
+                if isinstance(entry, Exception):
+                    results.append(entry)
+                    continue
+                algorithm, key = entry
+                try:
+                    results.append(jwt.decode(token, key, algorithms=algorithms or [algorithm], audience=audience,
+                                              options={"verify_aud": verify_aud}))
+                except JWTError as e:
+                    results.append(e)
+            return results
+
+        unique = list(headers)
+        chunk_size = max(1, -(-len(unique) // VERIFY_THREADS))
+        chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+        loop = asyncio.get_running_loop()
+        verified = await asyncio.gather(*(loop.run_in_executor(_verify_executor, verify, chunk) for chunk in chunks))
+        by_token = {token: result for chunk, results in zip(chunks, verified) for token, result in zip(chunk, results)}
+        return [by_token[token] for token in tokens]
+
+
+# Shared by main.py and dependencies.py so both verify through the same keys
+jwks_cache = JWKSKeyCache()
@@ -233,11 +233,12 @@ from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
 from jose import jwt, JWTError
 from pydantic import BaseModel
-from typing import List
-import httpx
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 from starlette.status import HTTP_401_UNAUTHORIZED
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError
+from key_cache import jwks_cache
 
 # Load environment variables
 load_dotenv()
@@ -292,6 +293,8 @@ REALM = os.getenv("KEYCLOAK_REALM", "est-realm")
 CLIENT_ID = os.getenv("KEYCLOAK_CLIENT_ID", "est-client")
 JWKS_URL = os.getenv("JWKS_URL", f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/certs")
 ALGORITHM = os.getenv("ALGORITHM", "RS256")
+# Maximum number of tokens accepted by /verify-tokens in one request
+VERIFY_BATCH_MAX = int(os.getenv("VERIFY_BATCH_MAX", "500"))
 
 
 # Validate essential configs
@@ -318,51 +321,29 @@ class User(BaseModel):
     username: str
     roles: List[str]
 
-# Fetch JWKS keys
-async def get_jwks():
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(JWKS_URL)
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPError as e:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Unable to fetch JWKS: {str(e)}"
-        )
+class VerifyTokensRequest(BaseModel):
+    tokens: List[str]
+
+class TokenVerification(BaseModel):
+    valid: bool
+    sub: Optional[str] = None
+    username: Optional[str] = None
+    email: Optional[str] = None
+    roles: Optional[List[str]] = None
+    exp: Optional[int] = None
+    error: Optional[str] = None  # expired, invalid_claims, invalid, unknown_key or jwks_unavailable
+
+class VerifyTokensResponse(BaseModel):
+    results: List[TokenVerification]
 
 # Extract and validate user from JWT token
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-
     try:
-        jwks = await get_jwks()
-        header = jwt.get_unverified_header(token)
-
-        # Find matching key
-        rsa_key = next(({
-            "kty": key["kty"],
-            "kid": key["kid"],
-            "use": key["use"],
-            "n": key["n"],
-            "e": key["e"],
-            "alg": key["alg"]
-        } for key in jwks["keys"] if key["kid"] == header["kid"]), None)
-
-        if not rsa_key:
-            raise credentials_exception
-
-        # Decode and verify token
-        payload = jwt.decode(
+        # Decode and verify token with the cached key for its kid
+        payload = await jwks_cache.decode(
             token,
-            rsa_key,
-            algorithms=[rsa_key["alg"]],
             audience="account",
-            options={"verify_aud": False}  # Set True in production
+            verify_aud=False  # Set True in production
         )
 
         token_data = TokenData(**payload)
@@ -378,6 +359,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
             detail=f"JWT validation error: {str(e)}"
         )
 
+@app.on_event("startup")
+async def load_signing_keys():
+    # Fetch the realm keys once up front; unknown kids and expiry refresh them later
+    await jwks_cache.refresh_quietly()
+
 # Router for token verification
 router = APIRouter()
 
@@ -390,32 +376,8 @@ async def verify_token(request: Request):
     token = auth.split(" ")[1]
 
     try:
-        # Get JWKS from Keycloak
-        async with httpx.AsyncClient() as client:
-            response = await client.get(JWKS_URL)
-            response.raise_for_status()
-            jwks = response.json()
-
-        unverified_header = jwt.get_unverified_header(token)
-
-        # Find the right public key
-        rsa_key = {}
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
-                break
-
-        if not rsa_key:
-            raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Unable to find appropriate key")
-
-        # Decode the token
-        payload = jwt.decode(token, rsa_key, algorithms=[ALGORITHM], audience="account")
+        # Decode the token with the cached key for its kid
+        payload = await jwks_cache.decode(token, audience="account", algorithms=[ALGORITHM])
         roles = payload.get("realm_access", {}).get("roles", [])
 
         return TokenData(
@@ -424,10 +386,47 @@ async def verify_token(request: Request):
             name=payload.get("name"),
             roles=roles
         )
-    except (jwt.JWTError, httpx.HTTPError) as e:
+    except JWTError as e:
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail=f"Invalid token: {str(e)}")
 
 
+def _verification_error(error: Exception) -> str:
+    if isinstance(error, ExpiredSignatureError):
+        return "expired"
+    if isinstance(error, JWTClaimsError):
+        return "invalid_claims"
+    if isinstance(error, HTTPException):
+        return "jwks_unavailable" if error.status_code == status.HTTP_503_SERVICE_UNAVAILABLE else "unknown_key"
+    return "invalid"
+
+@router.post("/verify-tokens", response_model=VerifyTokensResponse, response_model_exclude_none=True)
+async def verify_tokens(body: VerifyTokensRequest):
+    """
+    Verifies many bearer tokens in one call, for gateways and sidecars.
+    Results come back in the order of the request; invalid tokens get a short error code.
+    """
+    if len(body.tokens) > VERIFY_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {VERIFY_BATCH_MAX} tokens per request"
+        )
+    outcomes = await jwks_cache.decode_many(body.tokens, audience="account", algorithms=[ALGORITHM])
+    results = []
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            results.append(TokenVerification(valid=False, error=_verification_error(outcome)))
+            continue
+        results.append(TokenVerification(
+            valid=True,
+            sub=outcome.get("sub"),
+            username=outcome.get("preferred_username"),
+            email=outcome.get("email"),
+            roles=(outcome.get("realm_access") or {}).get("roles", []),
+            exp=outcome.get("exp"),
+        ))
+    return VerifyTokensResponse(results=results)
+
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -0,0 +1,63 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+
+def normalize_message(message: str) -> str:
+    """Cache key for a user message: lowercase, single-spaced, without surrounding punctuation."""
+    message = re.sub(r"\s+", " ", message.lower()).strip()
+    return message.strip(" ?!.,;:")
+
+
+class AnswerCache:
+    """
+    Bounded LRU cache of generated AI answers with a time-to-live, keyed by normalized message.
+    """
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL):
+        """
+        Args:
+            max_entries (int): Maximum number of cached answers; the least recently used is evicted first.
+            ttl_seconds (float): How long an answer stays valid.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, message: str) -> Optional[str]:
+        """Returns the cached answer for a message, or None on a miss or expired entry."""
+        key = normalize_message(message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, answer = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return answer
+
+    def set(self, message: str, answer: str, ttl_seconds: Optional[float] = None) -> None:
+        """
+        Stores an answer, evicting the least recently used entries beyond max_entries.
+
+        Args:
+            ttl_seconds (Optional[float]): Validity of this entry if shorter than the cache's, e.g. for an older answer.
+        """
+        key = normalize_message(message)
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,144 @@
+import argparse
+import json
+import random
+import statistics
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .benchmark_index import _parse_list, print_table
+from .retriever import QDRANT_COLLECTION, QDRANT_HOST
+from .vector_compression import DimensionReducer, ReducerError, load_reducer
+from .vector_db_manager import VectorDBManager
+
+
+def quantize_scores(vectors: np.ndarray, queries: np.ndarray, storage: str) -> np.ndarray:
+    """
+    Query/point similarities as a quantized index would compute them.
+
+    "int8" mirrors Qdrant scalar quantization (one range for the collection from the 0.99 quantile),
+    "binary" keeps only the sign of each dimension, "float32" is exact.
+    """
+    if storage == "float32":
+        return queries @ vectors.T
+    if storage == "int8":
+        low, high = np.quantile(vectors, [0.005, 0.995])
+        scale = (high - low) / 255.0
+        codes = np.round((np.clip(vectors, low, high) - low) / scale)
+        return queries @ (codes * scale + low).T
+    if storage == "binary":
+        return np.sign(queries) @ np.sign(vectors).T
+    raise ValueError(f"Unknown storage '{storage}'. Expected float32, int8 or binary.")
+
+
+def bytes_per_vector(dimension: int, storage: str) -> float:
+    """Size of one vector in the search index (the full-precision originals used for rescoring can live on disk)."""
+    return {"float32": 4.0 * dimension, "int8": float(dimension), "binary": np.ceil(dimension / 8)}[storage]
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return statistics.mean(len(set(f) & set(t)) / len(t) for f, t in zip(found.tolist(), truth.tolist()))
+
+
+def run_benchmark(vectors: np.ndarray, queries: np.ndarray, dims: List[int], methods: List[str],
+                  storages: List[str], k: int = 5, oversampling: float = 2.0) -> List[Dict[str, Any]]:
+    """
+    Compares compact representations against exact search on the full-size embeddings.
+
+    For each reduced dimension (fitted on the corpus) and index storage, measures recall@k of the
+    quantized search alone and after rescoring the top k * oversampling candidates with the
+    reduced float vectors, as Qdrant does with rescore enabled.
+
+    Returns:
+        List[Dict[str, Any]]: One row per (method, dimension, storage).
+    """
+    full_dimension = vectors.shape[1]
+    truth = _top_k(queries @ vectors.T, k)
+    baseline = bytes_per_vector(full_dimension, "float32")
+    rows = []
+    for method in methods:
+        for dimension in dims:
+            if dimension >= full_dimension:
+                if method != methods[0]:
+                    continue  # the full size is the same for every method
+                reduced, reduced_queries, label, kept = vectors, queries, "none", 1.0
+            else:
+                reducer = DimensionReducer.fit(vectors, dimension, method)
+                reduced, reduced_queries = reducer.transform(vectors), reducer.transform(queries)
+                label, kept = method, reducer.explained_variance
+            exact_reduced = reduced_queries @ reduced.T
+            for storage in storages:
+                approx = quantize_scores(reduced, reduced_queries, storage)
+                candidates = _top_k(approx, max(k, int(k * oversampling)))
+                rescored = np.take_along_axis(exact_reduced, candidates, axis=1)
+                order = rescored.argsort(axis=1)[:, ::-1][:, :k]
+                size = bytes_per_vector(min(dimension, full_dimension), storage)
+                rows.append({
+                    "reduction": label,
+                    "dims": min(dimension, full_dimension),
+                    "variance_kept": round(kept, 3),
+                    "storage": storage,
+                    "bytes/vector": int(size),
+                    "memory_saved": f"{(1 - size / baseline) * 100:.1f}%",
+                    f"recall@{k}": round(_recall(_top_k(approx, k), truth), 4),
+                    f"recall@{k}_rescored": round(_recall(np.take_along_axis(candidates, order, axis=1), truth), 4),
+                })
+                print(rows[-1])
+    return rows
+
+
+def load_vectors(db: VectorDBManager, collection_name: str) -> Optional[np.ndarray]:
+    """Full-size vectors of a collection, or None if it is empty or already stores reduced vectors."""
+    live = db.get_alias_target(collection_name) or collection_name
+    try:
+        reduced = load_reducer(db, live) is not None
+    except ReducerError:
+        reduced = True  # reduced, with a projection this node cannot rebuild
+    if reduced:
+        print(f"'{live}' stores reduced vectors; benchmark a collection of full-size embeddings instead.")
+        return None
+    records = list(db.scroll_points(collection_name, with_vectors=True))
+    if not records:
+        print(f"Collection '{collection_name}' is empty or unreachable. Nothing to benchmark.")
+        return None
+    return np.asarray([record.vector for record in records], dtype=np.float32)
+
+
+if __name__ == '__main__':
+    # Example: python -m src.benchmark_compression --dims 384,256,128,64 --storage float32,int8,binary
+    parser = argparse.ArgumentParser(description="Memory saved vs recall@k lost for compact vector representations.")
+    parser.add_argument("--host", default=QDRANT_HOST)
+    parser.add_argument("--collection", default=QDRANT_COLLECTION)
+    parser.add_argument("--dims", default="384,256,128,64", help="Comma-separated target dimensions.")
+    parser.add_argument("--methods", default="pca,truncate", help="Comma-separated: pca, truncate.")
+    parser.add_argument("--storage", default="float32,int8,binary", help="Comma-separated: float32, int8, binary.")
+    parser.add_argument("--oversampling", type=float, default=2.0, help="Candidates rescored per result.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this JSON file.")
+    args = parser.parse_args()
+
+    db_manager = VectorDBManager(host=args.host)
+    if not db_manager.client:
+        raise SystemExit("Failed to connect to Qdrant.")
+    corpus = load_vectors(db_manager, args.collection)
+    if corpus is None:
+        raise SystemExit(1)
+    # Queries are sampled from the stored vectors, like benchmark_index
+    sample = random.Random(42).sample(range(len(corpus)), min(args.queries, len(corpus)))
+    print(f"Loaded {len(corpus)} vectors (dim {corpus.shape[1]}); running {len(sample)} queries per setting.")
+
+    results = run_benchmark(corpus, corpus[sample], _parse_list(args.dims, int), _parse_list(args.methods),
+                            _parse_list(args.storage), k=args.k, oversampling=args.oversampling)
+    print()
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
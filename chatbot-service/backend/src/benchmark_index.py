@@ -0,0 +1,142 @@
+import argparse
+import itertools
+import json
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+
+from .vector_db_manager import VectorDBManager
+from .retriever import QDRANT_COLLECTION, QDRANT_HOST
+
+
+def _parse_list(value: str, cast=str) -> List[Any]:
+    return [cast(item) for item in value.split(",") if item != ""]
+
+
+def _wait_until_indexed(db: VectorDBManager, collection_name: str, timeout: float = 300.0) -> None:
+    """Waits for the optimizer to finish building the HNSW index before measuring."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = db.client.get_collection(collection_name=collection_name)
+        if str(getattr(info.status, "value", info.status)) == "green":
+            return
+        time.sleep(0.5)
+    print(f"Warning: '{collection_name}' is still optimizing; results may be pessimistic.")
+
+
+def run_benchmark(db: VectorDBManager, source_collection: str, m_values: List[int], ef_construct_values: List[int],
+                  quantizations: List[str], on_disk_values: List[bool], ef_values: List[int], k: int = 5,
+                  query_count: int = 100, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Sweeps index settings on a copy of the collection and measures recall@k and latency.
+
+    Each build configuration is loaded into a temporary collection; queries are sampled from the
+    stored vectors and compared against exact (full-scan) results on the source collection.
+
+    Returns:
+        List[Dict[str, Any]]: One row per (build configuration, search ef) with recall and latency figures.
+    """
+    records = list(db.scroll_points(source_collection, with_vectors=True))
+    if not records:
+        print(f"Collection '{source_collection}' is empty or unreachable. Nothing to benchmark.")
+        return []
+    dimension = len(records[0].vector)
+    vectors = [record.vector for record in records]
+    rng = random.Random(seed)
+    queries = [vectors[i] for i in rng.sample(range(len(vectors)), min(query_count, len(vectors)))]
+    print(f"Loaded {len(records)} points (dim {dimension}); running {len(queries)} queries per setting.")
+
+    ground_truth = [
+        {str(hit["id"]) for hit in db.search(source_collection, query, limit=k, exact=True)}
+        for query in queries
+    ]
+
+    rows: List[Dict[str, Any]] = []
+    builds = itertools.product(m_values, ef_construct_values, quantizations, on_disk_values)
+    for build_index, (m, ef_construct, quantization, on_disk) in enumerate(builds):
+        bench_collection = f"{source_collection}__bench_{build_index}"
+        db.delete_collection(bench_collection)
+        created = db.create_collection_if_not_exists(
+            bench_collection, dimension, hnsw_m=m, hnsw_ef_construct=ef_construct,
+            quantization=quantization, on_disk_vectors=on_disk, indexing_threshold=0,
+        )
+        if not created:
+            continue
+        try:
+            for start in range(0, len(records), 256):
+                batch = records[start:start + 256]
+                db.ingest_points(bench_collection, [r.vector for r in batch], [r.payload for r in batch], ids=[r.id for r in batch])
+            _wait_until_indexed(db, bench_collection)
+
+            for ef in ef_values:
+                latencies_ms: List[float] = []
+                recalls: List[float] = []
+                for query, truth in zip(queries, ground_truth):
+                    start_time = time.perf_counter()
+                    hits = db.search(bench_collection, query, limit=k, hnsw_ef=ef,
+                                     rescore=True if quantization != "none" else None)
+                    latencies_ms.append((time.perf_counter() - start_time) * 1000.0)
+                    found = {str(hit["id"]) for hit in hits}
+                    recalls.append(len(found & truth) / max(len(truth), 1))
+                latencies_ms.sort()
+                rows.append({
+                    "m": m,
+                    "ef_construct": ef_construct,
+                    "quantization": quantization,
+                    "on_disk": on_disk,
+                    "ef": ef,
+                    f"recall@{k}": round(statistics.mean(recalls), 4),
+                    "p50_ms": round(latencies_ms[len(latencies_ms) // 2], 3),
+                    "p95_ms": round(latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))], 3),
+                })
+                print(rows[-1])
+        finally:
+            db.delete_collection(bench_collection)
+    return rows
+
+
+def print_table(rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    headers = list(rows[0].keys())
+    widths = [max(len(h), *(len(str(row[h])) for row in rows)) for h in headers]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
+
+
+if __name__ == '__main__':
+    # Example: python -m src.benchmark_index --m 8,16,32 --ef 16,32,64,128 --quantization none,scalar
+    parser = argparse.ArgumentParser(description="Recall-vs-latency sweep of Qdrant index settings.")
+    parser.add_argument("--host", default=QDRANT_HOST)
+    parser.add_argument("--collection", default=QDRANT_COLLECTION)
+    parser.add_argument("--m", default="16", help="Comma-separated HNSW m values.")
+    parser.add_argument("--ef-construct", default="100", help="Comma-separated HNSW ef_construct values.")
+    parser.add_argument("--quantization", default="none,scalar", help="Comma-separated: none, scalar, product, binary.")
+    parser.add_argument("--on-disk", default="false", help="Comma-separated: false, true.")
+    parser.add_argument("--ef", default="16,32,64,128", help="Comma-separated search-time ef values.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this JSON file.")
+    args = parser.parse_args()
+
+    db_manager = VectorDBManager(host=args.host)
+    if not db_manager.client:
+        raise SystemExit("Failed to connect to Qdrant.")
+
+    results = run_benchmark(
+        db_manager, args.collection,
+        m_values=_parse_list(args.m, int),
+        ef_construct_values=_parse_list(args.ef_construct, int),
+        quantizations=_parse_list(args.quantization),
+        on_disk_values=[value.lower() == "true" for value in _parse_list(args.on_disk)],
+        ef_values=_parse_list(args.ef, int),
+        k=args.k,
+        query_count=args.queries,
+    )
+    print()
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
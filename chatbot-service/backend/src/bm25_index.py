@@ -0,0 +1,194 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# One index file per collection version, like the vector reducers: rolling the alias back to an older
+# version must also bring back the lexical index of that version's corpus.
+BM25_INDEX_DIR = Path(os.getenv("BM25_INDEX_DIR", str(Path(__file__).parent / "data" / "bm25")))
+
+# Keeps compound tokens such as "préinscription.um5.ac.ma" or "ests@um5.ac.ma" whole,
+# and also indexes their parts so partial queries still match.
+TOKEN_PATTERN = re.compile(r"\w+(?:[.@'’-]\w+)*")
+TOKEN_SEPARATORS = re.compile(r"[.@'’-]")
+
+
+def bm25_index_path(collection_name: str) -> Path:
+    return BM25_INDEX_DIR / f"{collection_name}.json"
+
+
+def delete_bm25_index(collection_name: str) -> None:
+    bm25_index_path(collection_name).unlink(missing_ok=True)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase lexical tokens for BM25 scoring.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        List[str]: Tokens, with compound tokens followed by their parts.
+    """
+    tokens: List[str] = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group(0)
+        tokens.append(token)
+        if TOKEN_SEPARATORS.search(token):
+            tokens.extend(part for part in TOKEN_SEPARATORS.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over the text chunks stored in Qdrant.
+    Documents are keyed by their Qdrant point ID so results can be fused with vector search.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Initializes an empty index.
+
+        Args:
+            k1 (float): Term frequency saturation parameter.
+            b (float): Document length normalization parameter.
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.payloads: Dict[str, Dict[str, Any]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def upsert(self, doc_id: str, text: str, payload: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Adds a document, replacing any existing document with the same ID.
+
+        Args:
+            doc_id (str): The Qdrant point ID of the chunk.
+            text (str): The chunk text to index.
+            payload (Optional[Dict[str, Any]]): The point payload returned with search results.
+        """
+        doc_id = str(doc_id)
+        if doc_id in self.doc_terms:
+            self.delete(doc_id)
+
+        term_counts = dict(Counter(tokenize(text)))
+        for term, count in term_counts.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        self.doc_terms[doc_id] = term_counts
+        length = sum(term_counts.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        self.payloads[doc_id] = payload if payload is not None else {}
+
+    def delete(self, doc_id: str) -> bool:
+        """
+        Removes a document from the index.
+
+        Returns:
+            bool: True if the document existed, False otherwise.
+        """
+        doc_id = str(doc_id)
+        term_counts = self.doc_terms.pop(doc_id, None)
+        if term_counts is None:
+            return False
+        for term in term_counts:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        self.payloads.pop(doc_id, None)
+        return True
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Scores documents against the query with BM25.
+
+        Args:
+            query (str): The user query.
+            limit (int): Maximum number of results to return.
+
+        Returns:
+            List[Dict[str, Any]]: Results shaped like VectorDBManager.search results
+            ("id", "score", "payload"), best first.
+        """
+        doc_count = len(self.doc_lengths)
+        if doc_count == 0:
+            return []
+        avg_length = self.total_length / doc_count
+
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"id": doc_id, "score": score, "payload": self.payloads.get(doc_id)} for doc_id, score in ranked]
+
+    def save(self, path: Path) -> bool:
+        """
+        Writes the index to disk atomically so a serving process never reads a partial file.
+
+        Returns:
+            bool: True if the index was written, False otherwise.
+        """
+        path = Path(path)
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "docs": {
+                doc_id: {"terms": terms, "payload": self.payloads.get(doc_id, {})}
+                for doc_id, terms in self.doc_terms.items()
+            },
+        }
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open('w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            print(f"Error saving BM25 index to {path}: {e}")
+            return False
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        """
+        Loads an index written by save(). Returns an empty index if the file is missing or invalid.
+        """
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        try:
+            with path.open('r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading BM25 index from {path}: {e}")
+            return cls()
+
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        for doc_id, doc in data.get("docs", {}).items():
+            terms = doc.get("terms", {})
+            for term, count in terms.items():
+                index.postings.setdefault(term, {})[doc_id] = count
+            index.doc_terms[doc_id] = terms
+            index.doc_lengths[doc_id] = sum(terms.values())
+            index.total_length += index.doc_lengths[doc_id]
+            index.payloads[doc_id] = doc.get("payload", {})
+        return index
@@ -0,0 +1,258 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from .answer_cache import AnswerCache
+from .circuit_breaker import CircuitOpenError
+from .event_log import event_log
+from .load_shedder import LoadShedder
+from .metrics import metrics
+from .ollama import generate_response, stream_response
+from .precomputed_answers import PrecomputedAnswers
+from .rate_limiter import RateLimiter
+from .reranker import CrossEncoderReranker
+from .retriever import HybridRetriever
+from .rules_manager import RulesManager
+
+# Per-stage timeouts in seconds. A slow stage is abandoned rather than delaying the request.
+# The cache stage has none: it is a dict lookup on the event loop, which a timeout could not preempt.
+RULE_STAGE_TIMEOUT = float(os.getenv("RULE_STAGE_TIMEOUT", "0.05"))
+PRECOMPUTED_STAGE_TIMEOUT = float(os.getenv("PRECOMPUTED_STAGE_TIMEOUT", "0.5"))
+RETRIEVAL_STAGE_TIMEOUT = float(os.getenv("RETRIEVAL_STAGE_TIMEOUT", "2.0"))
+
+DEGRADED_PREFIX = (
+    "Le service IA est momentanément indisponible. "
+    "Voici l'information la plus proche que nous avons trouvée :\n\n"
+)
+
+# Stages that can answer a request on their own, and the order in which simultaneous results are considered.
+DECISIVE_STAGES = ("rule", "cache", "precomputed")
+STAGE_PRIORITY = {"rule": 0, "cache": 1, "precomputed": 2, "retrieval": 3}
+
+
+class ChatResult:
+    """Outcome of the chat pipeline for one message."""
+    def __init__(self, response: Optional[str], source: str, hits: Optional[List[Dict[str, Any]]] = None):
+        self.response = response
+        self.source = source  # 'rule', 'cache', 'precomputed', 'ai' or 'degraded'
+        self.hits = hits or []
+
+
+class ChatPipeline:
+    """
+    Answers a message by launching rule matching, answer-cache lookup, precomputed-answer lookup and
+    retrieval concurrently. The first decisive result (a rule, cache or precomputed hit) wins and the
+    remaining stages are cancelled; otherwise the retrieved chunks are sent to the LLM.
+    """
+    def __init__(self, rules_manager: RulesManager, answer_cache: AnswerCache, retriever: HybridRetriever,
+                 reranker: CrossEncoderReranker, rate_limiter: Optional[RateLimiter] = None,
+                 load_shedder: Optional[LoadShedder] = None, precomputed: Optional[PrecomputedAnswers] = None):
+        self.rules_manager = rules_manager
+        self.answer_cache = answer_cache
+        self.retriever = retriever
+        self.reranker = reranker
+        self.rate_limiter = rate_limiter
+        self.load_shedder = load_shedder
+        self.precomputed = precomputed
+        # Rule matching is CPU-bound Python: off the event loop so its timeout can abandon it, and on its
+        # own threads so it does not queue behind embedding and retrieval in the default executor
+        self._rule_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rules")
+
+    async def _rule_stage(self, message: str) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._rule_executor, self.rules_manager.find_matching_rule, message)
+
+    async def _cache_stage(self, message: str) -> Optional[str]:
+        return self.answer_cache.get(message)
+
+    async def _precomputed_stage(self, embedding: "asyncio.Task") -> Optional[str]:
+        # Shielded: the embedding task is shared with retrieval and must survive this stage's timeout
+        query_vector = await asyncio.shield(embedding)
+        if query_vector is None:
+            return None
+        match = self.precomputed.lookup(query_vector)
+        return match[0] if match else None
+
+    async def _retrieval_stage(self, message: str, embedding: Optional["asyncio.Task"] = None) -> List[Dict[str, Any]]:
+        query_vector = await asyncio.shield(embedding) if embedding is not None else None
+        candidates = await self.retriever.retrieve(message, limit=self.retriever.candidates, query_vector=query_vector)
+        return await self.reranker.rerank(message, candidates)
+
+    async def _timed(self, stage: str, coro, timeout: Optional[float]):
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(coro, timeout)
+        finally:
+            metrics.observe("chat_stage_latency_ms", (time.perf_counter() - start) * 1000.0, stage=stage)
+
+    async def resolve(self, message: str, use_cache: bool = True,
+                      retrieve: bool = True) -> Tuple[Optional[ChatResult], List[Dict[str, Any]]]:
+        """
+        Runs the independent stages concurrently.
+
+        Args:
+            message (str): The user message.
+            use_cache (bool): Whether a cached or precomputed answer may be served; follow-ups in a
+                conversation depend on their history, so they skip both.
+            retrieve (bool): Whether to run retrieval; skipped when its result could not be used anyway.
+
+        Returns:
+            Tuple[Optional[ChatResult], List[Dict[str, Any]]]: A decisive result if a rule, cached or precomputed
+            answer was found (None otherwise), and the retrieved hits (empty if retrieval was cancelled or failed).
+        """
+        embedding = None
+        if use_cache and self.precomputed is not None:
+            self.precomputed.reload_if_changed()
+            if len(self.precomputed):
+                # The message is embedded once for both the precomputed lookup and vector retrieval
+                embedding = asyncio.create_task(asyncio.to_thread(self.retriever.embed_query, message))
+        stages = {
+            asyncio.create_task(self._timed("rule", self._rule_stage(message), RULE_STAGE_TIMEOUT)): "rule",
+        }
+        if retrieve:
+            stages[asyncio.create_task(self._timed("retrieval", self._retrieval_stage(message, embedding),
+                                                   RETRIEVAL_STAGE_TIMEOUT))] = "retrieval"
+        if use_cache:
+            stages[asyncio.create_task(self._timed("cache", self._cache_stage(message), None))] = "cache"
+        if embedding is not None:
+            stages[asyncio.create_task(self._timed("precomputed", self._precomputed_stage(embedding),
+                                                   PRECOMPUTED_STAGE_TIMEOUT))] = "precomputed"
+        pending = set(stages)
+        hits: List[Dict[str, Any]] = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: STAGE_PRIORITY[stages[t]]):
+                    stage = stages[task]
+                    try:
+                        result = task.result()
+                    except asyncio.TimeoutError:
+                        event_log.emit("chat.stage_timeout", level="warn", stage=stage,
+                                       detail=f"Chat stage '{stage}' timed out.")
+                        metrics.inc("chat_stage_timeouts_total", stage=stage)
+                        continue
+                    except Exception as e:
+                        event_log.emit("chat.stage_error", level="error", stage=stage,
+                                       detail=f"Chat stage '{stage}' failed: {e}")
+                        metrics.inc("chat_stage_errors_total", stage=stage)
+                        continue
+                    if stage in DECISIVE_STAGES and result:
+                        return ChatResult(result, stage), hits
+                    if stage == "retrieval":
+                        hits = result
+        finally:
+            for task in pending:
+                task.cancel()
+            if embedding is not None:
+                embedding.cancel()
+        return None, hits
+
+    def degraded_answer(self, message: str, hits: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Best-effort answer without the LLM: the best retrieved chunk, or else the closest rule.
+        """
+        for hit in hits:
+            text_chunk = (hit.get("payload") or {}).get("text_chunk")
+            if text_chunk:
+                return DEGRADED_PREFIX + text_chunk
+        closest = self.rules_manager.find_closest_rule(message)
+        return DEGRADED_PREFIX + closest if closest else None
+
+    def _degrade(self, message: str, hits: List[Dict[str, Any]], error: Exception) -> ChatResult:
+        """Degraded result after a failed generation; re-raises the error if there is nothing to fall back on."""
+        degraded = self.degraded_answer(message, hits)
+        if degraded is None:
+            raise error
+        if not isinstance(error, CircuitOpenError):
+            event_log.emit("chat.degraded", level="error", detail=f"AI generation failed, serving degraded answer: {error}")
+        metrics.inc("chat_answers_total", source="degraded")
+        return ChatResult(degraded, "degraded", hits)
+
+    async def _prepare(self, message: str, in_conversation: bool, user_key: Optional[str],
+                       sheddable: bool = True) -> Tuple[Optional[ChatResult], List[Dict[str, Any]], List[str]]:
+        """
+        Runs the stages; without a decisive result, charges the AI budget and returns the context chunks.
+
+        Raises:
+            Overloaded: If the message needs the AI while AI work is being shed (and sheddable is set).
+        """
+        shedding = sheddable and self.load_shedder is not None
+        # While AI work is shed, embedding + vector search + reranking would only feed a refused generation
+        decisive, hits = await self.resolve(message, use_cache=not in_conversation,
+                                            retrieve=not (shedding and self.load_shedder.shedding_ai))
+        if decisive is not None:
+            metrics.inc("chat_answers_total", source=decisive.source)
+            return decisive, hits, []
+
+        if shedding:
+            # Under load, rule, cache and precomputed answers are still served; only LLM work is refused
+            self.load_shedder.check_ai()
+        if self.rate_limiter is not None and user_key:
+            await self.rate_limiter.acquire("ai", user_key)
+        context_chunks = [hit["payload"]["text_chunk"] for hit in hits if hit.get("payload") and hit["payload"].get("text_chunk")]
+        return None, hits, context_chunks
+
+    async def answer(self, message: str, history: Optional[List[Tuple[str, str]]] = None,
+                     summary: str = "", user_key: Optional[str] = None,
+                     generation: Optional[Dict[str, Any]] = None, sheddable: bool = True) -> ChatResult:
+        """
+        Produces the answer for a message: rule, cached answer, or a fresh AI generation.
+        If the AI service fails or its circuit is open, a degraded answer is served when one exists.
+
+        Args:
+            message (str): The user message.
+            history (Optional[List[Tuple[str, str]]]): Recent (role, text) turns of the conversation, oldest first.
+            summary (str): Rolling summary of the earlier turns.
+            user_key (Optional[str]): User charged for an AI generation (the OIDC subject).
+            generation (Optional[Dict[str, Any]]): Extra generate_response arguments, e.g. timeout and num_predict.
+            sheddable (bool): Refuse the generation when the server is overloaded (False for queued jobs).
+
+        Raises:
+            RateLimitExceeded: If the message needs the AI and the user's AI budget is exhausted.
+            Overloaded: If the message needs the AI and AI work is being shed.
+        """
+        in_conversation = bool(history or summary)
+        decisive, hits, context_chunks = await self._prepare(message, in_conversation, user_key, sheddable)
+        if decisive is not None:
+            return decisive
+        try:
+            ai_response = await asyncio.to_thread(generate_response, message, context_chunks, history, summary,
+                                                  **(generation or {}))
+        except Exception as e:
+            return self._degrade(message, hits, e)
+        if ai_response is not None and not in_conversation:
+            self.answer_cache.set(message, ai_response)
+        metrics.inc("chat_answers_total", source="ai")
+        return ChatResult(ai_response, "ai", hits)
+
+    async def answer_stream(self, message: str, history: Optional[List[Tuple[str, str]]] = None,
+                            summary: str = "", user_key: Optional[str] = None) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Streaming variant of answer(): yields (source, text) pieces.
+
+        Rule, cached and degraded answers come as a single piece, AI answers as they are generated.
+        Closing the generator (e.g. the user sent another message) stops the generation in Ollama.
+        A failure after part of the answer was sent is raised rather than degraded.
+        """
+        in_conversation = bool(history or summary)
+        decisive, hits, context_chunks = await self._prepare(message, in_conversation, user_key)
+        if decisive is not None:
+            yield decisive.source, decisive.response
+            return
+        pieces: List[str] = []
+        try:
+            async for piece in stream_response(message, context_chunks, history, summary):
+                pieces.append(piece)
+                yield "ai", piece
+        except Exception as e:
+            if pieces:
+                raise
+            degraded = self._degrade(message, hits, e)
+            yield degraded.source, degraded.response
+            return
+        ai_response = "".join(pieces)
+        if ai_response and not in_conversation:
+            self.answer_cache.set(message, ai_response)
+        metrics.inc("chat_answers_total", source="ai")
@@ -0,0 +1,223 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from .chatbot_routes import chat_pipeline, log_answer, rate_limiter, record_exchange, session_store
+from .event_log import event_log
+from .circuit_breaker import CircuitOpenError
+from .main import auth
+from .metrics import metrics
+from .load_shedder import Overloaded, load_shedder
+from .rate_limiter import RateLimitExceeded
+
+# Seconds a new connection has to send its auth message
+WS_AUTH_TIMEOUT = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+# Seconds a client has to send a fresh token once its token expired, before the connection is closed
+WS_REAUTH_GRACE = float(os.getenv("WS_REAUTH_GRACE", "30"))
+WS_MAX_MESSAGE_LENGTH = int(os.getenv("WS_MAX_MESSAGE_LENGTH", "4000"))
+
+CHAT_ROLES = {"etudiant", "enseignant"}
+
+# Application close codes (4000-4999): unauthorized and forbidden, after their HTTP equivalents
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+
+router = APIRouter()
+
+
+class ChatConnection:
+    """
+    One authenticated WebSocket chat connection.
+
+    Protocol (JSON messages):
+        client -> {"type": "auth", "token": ..., "session_id": optional}  first message, and again to refresh the token
+        server -> {"type": "ready", "session_id": ..., "expires_at": ...}
+        client -> {"type": "message", "text": ...}    cancels any reply still being generated; the n-th message
+                                                      of the connection is turn n, and every reply to it carries id n
+        server -> {"type": "start", "id": n, "source": ...}, {"type": "delta", "id": n, "text": ...},
+                  {"type": "end", "id": n, "source": ..., "session_id": ...}
+                  or {"type": "error", "id": n, "code": ..., "detail": ...}
+        client -> {"type": "cancel"}                  server -> {"type": "cancelled", "id": n}
+        server -> {"type": "reauth_required"}         the token expired; send a new auth message
+        server -> {"type": "reauthenticated", "expires_at": ...}   after a token refresh
+        client -> {"type": "ping"}                    server -> {"type": "pong"}
+    """
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.user = None
+        self.session_id: Optional[str] = None
+        self.generation: Optional[asyncio.Task] = None
+        self.turn = 0
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def authenticate(self, token: str) -> Optional[int]:
+        """Verifies a token for this connection. Returns None on success, else the close code to use."""
+        try:
+            # Off the event loop: a JWKS miss or refresh makes a blocking HTTP call to Keycloak
+            user = await asyncio.to_thread(auth.verify, token)
+        except HTTPException:
+            return CLOSE_UNAUTHORIZED
+        if not CHAT_ROLES.intersection(user.roles):
+            return CLOSE_FORBIDDEN
+        if self.user is not None and user.sub != self.user.sub:
+            return CLOSE_FORBIDDEN  # a refresh cannot switch users
+        self.user = user
+        return None
+
+    def token_expired(self) -> bool:
+        return self.user.exp <= time.time()
+
+    async def watch_expiry(self) -> None:
+        """Asks for a fresh token when the current one expires, and closes the connection if none comes."""
+        try:
+            while True:
+                await asyncio.sleep(max(0.0, self.user.exp - time.time()))
+                if not self.token_expired():
+                    continue  # refreshed meanwhile
+                await self.send({"type": "reauth_required"})
+                await asyncio.sleep(WS_REAUTH_GRACE)
+                if self.token_expired():
+                    await self.cancel_generation()
+                    await self.websocket.close(code=CLOSE_UNAUTHORIZED, reason="Token expired")
+                    return
+        except (RuntimeError, WebSocketDisconnect):
+            pass  # connection closed by the client meanwhile
+
+    async def cancel_generation(self) -> None:
+        task, self.generation = self.generation, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def run_turn(self, turn_id: int, text: str) -> None:
+        sub = self.user.sub
+        source = None
+        parts = []
+        started = time.perf_counter()
+        try:
+            await rate_limiter.acquire("chat", sub)
+            summary, history = await session_store.snapshot(sub, self.session_id)
+            # WebSocket turns bypass the HTTP middleware; counted here so the shedder sees their load
+            with load_shedder.ws_turn():
+                async for piece_source, piece in chat_pipeline.answer_stream(text, history, summary, user_key=sub):
+                    if source is None:
+                        source = piece_source
+                        await self.send({"type": "start", "id": turn_id, "source": source})
+                    parts.append(piece)
+                    await self.send({"type": "delta", "id": turn_id, "text": piece})
+            response = "".join(parts)
+            if response:
+                log_answer("ws", sub, self.session_id, text, source, response, bool(history or summary), started)
+                await record_exchange(sub, self.session_id, text, response)
+            await self.send({"type": "end", "id": turn_id, "source": source, "session_id": self.session_id})
+        except asyncio.CancelledError:
+            metrics.inc("ws_generations_cancelled_total")
+            try:
+                await self.send({"type": "cancelled", "id": turn_id})
+            except Exception:
+                pass  # the socket is already gone
+            raise
+        except RateLimitExceeded as e:
+            await self.send({"type": "error", "id": turn_id, "code": "rate_limited",
+                             "detail": "Too many requests, please slow down.", "retry_after": e.retry_after})
+        except Overloaded as e:
+            await self.send({"type": "error", "id": turn_id, "code": "overloaded",
+                             "detail": "The chatbot is overloaded, please retry shortly.", "retry_after": e.retry_after})
+        except CircuitOpenError as e:
+            await self.send({"type": "error", "id": turn_id, "code": "ai_unavailable",
+                             "detail": "The AI service is temporarily unavailable.", "retry_after": e.retry_after})
+        except Exception as e:
+            event_log.emit("chat.error", level="error", channel="ws", sub=sub, message=text,
+                           detail=f"WebSocket chat error: {str(e)}")
+            await self.send({"type": "error", "id": turn_id, "code": "internal",
+                             "detail": "An internal error occurred in the chatbot."})
+
+    async def handle(self, data: Dict[str, Any]) -> None:
+        kind = data.get("type")
+        if kind == "auth":
+            close_code = await self.authenticate(str(data.get("token", "")))
+            if close_code is not None:
+                await self.cancel_generation()
+                await self.websocket.close(code=close_code)
+                raise WebSocketDisconnect(close_code)
+            await self.send({"type": "reauthenticated", "expires_at": self.user.exp})
+        elif kind == "message":
+            # Numbered before validation so client and server count turns the same way
+            self.turn += 1
+            text = data.get("text")
+            if not isinstance(text, str) or not text.strip() or len(text) > WS_MAX_MESSAGE_LENGTH:
+                await self.send({"type": "error", "id": self.turn, "code": "invalid_message",
+                                 "detail": "Empty or too long message."})
+                return
+            if self.token_expired():
+                await self.send({"type": "error", "id": self.turn, "code": "token_expired",
+                                 "detail": "Send a new auth message first."})
+                return
+            # A new question replaces the one still being answered
+            await self.cancel_generation()
+            self.generation = asyncio.create_task(self.run_turn(self.turn, text))
+        elif kind == "cancel":
+            await self.cancel_generation()
+        elif kind == "ping":
+            await self.send({"type": "pong"})
+        else:
+            await self.send({"type": "error", "code": "unknown_type", "detail": f"Unknown message type: {kind}"})
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    await websocket.accept()
+    if not hasattr(auth, "verify"):
+        # fastapi_keycloak has no in-process verification to reuse here
+        await websocket.close(code=CLOSE_FORBIDDEN, reason="WebSocket chat requires AUTH_MODE=local")
+        return
+
+    connection = ChatConnection(websocket)
+    try:
+        first = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT)
+    except (asyncio.TimeoutError, ValueError, WebSocketDisconnect):
+        await _close_quietly(websocket, CLOSE_UNAUTHORIZED)
+        return
+    close_code = CLOSE_UNAUTHORIZED
+    if first.get("type") == "auth":
+        close_code = await connection.authenticate(str(first.get("token", "")))
+    if close_code is not None:
+        await _close_quietly(websocket, close_code)
+        return
+
+    connection.session_id = str(first.get("session_id") or uuid.uuid4().hex)[:64]
+    await connection.send({"type": "ready", "session_id": connection.session_id, "expires_at": connection.user.exp})
+    metrics.inc("ws_connections_total")
+    watchdog = asyncio.create_task(connection.watch_expiry())
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except ValueError:
+                await connection.send({"type": "error", "code": "invalid_json", "detail": "Messages must be JSON."})
+                continue
+            await connection.handle(data)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watchdog.cancel()
+        # Closing the tab stops the generation instead of letting Ollama finish for nobody
+        await connection.cancel_generation()
+
+
+async def _close_quietly(websocket: WebSocket, code: int) -> None:
+    try:
+        await websocket.close(code=code)
+    except Exception:
+        pass
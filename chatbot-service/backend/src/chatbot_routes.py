@@ -1,55 +1,284 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import os
+import time
+import uuid
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, constr
-from typing import Optional # Kept for now, might be used by RulesManager or other parts
+from typing import Any, Dict, Optional # Kept for now, might be used by RulesManager or other parts
 
-from .main import keycloak # Assuming keycloak is initialized in main
-from fastapi_keycloak import OIDCUser
-from .ollama import generate_response
+from .main import auth # LocalJWTVerifier or FastAPIKeycloak, depending on AUTH_MODE
+from .local_auth import AuthenticatedUser
 from .rules_manager import RulesManager # Assuming RulesManager class exists
+from .retriever import create_retriever
+from .reranker import CrossEncoderReranker
+from .answer_cache import AnswerCache
+from .chat_pipeline import ChatPipeline
+from .precomputed_answers import PrecomputedAnswers
+from .circuit_breaker import CircuitOpenError
+from .session_store import SessionStore
+from .ollama import summarize_conversation
+from .prompt_builder import get_prompt_builder
+from .model_warmer import model_warmer
+from .rate_limiter import RateLimitExceeded, create_rate_limiter, retry_after_header
+from .job_manager import Job, JobFailed, JobManager, JobQueueFull
+from .load_shedder import Overloaded, load_shedder
+from .profiler import PROFILE_DEFAULT_INTERVAL_MS, ProfilerBusy, RequestFilter, profiler_controller
+from .event_log import event_log, frequent_answers
+from .answer_cache import ANSWER_CACHE_TTL
+from .metrics import metrics
 
-# Initialize router and RulesManager
+# Initialize router, RulesManager, the hybrid (BM25 + vector) retriever, the optional re-ranker,
+# the answer cache, the answers generated off-peak, and the pipeline that runs them concurrently
 router = APIRouter()
 rules_manager = RulesManager() # Or however it's supposed to be initialized
+retriever = create_retriever()
+reranker = CrossEncoderReranker()
+answer_cache = AnswerCache()
+rate_limiter = create_rate_limiter()
+precomputed_answers = PrecomputedAnswers()
+chat_pipeline = ChatPipeline(rules_manager, answer_cache, retriever, reranker, rate_limiter, load_shedder,
+                             precomputed_answers)
+session_store = SessionStore()
+# Background summarization tasks, referenced so they are not garbage-collected mid-run
+_background_tasks = set()
+
+async def record_exchange(sub: str, session_id: str, message: str, response: str) -> None:
+    """Records the exchange, then folds old turns into the summary without delaying the response."""
+    await session_store.append_exchange(sub, session_id, message, response)
+    task = asyncio.create_task(
+        session_store.compact(sub, session_id, get_prompt_builder().tokenizer.count, summarize_conversation)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+# Fill the answer cache at startup with the most frequent answers of the event log
+EVENT_LOG_WARM_CACHE = os.getenv("EVENT_LOG_WARM_CACHE", "true").lower() == "true"
+
+def log_answer(channel: str, sub: str, session_id: str, message: str, source: str, response: str,
+               in_conversation: bool, started: float) -> None:
+    """Records an answered message; these events feed cache warming and offline evaluation."""
+    event_log.emit("chat.answer", channel=channel, sub=sub, session_id=session_id, message=message,
+                   source=source, response=response, in_conversation=in_conversation,
+                   latency_ms=round((time.perf_counter() - started) * 1000.0, 1))
+
+def warm_answer_cache() -> int:
+    """
+    Loads the most frequent recent standalone AI answers from the event log into the answer cache.
+    Only answers younger than the cache TTL are used, and each expires when it would have. Returns the count.
+    """
+    now = time.time()
+    loaded = 0
+    for event in frequent_answers(event_log.read(["chat.answer"], since=now - ANSWER_CACHE_TTL),
+                                  limit=answer_cache.max_entries):
+        answer_cache.set(event["message"], event["response"], ttl_seconds=ANSWER_CACHE_TTL - (now - event["ts"]))
+        loaded += 1
+    return loaded
+
+# Background jobs get far more time and room than an interactive request
+JOB_GENERATION_TIMEOUT = float(os.getenv("JOB_GENERATION_TIMEOUT", "300"))
+JOB_NUM_PREDICT = int(os.getenv("JOB_NUM_PREDICT", "1024"))
+
+async def run_chat_job(job: Job) -> Dict[str, Any]:
+    """Answers a queued message like /chat, but with the longer job timeout and generation cap."""
+    started = time.perf_counter()
+    summary, history = await session_store.snapshot(job.sub, job.session_id)
+    generation = {"timeout": JOB_GENERATION_TIMEOUT, "num_predict": JOB_NUM_PREDICT}
+    try:
+        # Queued jobs are already bounded by the worker pool; shedding applies when they are submitted
+        result = await chat_pipeline.answer(job.message, history, summary, user_key=job.sub, generation=generation,
+                                            sheddable=False)
+    except RateLimitExceeded as e:
+        raise JobFailed("rate_limited", "Too many requests, please slow down.", e.retry_after)
+    except CircuitOpenError as e:
+        raise JobFailed("ai_unavailable", "The AI service is temporarily unavailable.", e.retry_after)
+    if result.response is None:
+        raise JobFailed("internal", "AI service returned an unexpected response.")
+    log_answer("job", job.sub, job.session_id, job.message, result.source, result.response,
+               bool(history or summary), started)
+    await record_exchange(job.sub, job.session_id, job.message, result.response)
+    return {"response": result.response, "source": result.source}
+
+job_manager = JobManager(run_chat_job)
 
 # Request and Response Models
 class ChatRequest(BaseModel):
     message: constr
+    session_id: Optional[constr(max_length=64)] = None  # omitted: a new conversation is started
 
 class ChatResponse(BaseModel):
     response: str
-    source: str  # 'rule' or 'ai'
+    source: str  # 'rule', 'cache', 'precomputed', 'ai' or 'degraded'
+    session_id: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str  # 'queued', 'running', 'done' or 'failed'
+    session_id: str
+    response: Optional[str] = None  # set once done
+    source: Optional[str] = None
+    error: Optional[Dict[str, Any]] = None  # set once failed: code, detail and possibly retry_after
+
+def job_status(job: Job) -> JobStatusResponse:
+    return JobStatusResponse(job_id=job.id, status=job.status, session_id=job.session_id,
+                             error=job.error, **(job.result or {}))
 
 # Endpoints
 @router.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return metrics.render_prometheus()
+
+@router.get("/rules/snapshot")
+async def rules_snapshot(if_none_match: Optional[str] = Header(None)):
+    # Public and cacheable: the frontend answers FAQ questions locally and only sends misses to /chat
+    snapshot = rules_manager.snapshot()
+    etag = f'"{snapshot["version"]}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300, must-revalidate"}
+    if if_none_match and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(snapshot, headers=headers)
+
+@router.get("/ollama/status")
+async def ollama_status():
+    # Which models Ollama currently holds in memory, and whether ours is one of them
+    return await asyncio.to_thread(model_warmer.status)
+
+def profile_response(profiler, **headers) -> PlainTextResponse:
+    # Collapsed stacks: feed to flamegraph.pl or inferno-flamegraph, or open in speedscope
+    headers = {f"X-Profile-{name.capitalize()}": str(value) for name, value in headers.items()}
+    headers["X-Profile-Samples"] = str(profiler.samples)
+    return PlainTextResponse(profiler.collapsed(), headers=headers)
+
+@router.get("/admin/profile", response_class=PlainTextResponse)
+async def profile_process(
+    seconds: float = Query(10, gt=0, description="Sampling duration, capped by PROFILE_MAX_SECONDS."),
+    interval_ms: float = Query(PROFILE_DEFAULT_INTERVAL_MS, ge=1, le=1000),
+    include_idle: bool = Query(False, description="Keep stacks of threads waiting for work."),
+    user: AuthenticatedUser = Depends(auth.get_current_user(roles=["admin"]))
+):
+    # Samples every thread of this worker process for a while, whatever it is doing
+    event_log.emit("admin.profile", sub=user.sub, mode="duration", seconds=seconds)
+    try:
+        profiler = await profiler_controller.profile_for(seconds, interval_ms / 1000.0, include_idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profile_response(profiler)
+
+@router.get("/admin/profile/requests", response_class=PlainTextResponse)
+async def profile_requests(
+    count: int = Query(10, ge=1, le=1000, description="Number of matching requests to profile."),
+    path: str = Query("/chat", description="Path prefix the requests must match."),
+    method: Optional[str] = Query(None, description="HTTP method the requests must use, e.g. POST."),
+    timeout: float = Query(60, gt=0, description="Seconds to wait for them, capped by PROFILE_MAX_SECONDS."),
+    interval_ms: float = Query(PROFILE_DEFAULT_INTERVAL_MS, ge=1, le=1000),
+    include_idle: bool = Query(False),
+    user: AuthenticatedUser = Depends(auth.get_current_user(roles=["admin"]))
+):
+    # Samples only while one of the next `count` matching requests is being handled
+    event_log.emit("admin.profile", sub=user.sub, mode="requests", count=count, path=path, method=method)
+    request_filter = RequestFilter(count, path, method)
+    try:
+        profiler = await profiler_controller.profile_requests(request_filter, timeout, interval_ms / 1000.0,
+                                                              include_idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profile_response(profiler, requests=request_filter.matched)
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    user: OIDCUser = Depends(keycloak.get_current_user(roles=["etudiant", "enseignant"])) # Keycloak security
+    user: AuthenticatedUser = Depends(auth.get_current_user(roles=["etudiant", "enseignant"])) # Keycloak security
 ):
-    # Basic logging (FastAPI will also log requests)
-    print(f"User {user.email} (roles: {user.roles}) sent message: {request.message}")
+    started = time.perf_counter()
     try:
-        # 1. Try rule-based response
-        rule_response = rules_manager.find_matching_rule(request.message)
-        if rule_response:
-            print(f"Rule matched for: {request.message}")
-            return ChatResponse(response=rule_response, source="rule")
-
-        # 2. If no rule, use AI
-        print(f"No rule matched for: {request.message}. Forwarding to AI.")
-        ai_response = generate_response(request.message) # From ollama.py
-        if ai_response is None:
+        # Every message spends from the user's chat budget; AI generations also from the smaller AI budget
+        await rate_limiter.acquire("chat", user.sub)
+        # Rule matching, answer-cache lookup and retrieval run concurrently;
+        # a rule or cache hit answers immediately, otherwise the AI answers from the retrieved chunks
+        session_id = request.session_id or uuid.uuid4().hex
+        summary, history = await session_store.snapshot(user.sub, session_id)
+        result = await chat_pipeline.answer(request.message, history, summary, user_key=user.sub)
+        if result.response is None:
             # Handle case where ollama.py might return None if response key is missing
             raise HTTPException(status_code=500, detail="AI service returned an unexpected response.")
-        return ChatResponse(response=ai_response, source="ai")
+
+        log_answer("http", user.sub, session_id, request.message, result.source, result.response,
+                   bool(history or summary), started)
+        await record_exchange(user.sub, session_id, request.message, result.response)
+        return ChatResponse(response=result.response, source=result.source, session_id=session_id)
 
     except HTTPException as e:
         # Re-raise HTTPExceptions directly
         raise e
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please slow down.",
+            headers=retry_after_header(e),
+        )
+    except Overloaded as e:
+        # Rule and cache answers are still served; only messages needing the AI are refused
+        raise HTTPException(
+            status_code=503,
+            detail="The chatbot is overloaded, please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except CircuitOpenError as e:
+        # AI service known to be down and nothing to fall back on: fail fast instead of waiting for a timeout
+        raise HTTPException(
+            status_code=503,
+            detail="The AI service is temporarily unavailable.",
+            headers={"Retry-After": str(max(1, int(e.retry_after)))},
+        )
     except Exception as e:
-        print(f"[ERROR] Chat endpoint error: {str(e)}") # Server-side log
+        event_log.emit("chat.error", level="error", channel="http", sub=user.sub, message=request.message,
+                       detail=f"Chat endpoint error: {str(e)}")
         # Provide a generic error message to the client
-        raise HTTPException(status_code=500, detail="An internal error occurred in the chatbot.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="An internal error occurred in the chatbot.")
+
+@router.delete("/chat/sessions/{session_id}")
+async def delete_session(
+    session_id: str,
+    user: AuthenticatedUser = Depends(auth.get_current_user(roles=["etudiant", "enseignant"]))
+):
+    if not await session_store.delete(user.sub, session_id):
+        raise HTTPException(status_code=404, detail="Session not found.")
+    return {"status": "deleted"}
+
+@router.post("/chat/jobs", response_model=JobStatusResponse, response_model_exclude_none=True, status_code=202)
+async def submit_chat_job(
+    request: ChatRequest,
+    user: AuthenticatedUser = Depends(auth.get_current_user(roles=["etudiant", "enseignant"]))
+):
+    # For answers that may take longer than the HTTP timeout: returns a job id at once, the answer is
+    # generated in the background and fetched with GET /chat/jobs/{job_id}
+    # Without a session id the job starts a new session, reused if the same question is resubmitted
+    if job_manager.find(user.sub, request.session_id, request.message) is None:
+        # Resubmitting the same question attaches to the existing job and costs nothing
+        try:
+            await rate_limiter.acquire("chat", user.sub)
+        except RateLimitExceeded as e:
+            raise HTTPException(status_code=429, detail="Too many requests, please slow down.",
+                                headers=retry_after_header(e))
+    try:
+        job, _ = job_manager.submit(user.sub, request.session_id, request.message)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending questions, please retry shortly.",
+                            headers={"Retry-After": "10"})
+    return job_status(job)
+
+@router.get("/chat/jobs/{job_id}", response_model=JobStatusResponse, response_model_exclude_none=True)
+async def get_chat_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to wait for the job to finish (long-polling)."),
+    user: AuthenticatedUser = Depends(auth.get_current_user(roles=["etudiant", "enseignant"]))
+):
+    job = job_manager.get(user.sub, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job_status(await job_manager.wait(job, wait))
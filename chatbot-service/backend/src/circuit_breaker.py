@@ -0,0 +1,107 @@
+import threading
+import time
+
+from .event_log import event_log
+from .metrics import metrics
+
+STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker.
+
+    - closed: calls go through; consecutive failures are counted.
+    - open: calls fail fast with CircuitOpenError until recovery_timeout has elapsed.
+    - half_open: a limited number of probe calls go through; a success closes the
+      circuit, a failure opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max_calls: int = 1):
+        """
+        Args:
+            name (str): Name used in errors and as the "breaker" metrics label.
+            failure_threshold (int): Consecutive failures that open the circuit.
+            recovery_timeout (float): Seconds to stay open before probing again.
+            half_open_max_calls (int): Concurrent probe calls allowed while half-open.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+        metrics.set_gauge("circuit_breaker_state", STATE_VALUES[self._state], breaker=self.name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _transition(self, new_state: str) -> None:
+        if new_state == self._state:
+            return
+        # Runs under the breaker lock: emit only appends to the event buffer, it never does I/O
+        event_log.emit("circuit_breaker.transition", level="warn", breaker=self.name, from_state=self._state,
+                       to_state=new_state, detail=f"Circuit '{self.name}': {self._state} -> {new_state}")
+        metrics.inc("circuit_breaker_transitions_total", breaker=self.name, from_state=self._state, to_state=new_state)
+        metrics.set_gauge("circuit_breaker_state", STATE_VALUES[new_state], breaker=self.name)
+        self._state = new_state
+        if new_state == self.OPEN:
+            self._opened_at = time.monotonic()
+        if new_state != self.HALF_OPEN:
+            self._probes_in_flight = 0
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._transition(self.HALF_OPEN)
+
+    def before_call(self) -> None:
+        """
+        Must be called before each protected call.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with all probe slots taken.
+        """
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return
+            retry_after = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+        metrics.inc("circuit_breaker_rejected_total", breaker=self.name)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._transition(self.CLOSED)
+
+    def record_cancelled(self) -> None:
+        """A call abandoned by its caller says nothing about the dependency; frees its probe slot."""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._transition(self.OPEN)
@@ -0,0 +1,126 @@
+import os
+import re
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Estimated Jaccard similarity of word shingles above which two chunks are the same content
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))
+# LSH bands; NUM_PERM / BANDS rows per band. 8 bands of 8 rows put the detection threshold near 0.77.
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "8"))
+DEDUP_SHINGLE_WORDS = int(os.getenv("DEDUP_SHINGLE_WORDS", "3"))
+# Representatives kept in the LSH index; the oldest are forgotten beyond that, bounding memory on large corpora.
+DEDUP_MAX_TRACKED = int(os.getenv("DEDUP_MAX_TRACKED", "100000"))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text: str, size: int = DEDUP_SHINGLE_WORDS) -> Set[str]:
+    """Word n-grams of the lowercased text without punctuation; a shorter text is a single shingle."""
+    words = re.sub(r"[^\w\s]", " ", text.lower()).split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures: num_perm random hash permutations, each keeping its minimum over the shingles."""
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a * h + b stays below 2**64 for 32-bit shingle hashes, so uint64 arithmetic is exact before the modulo
+        self.a = rng.integers(1, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _MAX_HASH, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles(text)), dtype=np.uint64)
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % np.uint64(_MERSENNE_PRIME) & np.uint64(_MAX_HASH)
+        return permuted.min(axis=1)
+
+
+class NearDuplicateIndex:
+    """
+    Streaming near-duplicate detection with MinHash LSH.
+
+    Chunks are offered one at a time; each is either new (and becomes a representative) or a near
+    duplicate of a representative seen before. Only signatures of at most max_tracked representatives
+    are kept, so memory stays bounded whatever the corpus size; a duplicate of an evicted
+    representative is then treated as new.
+    """
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = DEDUP_NUM_PERM,
+                 bands: int = DEDUP_BANDS, max_tracked: int = DEDUP_MAX_TRACKED):
+        """
+        Args:
+            threshold (float): Minimum estimated Jaccard similarity to call two chunks duplicates.
+            num_perm (int): MinHash permutations; must be a multiple of bands.
+            bands (int): LSH bands; more bands find more candidates at lower similarity.
+            max_tracked (int): Representatives kept in the index.
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_tracked = max_tracked
+        self.hasher = MinHasher(num_perm)
+        self._signatures: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, bytes], List[str]] = {}
+        self.seen = 0
+        self.duplicates = 0
+        self.duplicate_chars = 0
+        self.evicted = 0
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def _forget_oldest(self) -> None:
+        key, signature = self._signatures.popitem(last=False)
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.remove(key)
+                if not bucket:
+                    del self._buckets[band_key]
+        self.evicted += 1
+
+    def add(self, key: str, text: str) -> Optional[str]:
+        """
+        Offers a chunk.
+
+        Args:
+            key (str): Identifier of the chunk, returned for later duplicates of it.
+            text (str): The chunk text.
+
+        Returns:
+            Optional[str]: Key of the representative this chunk duplicates, or None if it is new
+            (it then becomes a representative itself).
+        """
+        self.seen += 1
+        signature = self.hasher.signature(text)
+        band_keys = self._band_keys(signature)
+        candidates = {candidate for band_key in band_keys for candidate in self._buckets.get(band_key, ())}
+        best, best_similarity = None, 0.0
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None and best_similarity >= self.threshold:
+            self.duplicates += 1
+            self.duplicate_chars += len(text)
+            return best
+
+        self._signatures[key] = signature
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(key)
+        if len(self._signatures) > self.max_tracked:
+            self._forget_oldest()
+        return None
+
+    def report(self) -> str:
+        removed = self.duplicates / self.seen * 100 if self.seen else 0.0
+        return (f"Dedup: {self.seen} chunks, {self.duplicates} near duplicates removed ({removed:.1f}%, "
+                f"{self.duplicate_chars} characters not embedded), {self.seen - self.duplicates} unique"
+                + (f", {self.evicted} representatives evicted from the index" if self.evicted else "") + ".")
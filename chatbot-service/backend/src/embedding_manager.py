@@ -65,6 +65,37 @@ class EmbeddingManager:
             print(f"Error generating embedding for text '{text[:100]}...': {e}")
             return None
 
+    def generate_embeddings(self, texts: List[str], batch_size: int = 32) -> Optional[np.ndarray]:
+        """
+        Generates embeddings for a batch of texts in a single model call.
+
+        Args:
+            texts (List[str]): The input texts to embed.
+            batch_size (int): Batch size handed to the underlying model.
+
+        Returns:
+            Optional[np.ndarray]: A float32 array of shape (len(texts), dimension),
+            or None if the model is not loaded or an error occurs.
+        """
+        if not self.model:
+            print("Embedding model not loaded. Cannot generate embeddings.")
+            return None
+
+        if not texts:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+
+        try:
+            embeddings = self.model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            return np.ascontiguousarray(embeddings, dtype=np.float32)
+        except Exception as e:
+            print(f"Error generating embeddings for a batch of {len(texts)} texts: {e}")
+            return None
+
 if __name__ == '__main__':
     # This block provides example usage and allows for quick testing when the script is run directly.
     print("----- Testing EmbeddingManager -----")
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# --- Configuration ---
+# When EMBEDDING_SERVER_SOCKET is set, API workers talk to a shared embedding server
+# over this Unix domain socket instead of loading their own copy of the model.
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", "")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# --- Wire protocol ---
+# Request:  header (op: u8, count: u32), then `count` texts as (length: u32, utf-8 bytes).
+# Response: header (status: u8, count: u32, dim: u32), then the payload:
+#   - OP_ENCODE + STATUS_OK: count * dim little-endian float32 values (row-major).
+#   - OP_INFO + STATUS_OK:   `count` bytes of utf-8 model name.
+#   - STATUS_ERROR:          `count` bytes of utf-8 error message.
+OP_ENCODE = 1
+OP_INFO = 2
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+REQUEST_HEADER = struct.Struct("!BI")
+RESPONSE_HEADER = struct.Struct("!BII")
+LENGTH_PREFIX = struct.Struct("!I")
+FLOAT32_LE = np.dtype("<f4")
+
+MAX_TEXTS_PER_REQUEST = 1024
+MAX_TEXT_BYTES = 64 * 1024
+
+
+class EmbeddingServer:
+    """
+    Owns a single EmbeddingManager and serves encode requests from many local
+    clients over a Unix domain socket, batching texts across connections.
+    """
+    def __init__(self, socket_path: str, model_name: str = EMBEDDING_MODEL, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        """
+        Initializes the server and loads the embedding model.
+
+        Args:
+            socket_path (str): Filesystem path of the Unix domain socket to listen on.
+            model_name (str): The sentence-transformer model to load.
+            max_batch_size (int): Maximum number of texts encoded in one model call.
+            max_wait_ms (float): How long to wait for more requests before running a partial batch.
+        """
+        EmbeddingManager = _embedding_manager_class()
+        self.socket_path = socket_path
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.embedding_manager = EmbeddingManager(model_name=model_name)
+        self._queue: Optional[asyncio.Queue] = None
+        # A single thread keeps model calls serialized; batching provides the throughput.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+
+    async def serve_forever(self) -> None:
+        """Starts listening on the socket and runs the batching loop until cancelled."""
+        if not self.embedding_manager.model or self.embedding_manager.dimension is None:
+            raise RuntimeError(f"Embedding model '{self.embedding_manager.model_name}' failed to load.")
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self._queue = asyncio.Queue()
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        batcher = asyncio.create_task(self._batch_loop())
+        print(f"Embedding server listening on {self.socket_path} (model: {self.embedding_manager.model_name}, dim: {self.embedding_manager.dimension}).")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._executor.shutdown(wait=False)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves requests from one client connection until it is closed."""
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(REQUEST_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                op, count = REQUEST_HEADER.unpack(header)
+
+                if op == OP_INFO:
+                    name = self.embedding_manager.model_name.encode("utf-8")
+                    writer.write(RESPONSE_HEADER.pack(STATUS_OK, len(name), self.embedding_manager.dimension) + name)
+                elif op == OP_ENCODE:
+                    if count > MAX_TEXTS_PER_REQUEST:
+                        self._write_error(writer, f"Too many texts in one request ({count} > {MAX_TEXTS_PER_REQUEST}).")
+                        break
+                    texts = await self._read_texts(reader, count)
+                    if texts is None:
+                        self._write_error(writer, f"Text exceeds {MAX_TEXT_BYTES} bytes.")
+                        break
+                    future = asyncio.get_running_loop().create_future()
+                    await self._queue.put((texts, future))
+                    try:
+                        embeddings: np.ndarray = await future
+                    except Exception as e:
+                        self._write_error(writer, f"Encoding failed: {e}")
+                    else:
+                        writer.write(RESPONSE_HEADER.pack(STATUS_OK, embeddings.shape[0], embeddings.shape[1]))
+                        writer.write(embeddings.astype(FLOAT32_LE, copy=False).tobytes())
+                else:
+                    self._write_error(writer, f"Unknown op code {op}.")
+                    break
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_texts(self, reader: asyncio.StreamReader, count: int) -> Optional[List[str]]:
+        texts: List[str] = []
+        for _ in range(count):
+            (length,) = LENGTH_PREFIX.unpack(await reader.readexactly(LENGTH_PREFIX.size))
+            if length > MAX_TEXT_BYTES:
+                return None
+            texts.append((await reader.readexactly(length)).decode("utf-8", errors="replace"))
+        return texts
+
+    @staticmethod
+    def _write_error(writer: asyncio.StreamWriter, message: str) -> None:
+        encoded = message.encode("utf-8")
+        writer.write(RESPONSE_HEADER.pack(STATUS_ERROR, len(encoded), 0) + encoded)
+
+    async def _batch_loop(self) -> None:
+        """Collects pending requests from all connections and encodes them together."""
+        loop = asyncio.get_running_loop()
+        while True:
+            pending: List[Tuple[List[str], asyncio.Future]] = [await self._queue.get()]
+            total = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while total < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                total += len(item[0])
+
+            all_texts = [text for texts, _ in pending for text in texts]
+            embeddings = None
+            if all_texts:
+                embeddings = await loop.run_in_executor(self._executor, self.embedding_manager.generate_embeddings, all_texts, self.max_batch_size)
+
+            offset = 0
+            for texts, future in pending:
+                start, offset = offset, offset + len(texts)
+                if future.done():
+                    continue
+                if not texts:
+                    future.set_result(np.empty((0, self.embedding_manager.dimension), dtype=FLOAT32_LE))
+                elif embeddings is None:
+                    future.set_exception(RuntimeError("model returned no embeddings"))
+                else:
+                    future.set_result(embeddings[start:offset])
+
+
+class EmbeddingClient:
+    """
+    Thin client for EmbeddingServer. Exposes the same generate_embedding(s) methods
+    as EmbeddingManager without importing torch or sentence-transformers.
+    """
+    def __init__(self, socket_path: str = EMBEDDING_SERVER_SOCKET, timeout: float = 10.0):
+        """
+        Initializes the client and fetches the model name and dimension from the server.
+
+        Args:
+            socket_path (str): Path of the embedding server's Unix domain socket.
+            timeout (float): Socket timeout in seconds for each request.
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.model_name: Optional[str] = None
+        self.dimension: Optional[int] = None
+        self._sock: Optional[socket.socket] = None
+        self._response_started = False
+        self._lock = threading.Lock()
+
+        try:
+            with self._lock:
+                status, count, dim, payload = self._request(REQUEST_HEADER.pack(OP_INFO, 0), expect_vectors=False)
+            if status == STATUS_OK:
+                self.model_name = bytes(payload).decode("utf-8")
+                self.dimension = dim
+                print(f"Connected to embedding server at {self.socket_path} (model: {self.model_name}, dim: {self.dimension}).")
+        except OSError as e:
+            print(f"Error connecting to embedding server at {self.socket_path}: {e}")
+
+    def generate_embeddings(self, texts: List[str], batch_size: int = 32) -> Optional[np.ndarray]:
+        """
+        Encodes texts on the server, in requests of at most MAX_TEXTS_PER_REQUEST texts.
+
+        Args:
+            texts (List[str]): The input texts to embed.
+            batch_size (int): Accepted for EmbeddingManager compatibility; the server batches on its own.
+
+        Returns:
+            Optional[np.ndarray]: A float32 array of shape (len(texts), dimension), or None if an error occurs.
+            A single request's array is read-only, backed directly by the received buffer.
+        """
+        if len(texts) <= MAX_TEXTS_PER_REQUEST:
+            return self._encode(texts)
+        parts = []
+        for start in range(0, len(texts), MAX_TEXTS_PER_REQUEST):
+            embeddings = self._encode(texts[start:start + MAX_TEXTS_PER_REQUEST])
+            if embeddings is None:
+                return None
+            parts.append(embeddings)
+        return np.concatenate(parts)
+
+    def _encode(self, texts: List[str]) -> Optional[np.ndarray]:
+        """One OP_ENCODE request; the server refuses more than MAX_TEXTS_PER_REQUEST texts."""
+        parts = [REQUEST_HEADER.pack(OP_ENCODE, len(texts))]
+        for text in texts:
+            encoded = text.encode("utf-8")
+            parts.append(LENGTH_PREFIX.pack(len(encoded)))
+            parts.append(encoded)
+
+        try:
+            with self._lock:
+                status, count, dim, payload = self._request(b"".join(parts), expect_vectors=True)
+        except OSError as e:
+            print(f"Error calling embedding server at {self.socket_path}: {e}")
+            return None
+
+        if status != STATUS_OK:
+            print(f"Embedding server error: {bytes(payload).decode('utf-8', errors='replace')}")
+            return None
+        return np.frombuffer(payload, dtype=FLOAT32_LE).reshape(count, dim)
+
+    def generate_embedding(self, text: str) -> Optional[List[float]]:
+        """
+        Generates an embedding for a single text, mirroring EmbeddingManager.generate_embedding.
+
+        Returns:
+            Optional[List[float]]: The embedding as a list of floats, or None on error.
+        """
+        if not isinstance(text, str):
+            print(f"Invalid input type for embedding. Expected str, got {type(text)}.")
+            return None
+        embeddings = self.generate_embeddings([text])
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        return embeddings[0].tolist()
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+    def _request(self, message: bytes, expect_vectors: bool) -> Tuple[int, int, int, bytearray]:
+        """
+        Sends one request and reads the response, reconnecting once on a stale connection: one reset or
+        closed before any byte of the response arrived. A timeout is not retried, as the server is
+        still encoding the request and sending it again would only double its load.
+        """
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self._sock.settimeout(self.timeout)
+                    self._sock.connect(self.socket_path)
+                self._response_started = False
+                self._sock.sendall(message)
+                status, count, dim = RESPONSE_HEADER.unpack(self._recv_exact(RESPONSE_HEADER.size))
+                if status == STATUS_OK and expect_vectors:
+                    payload = self._recv_exact(count * dim * FLOAT32_LE.itemsize)
+                else:
+                    payload = self._recv_exact(count)
+                return status, count, dim, payload
+            except OSError as e:
+                self._disconnect()
+                stale = isinstance(e, (ConnectionResetError, BrokenPipeError)) and not self._response_started
+                if attempt == 1 or not stale:
+                    raise
+        raise OSError("unreachable")
+
+    def _recv_exact(self, size: int) -> bytearray:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            n = self._sock.recv_into(view[received:])
+            if n == 0:
+                raise ConnectionResetError("Embedding server closed the connection.")
+            self._response_started = True
+            received += n
+        return buffer
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+
+def _embedding_manager_class():
+    """
+    EmbeddingManager, imported relatively inside the package or directly when run as a script.
+    An ImportError from its own dependencies (sentence_transformers, torch) is not masked.
+    """
+    if __package__:
+        from .embedding_manager import EmbeddingManager
+    else:
+        from embedding_manager import EmbeddingManager
+    return EmbeddingManager
+
+
+def create_embedder():
+    """
+    Returns an EmbeddingClient when EMBEDDING_SERVER_SOCKET is configured,
+    otherwise a local EmbeddingManager that loads the model in-process.
+    """
+    if EMBEDDING_SERVER_SOCKET:
+        return EmbeddingClient(EMBEDDING_SERVER_SOCKET)
+    print(f"[INFO] EMBEDDING_SERVER_SOCKET is not set; loading '{EMBEDDING_MODEL}' in this process.")
+    return _embedding_manager_class()(model_name=EMBEDDING_MODEL)
+
+
+if __name__ == '__main__':
+    # Run from the backend directory: python -m src.embedding_server --socket /tmp/embedding.sock
+    parser = argparse.ArgumentParser(description="Shared embedding server for API workers.")
+    parser.add_argument("--socket", default=EMBEDDING_SERVER_SOCKET or "/tmp/embedding.sock", help="Unix domain socket path.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Sentence-transformer model name.")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    embedding_server = EmbeddingServer(args.socket, args.model, args.max_batch_size, args.max_wait_ms)
+    try:
+        asyncio.run(embedding_server.serve_forever())
+    except KeyboardInterrupt:
+        print("Embedding server stopped.")
@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .answer_cache import normalize_message
+from .metrics import metrics
+
+# Events file; a .db or .sqlite extension selects SQLite (WAL), anything else rotating JSONL. Empty: not persisted.
+EVENT_LOG_PATH = os.getenv("EVENT_LOG_PATH", "logs/chat_events.jsonl")
+# Events held in memory between flushes; beyond that new events are dropped and counted.
+EVENT_LOG_CAPACITY = int(os.getenv("EVENT_LOG_CAPACITY", "10000"))
+EVENT_LOG_BATCH_SIZE = int(os.getenv("EVENT_LOG_BATCH_SIZE", "500"))
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv("EVENT_LOG_FLUSH_INTERVAL", "1.0"))
+# Longest string kept per field; longer values are cut and the event marked truncated.
+EVENT_LOG_MAX_FIELD_CHARS = int(os.getenv("EVENT_LOG_MAX_FIELD_CHARS", "4000"))
+# JSONL rotation: size of a file before it is rotated, and rotated files kept.
+EVENT_LOG_MAX_BYTES = int(os.getenv("EVENT_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+EVENT_LOG_BACKUPS = int(os.getenv("EVENT_LOG_BACKUPS", "5"))
+# Per-kind sampling rates, e.g. "ollama.request=0.1,chat.answer=1". Unlisted kinds and errors are always kept.
+EVENT_LOG_SAMPLE = os.getenv("EVENT_LOG_SAMPLE", "")
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parses "kind=rate,kind=rate" into a dictionary; malformed entries are ignored."""
+    rates = {}
+    for item in spec.split(","):
+        kind, _, rate = item.partition("=")
+        try:
+            rates[kind.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class JSONLEventWriter:
+    """Appends events to a JSON Lines file, rotating it to .1, .2, ... once it exceeds max_bytes."""
+    def __init__(self, path: str, max_bytes: int = EVENT_LOG_MAX_BYTES, backups: int = EVENT_LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _rotate(self) -> None:
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self, events: List[Dict[str, Any]]) -> None:
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events))
+
+    def read(self, kinds: Optional[Iterable[str]] = None, since: float = 0.0) -> Iterator[Dict[str, Any]]:
+        """Yields the stored events of the given kinds newer than since, oldest file first."""
+        kinds = set(kinds) if kinds else None
+        rotated = sorted(glob.glob(f"{glob.escape(self.path)}.*"), key=lambda p: int(p.rsplit(".", 1)[1]), reverse=True)
+        for path in rotated + [self.path]:
+            # A file last written before since holds only older events
+            if not os.path.exists(path) or os.path.getmtime(path) < since:
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue  # partial line of a crashed write
+                    if event.get("ts", 0) >= since and (kinds is None or event.get("kind") in kinds):
+                        yield event
+
+
+class SQLiteEventWriter:
+    """Stores events in a SQLite table in WAL mode, queryable by kind and time while the service runs."""
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS events (ts REAL NOT NULL, kind TEXT NOT NULL, data TEXT NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS events_kind_ts ON events (kind, ts)")
+        self._db.commit()
+
+    def write(self, events: List[Dict[str, Any]]) -> None:
+        self._db.executemany(
+            "INSERT INTO events (ts, kind, data) VALUES (?, ?, ?)",
+            [(event["ts"], event["kind"], json.dumps(event, ensure_ascii=False)) for event in events],
+        )
+        self._db.commit()
+
+    def read(self, kinds: Optional[Iterable[str]] = None, since: float = 0.0) -> Iterator[Dict[str, Any]]:
+        """Yields the stored events of the given kinds newer than since; filtered by SQLite on the (kind, ts) index."""
+        kinds = sorted(set(kinds)) if kinds else []
+        where, params = "ts >= ?", [since]
+        if kinds:
+            where += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        for (data,) in self._db.execute(f"SELECT data FROM events WHERE {where} ORDER BY ts", params):
+            yield json.loads(data)
+
+
+def create_writer(path: str = EVENT_LOG_PATH):
+    if not path:
+        return None
+    if path.endswith((".db", ".sqlite")):
+        return SQLiteEventWriter(path)
+    return JSONLEventWriter(path)
+
+
+class EventLog:
+    """
+    Structured event pipeline that never blocks the request path.
+
+    emit() only samples, caps and appends the event to an bounded in-memory buffer; a background task
+    drains the buffer in batches and writes them from a worker thread. When the buffer is full the
+    new event is dropped and counted in event_log_dropped_total. Warnings and errors are also echoed
+    to stdout from the writer thread, so they still reach the container logs.
+
+    The writer for path is only created on first use (start, flush or read), so importing the module
+    creates no directory and opens no database.
+    """
+    def __init__(self, writer=None, path: str = "", capacity: int = EVENT_LOG_CAPACITY, batch_size: int = EVENT_LOG_BATCH_SIZE,
+                 flush_interval: float = EVENT_LOG_FLUSH_INTERVAL, max_field_chars: int = EVENT_LOG_MAX_FIELD_CHARS,
+                 sample_rates: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            writer: JSONLEventWriter or SQLiteEventWriter; None to create one from path when first needed.
+            path (str): Events file for the lazily created writer; empty (and no writer) keeps events in memory only.
+            capacity (int): Events buffered between flushes.
+            batch_size (int): Events written per write call.
+            flush_interval (float): Seconds between flushes.
+            max_field_chars (int): Longest string kept per field.
+            sample_rates (Optional[Dict[str, float]]): Fraction of events kept per kind.
+        """
+        self.writer = writer
+        self.path = path
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_field_chars = max_field_chars
+        self.sample_rates = sample_rates if sample_rates is not None else parse_sample_rates(EVENT_LOG_SAMPLE)
+        # deque appends and pops are atomic, so emit() is safe from worker threads without a lock
+        self._buffer: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    def _cap(self, value: Any) -> Tuple[Any, bool]:
+        if isinstance(value, str) and len(value) > self.max_field_chars:
+            return value[:self.max_field_chars], True
+        return value, False
+
+    def emit(self, kind: str, level: str = "info", **fields) -> None:
+        """Records an event. Never blocks and never raises."""
+        if level == "info":
+            rate = self.sample_rates.get(kind, 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                return
+        if len(self._buffer) >= self.capacity:
+            metrics.inc("event_log_dropped_total", kind=kind)
+            return
+        event = {"ts": time.time(), "kind": kind, "level": level}
+        for key, value in fields.items():
+            event[key], truncated = self._cap(value)
+            if truncated:
+                event["truncated"] = True
+        self._buffer.append(event)
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch = []
+        while self._buffer and len(batch) < self.batch_size:
+            batch.append(self._buffer.popleft())
+        return batch
+
+    def _get_writer(self):
+        if self.writer is None and self.path:
+            self.writer = create_writer(self.path)
+        return self.writer
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        for event in batch:
+            if event["level"] != "info":
+                print(f"[{event['level'].upper()}] {event['kind']}: {event.get('detail', '')}")
+        writer = self._get_writer()
+        if writer is not None:
+            writer.write(batch)
+
+    async def flush(self) -> None:
+        """Writes everything buffered so far, batch by batch, off the event loop."""
+        batch = self._drain()
+        while batch:
+            try:
+                await asyncio.to_thread(self._write, batch)
+                metrics.inc("event_log_written_total", len(batch))
+            except Exception as e:
+                print(f"[ERROR] Event log write failed, {len(batch)} events lost: {e}")
+                metrics.inc("event_log_dropped_total", len(batch), kind="write_error")
+            batch = self._drain()
+        metrics.set_gauge("event_log_buffered", len(self._buffer))
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        self._get_writer()
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stops the background task and writes what is still buffered."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+    def read(self, kinds: Optional[Iterable[str]] = None, since: float = 0.0) -> Iterator[Dict[str, Any]]:
+        """Yields persisted events of the given kinds newer than since (epoch seconds), oldest first."""
+        if self.writer is None and not (self.path and os.path.exists(self.path)):
+            return  # nothing persisted yet; do not create an empty log just to read it
+        writer = self._get_writer()
+        if writer is not None:
+            yield from writer.read(kinds, since)
+
+
+def frequent_answers(events: Iterable[Dict[str, Any]], min_count: int = 2, limit: int = 500) -> List[Dict[str, Any]]:
+    """
+    Most frequently asked standalone questions with their latest complete AI answer, for cache warming.
+    Answers given inside a conversation, degraded or truncated are left out.
+    """
+    counts: Dict[str, int] = {}
+    latest: Dict[str, Dict[str, Any]] = {}
+    for event in events:
+        if event.get("in_conversation") or event.get("truncated") or not event.get("message"):
+            continue
+        key = normalize_message(event["message"])
+        counts[key] = counts.get(key, 0) + 1
+        if event.get("source") == "ai" and event.get("response"):
+            latest[key] = event
+    ranked = sorted((key for key in latest if counts[key] >= min_count), key=lambda key: counts[key], reverse=True)
+    return [latest[key] for key in ranked[:limit]]
+
+
+event_log = EventLog(path=EVENT_LOG_PATH)
+
+
+if __name__ == "__main__":
+    # Offline use of the persisted events, e.g. building an evaluation set:
+    #   python -m src.event_log export --kind chat.answer --since-hours 24 > eval.jsonl
+    parser = argparse.ArgumentParser(description="Read the persisted chat events.")
+    parser.add_argument("command", choices=["export", "frequent"])
+    parser.add_argument("--kind", action="append", help="Event kind to keep (repeatable; default: all).")
+    parser.add_argument("--since-hours", type=float, default=0.0)
+    parser.add_argument("--min-count", type=int, default=2)
+    args = parser.parse_args()
+
+    since = time.time() - args.since_hours * 3600 if args.since_hours else 0.0
+    if args.command == "export":
+        for event in event_log.read(args.kind, since):
+            print(json.dumps(event, ensure_ascii=False))
+    else:
+        for event in frequent_answers(event_log.read(["chat.answer"], since), args.min_count):
+            print(json.dumps({"message": event["message"], "response": event["response"]}, ensure_ascii=False))
@@ -1,25 +1,54 @@
+from __future__ import annotations
+
+import argparse
 import json
+import os
 import uuid
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, Iterable, List, Dict, Any, Optional
+
+if TYPE_CHECKING:
+    from .embedding_manager import EmbeddingManager
 
 # Adjust imports if running as a script directly from this directory vs. as part of a larger package
 # When running with `python -m src.ingest_data` from `backend` directory, these should work.
 # If running `python src/ingest_data.py` directly from `backend`, Python might not resolve modules with "."
 # For simplicity in development, ensure PYTHONPATH is set or run as a module.
+# The embedding model stack is only imported by run_ingestion, so importing this module stays cheap
+# (vector_snapshot reuses the helpers below without loading the model).
 try:
-    from .embedding_manager import EmbeddingManager
-    from .vector_db_manager import VectorDBManager
+    from .vector_db_manager import VectorDBManager, index_tuning_from_env
+    from .bm25_index import BM25Index, bm25_index_path, delete_bm25_index
+    from .dedup import NearDuplicateIndex
+    from .vector_compression import (
+        VECTOR_DIMS, VECTOR_REDUCTION, DimensionReducer, ReducerError, delete_reducer, load_reducer,
+        reduction_metadata, save_reducer,
+    )
 except ImportError:
     # Fallback for direct script execution (e.g., python src/ingest_data.py from backend directory)
     # This assumes embedding_manager.py and vector_db_manager.py are in the same directory (src)
     print("Attempting fallback imports for direct script execution.")
-    from embedding_manager import EmbeddingManager
-    from vector_db_manager import VectorDBManager
+    from vector_db_manager import VectorDBManager, index_tuning_from_env
+    from bm25_index import BM25Index, bm25_index_path, delete_bm25_index
+    from dedup import NearDuplicateIndex
+    from vector_compression import (
+        VECTOR_DIMS, VECTOR_REDUCTION, DimensionReducer, ReducerError, delete_reducer, load_reducer,
+        reduction_metadata, save_reducer,
+    )
 
 
 # --- Constants ---
-COLLECTION_NAME = "est_sale_documents_v2" # Added _v2 to distinguish from potential old versions
+# Serving always queries this alias; each reindex builds "<alias>_v<N>" and repoints the alias.
+# An existing "est_sale_documents_v2" collection is adopted as version 2.
+COLLECTION_ALIAS = os.getenv("QDRANT_COLLECTION", "est_sale_documents")
+# How rules become chunks (one chunk per rule answer). Bump when that changes: vector snapshots
+# record it, and importing a snapshot built by another chunker is refused.
+CHUNKER_VERSION = "rule-answer-v1"
+KEEP_COLLECTION_VERSIONS = int(os.getenv("KEEP_COLLECTION_VERSIONS", "2"))
+REINDEX_MIN_RECALL = float(os.getenv("REINDEX_MIN_RECALL", "0.8"))
+REINDEX_RECALL_K = int(os.getenv("REINDEX_RECALL_K", "3"))
+# Collapse near-duplicate chunks (boilerplate repeated across sources) into one point before embedding
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
 # Assuming this script is in 'src' and 'data' is a sibling directory to 'src'
 # Path(__file__).parent = src directory
 # Path(__file__).parent.parent = backend directory
@@ -69,20 +98,125 @@ def load_data_from_rules(file_path: Path) -> List[Dict[str, str]]:
         print(f"An unexpected error occurred while loading {file_path}: {e}")
         return []
 
+def make_point_id(source_file: str, source_question: str, text_chunk: str) -> str:
+    """
+    Derives a stable point ID from a chunk's source, so re-running ingestion
+    replaces existing points (in Qdrant and in the BM25 index) instead of duplicating them.
+    """
+    key = source_question if source_question != "N/A" else text_chunk
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_file}#{key}"))
+
+
+def update_lexical_index(collection_name: str, ids: List[str], payloads: List[Dict[str, Any]], rebuild: bool = False,
+                         removed_ids: Iterable[str] = ()) -> bool:
+    """
+    Adds or replaces the ingested chunks in the BM25 index of a collection version, used for hybrid retrieval.
+
+    Args:
+        collection_name (str): The collection version the chunks were written to (not the alias).
+        ids (List[str]): Point IDs, identical to the ones upserted into Qdrant.
+        payloads (List[Dict[str, Any]]): The matching payloads (must contain "text_chunk").
+        rebuild (bool): Start from an empty index (used when a new collection version is built).
+        removed_ids (Iterable[str]): Point IDs deleted from the collection, dropped from the index too.
+
+    Returns:
+        bool: True if the index was updated and saved, False otherwise.
+    """
+    index_path = bm25_index_path(collection_name)
+    bm25_index = BM25Index() if rebuild else BM25Index.load(index_path)
+    for point_id in removed_ids:
+        bm25_index.delete(point_id)
+    for point_id, payload in zip(ids, payloads):
+        bm25_index.upsert(point_id, payload["text_chunk"], payload)
+    if not bm25_index.save(index_path):
+        return False
+    print(f"BM25 index at {index_path} now holds {len(bm25_index)} chunks.")
+    return True
+
+def check_recall(vector_db_manager: VectorDBManager, embedding_manager: EmbeddingManager, collection_name: str,
+                 ids: List[str], payloads: List[Dict[str, Any]], k: int = REINDEX_RECALL_K, sample_size: int = 50,
+                 reducer: Optional[DimensionReducer] = None) -> float:
+    """
+    Measures how often a chunk's source question retrieves that chunk in the top k of a collection.
+    Questions are projected with the collection's reducer, as the retriever does.
+
+    Returns:
+        float: Recall@k over the sampled questions (1.0 if no chunk has a source question).
+    """
+    checks = [(point_id, payload["source_question"]) for point_id, payload in zip(ids, payloads)
+              if payload.get("source_question") not in (None, "N/A")][:sample_size]
+    if not checks:
+        return 1.0
+    found = 0
+    for point_id, question in checks:
+        query_vector = embedding_manager.generate_embedding(question)
+        if query_vector is None:
+            continue
+        if reducer is not None:
+            query_vector = reducer.transform(query_vector).tolist()
+        hits = vector_db_manager.search(collection_name, query_vector, limit=k)
+        if any(str(hit["id"]) == point_id for hit in hits):
+            found += 1
+    return found / len(checks)
+
+
+def stale_point_ids(vector_db_manager: VectorDBManager, collection_name: str, source_file: str, ids: List[str]) -> List[str]:
+    """
+    Points of a collection that came from source_file but are not among the freshly ingested ids
+    (rules removed or reworded since, or now merged into a near duplicate).
+    """
+    current = set(ids)
+    return [str(record.id) for record in vector_db_manager.scroll_points(collection_name, with_vectors=False)
+            if (record.payload or {}).get("source_file") == source_file and str(record.id) not in current]
+
+
+def garbage_collect_versions(vector_db_manager: VectorDBManager, alias: str, keep: int = KEEP_COLLECTION_VERSIONS) -> List[str]:
+    """
+    Deletes old "<alias>_v<N>" collections, keeping the newest `keep` versions and never the live one.
+
+    Returns:
+        List[str]: Names of the deleted collections.
+    """
+    live = vector_db_manager.get_alias_target(alias)
+    versions = vector_db_manager.list_collection_versions(alias)
+    retained = {name for _, name in versions[-keep:]} | {live}
+    deleted = []
+    for _, name in versions:
+        if name not in retained and vector_db_manager.delete_collection(name):
+            delete_reducer(name)
+            delete_bm25_index(name)
+            deleted.append(name)
+    return deleted
+
+
 # --- Main Ingestion Logic ---
-def run_ingestion():
+def run_ingestion(reindex: bool = False, dedup: bool = DEDUP_ENABLED):
     """
     Runs the data ingestion process:
     1. Initializes EmbeddingManager and VectorDBManager.
-    2. Creates the Qdrant collection if it doesn't exist.
-    3. Loads data from the rules.json file.
-    4. Generates embeddings for the 'answer' part of each rule.
+    2. Loads data from the rules.json file.
+    3. Skips near duplicates of chunks already seen, then generates embeddings for the 'answer' part of each rule.
+    4. Chooses the target collection: the one behind the alias, or a new version.
     5. Ingests the embeddings and payloads into Qdrant.
+    6. Updates the BM25 index of that collection version with the same chunks.
+    7. For a new version: checks point count and recall, repoints the alias and removes old versions.
+    An upsert into the live collection also deletes the points of rules no longer in the file.
+
+    Args:
+        reindex (bool): Build a new collection version instead of upserting into the live one.
+            A new version is also built when no collection exists yet.
+        dedup (bool): Merge near-duplicate chunks into one point whose payload lists every source.
     """
     print("Starting data ingestion process...")
 
     # 1. Initialize Managers
     print("\nInitializing EmbeddingManager...")
+    # Same import as embedding_server._embedding_manager_class: an ImportError from sentence_transformers
+    # or torch must surface as such, not as a missing 'embedding_manager' module
+    if __package__:
+        from .embedding_manager import EmbeddingManager
+    else:
+        from embedding_manager import EmbeddingManager
     embedding_manager = EmbeddingManager() # Uses default model 'all-MiniLM-L6-v2'
     if not embedding_manager.model or embedding_manager.dimension is None:
         print("Error: Embedding model failed to load. Aborting ingestion.")
@@ -101,19 +235,7 @@ def run_ingestion():
         return
     print("VectorDBManager initialized.")
 
-    # 2. Create Qdrant Collection
-    print(f"\nEnsuring collection '{COLLECTION_NAME}' exists with vector size {embedding_manager.dimension}...")
-    collection_created_or_exists = vector_db_manager.create_collection_if_not_exists(
-        collection_name=COLLECTION_NAME,
-        vector_size=embedding_manager.dimension
-        # Uses default Distance.COSINE from VectorDBManager
-    )
-    if not collection_created_or_exists:
-        print(f"Error: Failed to create or verify collection '{COLLECTION_NAME}'. Aborting ingestion.")
-        return
-    print(f"Collection '{COLLECTION_NAME}' is ready.")
-
-    # 3. Load Data
+    # 2. Load Data
     print(f"\nLoading data from rules file: {RULES_FILE_PATH}...")
     # Create dummy rules.json if it doesn't exist for testing
     if not RULES_FILE_PATH.parent.exists():
@@ -142,7 +264,7 @@ def run_ingestion():
         return
     print(f"Loaded {len(rule_items)} items from rules file.")
 
-    # 4. Prepare data for ingestion
+    # 3. Prepare data for ingestion
     print("\nPreparing data for ingestion (generating embeddings)...")
     ids: List[str] = []
     vectors: List[List[float]] = []
@@ -150,6 +272,8 @@ def run_ingestion():
 
     processed_count = 0
     successfully_embedded_count = 0
+    duplicate_index = NearDuplicateIndex() if dedup else None
+    payload_by_id: Dict[str, Dict[str, Any]] = {}
 
     for item in rule_items:
         processed_count += 1
@@ -163,6 +287,14 @@ def run_ingestion():
             print(f"Warning: Item has missing 'pattern' (using answer as main content): {item}")
             source_question = "N/A"
 
+        point_id = make_point_id(RULES_FILE_PATH.name, source_question, text_chunk)
+        source = {"source_file": RULES_FILE_PATH.name, "source_question": source_question}
+        if duplicate_index is not None:
+            representative = duplicate_index.add(point_id, text_chunk)
+            if representative is not None and representative in payload_by_id:
+                # Same content as a chunk already kept: record where else it appears instead of embedding it again
+                payload_by_id[representative]["sources"].append(source)
+                continue
 
         embedding = embedding_manager.generate_embedding(text_chunk)
 
@@ -170,11 +302,13 @@ def run_ingestion():
             payload: Dict[str, Any] = {
                 "text_chunk": text_chunk,
                 "source_question": source_question,
-                "source_file": RULES_FILE_PATH.name # Store only the filename
+                "source_file": RULES_FILE_PATH.name, # Store only the filename
+                "sources": [source],  # every place this content appears, after deduplication
             }
-            ids.append(str(uuid.uuid4())) # Generate a unique ID for each point
+            ids.append(point_id)
             vectors.append(embedding)
             payloads.append(payload)
+            payload_by_id[point_id] = payload
             successfully_embedded_count +=1
         else:
             print(f"Warning: Failed to generate embedding for text chunk: '{text_chunk[:50]}...'")
@@ -182,29 +316,109 @@ def run_ingestion():
             # For now, we skip items that fail embedding.
 
     print(f"Processed {processed_count} items. Successfully generated embeddings for {successfully_embedded_count} items.")
+    if duplicate_index is not None:
+        print(duplicate_index.report())
 
-    # 5. Ingest into Qdrant
-    if vectors: # Only ingest if there's something to ingest
-        print(f"\nIngesting {len(vectors)} points into collection '{COLLECTION_NAME}'...")
-        success = vector_db_manager.ingest_points(
-            collection_name=COLLECTION_NAME,
-            vectors=vectors,
-            payloads=payloads,
-            ids=ids
-        )
-        if success:
-            print(f"Successfully ingested {len(vectors)} points.")
-        else:
-            print("Ingestion failed or partially failed. Check logs from VectorDBManager.")
-    else:
+    if not vectors:
         print("No vectors were generated. Nothing to ingest into Qdrant.")
+        return
 
-    print("\nData ingestion process finished.")
+    # 4. Choose the target collection
+    live_collection = vector_db_manager.get_alias_target(COLLECTION_ALIAS)
+    versions = vector_db_manager.list_collection_versions(COLLECTION_ALIAS)
+    if live_collection is None and versions and not reindex:
+        # Adopt the newest existing version (e.g. a collection created before aliases were used)
+        if not vector_db_manager.point_alias(COLLECTION_ALIAS, versions[-1][1]):
+            print("Error: Could not create the collection alias. Aborting ingestion.")
+            return
+        live_collection = versions[-1][1]
+    build_new_version = reindex or live_collection is None
+    if build_new_version:
+        next_version = versions[-1][0] + 1 if versions else 1
+        target_collection = f"{COLLECTION_ALIAS}_v{next_version}"
+        print(f"\nBuilding new collection version '{target_collection}' (live: {live_collection})...")
+    else:
+        target_collection = live_collection
+        print(f"\nUpserting into live collection '{target_collection}' behind alias '{COLLECTION_ALIAS}'...")
+
+    # A new version may store reduced vectors (VECTOR_REDUCTION, fitted on this corpus), recorded in its
+    # metadata; upserts into the live collection reuse the reducer it was built with, so old and new
+    # points stay comparable.
+    if build_new_version:
+        reducer = DimensionReducer.fit(vectors, VECTOR_DIMS, VECTOR_REDUCTION) if VECTOR_REDUCTION else None
+    else:
+        try:
+            reducer = load_reducer(vector_db_manager, target_collection)
+        except ReducerError as e:
+            print(f"Error: {e} Aborting ingestion; rebuild the collection with --reindex.")
+            return
+    if reducer is not None:
+        vectors = reducer.transform(vectors).tolist()
+        print(f"Vectors reduced with {reducer.describe()}.")
+        if build_new_version:
+            save_reducer(target_collection, reducer)
+    vector_size = reducer.dimension if reducer is not None else embedding_manager.dimension
+
+    collection_created_or_exists = vector_db_manager.create_collection_if_not_exists(
+        collection_name=target_collection,
+        vector_size=vector_size,
+        # Uses default Distance.COSINE from VectorDBManager; HNSW, quantization and
+        # on-disk settings come from QDRANT_* environment variables
+        **index_tuning_from_env(),
+        metadata=reduction_metadata(reducer) if build_new_version and reducer is not None else None,
+    )
+    if not collection_created_or_exists:
+        print(f"Error: Failed to create or verify collection '{target_collection}'. Aborting ingestion.")
+        return
+    print(f"Collection '{target_collection}' is ready.")
+
+    # Points of rules removed from the file since the live collection was built; a new version starts empty
+    stale_ids = [] if build_new_version else stale_point_ids(vector_db_manager, target_collection, RULES_FILE_PATH.name, ids)
 
-    # Optional: Get collection info after ingestion
-    collection_info = vector_db_manager.get_collection_info(COLLECTION_NAME)
-    if collection_info:
-        print(f"\nCollection '{COLLECTION_NAME}' info after ingestion: {collection_info.get('points_count')} points.")
+    # 5. Ingest into Qdrant
+    print(f"\nIngesting {len(vectors)} points into collection '{target_collection}'...")
+    success = vector_db_manager.ingest_points(
+        collection_name=target_collection,
+        vectors=vectors,
+        payloads=payloads,
+        ids=ids
+    )
+    if not success:
+        print("Ingestion failed or partially failed. Check logs from VectorDBManager.")
+        if build_new_version:
+            vector_db_manager.delete_collection(target_collection)
+        return
+    print(f"Successfully ingested {len(vectors)} points.")
+    if stale_ids and not vector_db_manager.delete_points(target_collection, stale_ids):
+        stale_ids = []  # still served by Qdrant, so kept in the lexical index too
+
+    # 6. Keep the collection's lexical index in step with its points, before a new version goes live
+    if not update_lexical_index(target_collection, ids, payloads, rebuild=build_new_version, removed_ids=stale_ids):
+        print("Warning: BM25 index update failed; hybrid retrieval will use stale lexical results.")
+
+    # 7. Validate and publish a new version
+    if build_new_version:
+        point_count = vector_db_manager.count_points(target_collection)
+        recall = check_recall(vector_db_manager, embedding_manager, target_collection, ids, payloads, reducer=reducer)
+        print(f"Validation of '{target_collection}': {point_count} points (expected {len(set(ids))}), recall@{REINDEX_RECALL_K} = {recall:.2f}.")
+        if point_count != len(set(ids)) or recall < REINDEX_MIN_RECALL:
+            print(f"Error: '{target_collection}' failed validation (minimum recall {REINDEX_MIN_RECALL}). "
+                  f"The alias keeps pointing to '{live_collection}'.")
+            vector_db_manager.delete_collection(target_collection)
+            delete_bm25_index(target_collection)
+            return
+        if not vector_db_manager.point_alias(COLLECTION_ALIAS, target_collection):
+            vector_db_manager.delete_collection(target_collection)
+            delete_bm25_index(target_collection)
+            return
+        deleted = garbage_collect_versions(vector_db_manager, COLLECTION_ALIAS)
+        if deleted:
+            print(f"Removed old collection versions: {', '.join(deleted)}")
+
+    print("\nData ingestion process finished.")
+    point_count = vector_db_manager.count_points(COLLECTION_ALIAS)
+    if point_count is not None:
+        print(f"\nAlias '{COLLECTION_ALIAS}' -> '{vector_db_manager.get_alias_target(COLLECTION_ALIAS)}': {point_count} points.")
 
 
 # --- Script Execution ---
@@ -220,4 +434,11 @@ if __name__ == '__main__':
         # Note: This doesn't create the rules.json itself here,
         # load_data_from_rules or the ingestion logic handles dummy creation if needed.
 
-    run_ingestion()
+    parser = argparse.ArgumentParser(description="Ingest rules into Qdrant and the BM25 index.")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Build a new collection version, validate it and switch the alias to it.")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Embed every chunk, even near duplicates of chunks already ingested.")
+    args = parser.parse_args()
+
+    run_ingestion(reindex=args.reindex, dedup=DEDUP_ENABLED and not args.no_dedup)
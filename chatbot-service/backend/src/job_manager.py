@@ -0,0 +1,186 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .event_log import event_log
+from .metrics import metrics
+
+# Generations running at once in the background; more jobs wait in a queue of at most JOB_MAX_PENDING.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+# Seconds a finished job's result stays available to poll for.
+JOB_TTL = float(os.getenv("JOB_TTL", "900"))
+# Longest long-poll a client may ask for, in seconds; well under typical proxy timeouts.
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when JOB_MAX_PENDING jobs are already waiting."""
+
+
+class JobFailed(Exception):
+    """Raised by a job runner to fail a job with a code and message the client can act on."""
+    def __init__(self, code: str, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.code = code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Job:
+    """One background chat generation, owned by the user who submitted it."""
+    def __init__(self, sub: str, session_id: Optional[str], message: str):
+        self.id = uuid.uuid4().hex
+        self.sub = sub
+        # Without a session id the job starts a new conversation; resubmissions get this same one back
+        self.session_id = session_id or uuid.uuid4().hex
+        self.dedup_key = job_key(sub, session_id, message)
+        self.message = message
+        self.status = QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.finished = asyncio.Event()
+
+    def expired(self, now: float) -> bool:
+        return self.finished_at is not None and now - self.finished_at > JOB_TTL
+
+
+def job_key(sub: str, session_id: Optional[str], message: str) -> Tuple[str, str, str]:
+    """
+    Jobs are duplicates when the same user asks the same thing (case and spacing aside) in the same
+    session, or both times without a session.
+    """
+    return sub, session_id or "", " ".join(message.lower().split())
+
+
+class JobManager:
+    """
+    Runs long generations in a bounded pool of background workers, decoupled from the HTTP request.
+
+    A job outlives the request that submitted it: the client may disconnect, time out or reload,
+    and fetch the result later by id until JOB_TTL after it finished. Submitting the same message
+    again while a job is queued, running or still held returns that job instead of starting a second
+    generation. Jobs are kept in memory and do not survive a restart.
+    """
+    def __init__(self, runner: Callable[[Job], Awaitable[Dict[str, Any]]], workers: int = JOB_WORKERS,
+                 max_pending: int = JOB_MAX_PENDING):
+        """
+        Args:
+            runner (Callable[[Job], Awaitable[Dict[str, Any]]]): Produces a job's result; may raise JobFailed.
+            workers (int): Jobs processed concurrently.
+            max_pending (int): Jobs allowed to wait for a worker.
+        """
+        self.runner = runner
+        self.workers = max(1, workers)
+        self._queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=max(1, max_pending))
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[Tuple[str, str, str], Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def find(self, sub: str, session_id: Optional[str], message: str) -> Optional[Job]:
+        """Returns the job a new submission would be attached to, if any."""
+        self._prune()
+        job = self._by_key.get(job_key(sub, session_id, message))
+        # A failed job is not an answer worth reusing; let the user retry
+        return job if job is not None and job.status != FAILED else None
+
+    def submit(self, sub: str, session_id: Optional[str], message: str) -> Tuple[Job, bool]:
+        """
+        Queues a generation, or attaches to an identical one.
+        Without a session id, the job starts a new session (see Job.session_id).
+
+        Returns:
+            Tuple[Job, bool]: The job, and whether it was newly created.
+
+        Raises:
+            JobQueueFull: If too many jobs are already waiting.
+        """
+        existing = self.find(sub, session_id, message)
+        if existing is not None:
+            metrics.inc("chat_jobs_submitted_total", outcome="attached")
+            return existing, False
+        job = Job(sub, session_id, message)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.inc("chat_jobs_submitted_total", outcome="rejected")
+            raise JobQueueFull(f"{self._queue.maxsize} jobs already pending")
+        self._jobs[job.id] = job
+        self._by_key[job.dedup_key] = job
+        metrics.inc("chat_jobs_submitted_total", outcome="queued")
+        metrics.set_gauge("chat_jobs_pending", self._queue.qsize())
+        return job, True
+
+    def get(self, sub: str, job_id: str) -> Optional[Job]:
+        """Returns the job if it exists and belongs to the user; other users' jobs look missing."""
+        self._prune()
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.sub == sub else None
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Waits up to timeout seconds (capped at JOB_MAX_WAIT) for the job to finish, for long-polling."""
+        timeout = min(max(0.0, timeout), JOB_MAX_WAIT)
+        if timeout > 0 and not job.finished.is_set():
+            try:
+                await asyncio.wait_for(job.finished.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def _prune(self) -> None:
+        now = time.time()
+        for job in [job for job in self._jobs.values() if job.expired(now)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.dedup_key) is job:
+                del self._by_key[job.dedup_key]
+        metrics.set_gauge("chat_jobs_stored", len(self._jobs))
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        job.finished.set()
+        metrics.inc("chat_jobs_finished_total", status=status)
+        metrics.observe("chat_job_duration_ms", (job.finished_at - job.created_at) * 1000.0)
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            metrics.set_gauge("chat_jobs_pending", self._queue.qsize())
+            job.status = RUNNING
+            try:
+                job.result = await self.runner(job)
+                self._finish(job, DONE)
+            except asyncio.CancelledError:
+                job.error = {"code": "shutdown", "detail": "The server restarted before the answer was ready."}
+                self._finish(job, FAILED)
+                raise
+            except JobFailed as e:
+                job.error = {"code": e.code, "detail": e.detail, "retry_after": e.retry_after}
+                self._finish(job, FAILED)
+            except Exception as e:
+                event_log.emit("chat.job_error", level="error", job_id=job.id, sub=job.sub, message=job.message,
+                               detail=f"Chat job {job.id} failed: {str(e)}")
+                job.error = {"code": "internal", "detail": "An internal error occurred in the chatbot."}
+                self._finish(job, FAILED)
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        """Starts the workers on the running event loop."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        print(f"[INFO] Chat job workers started: {self.workers}")
+
+    async def stop(self) -> None:
+        """Stops the workers; jobs still running are failed, queued ones are dropped."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
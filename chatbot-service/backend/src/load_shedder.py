@@ -0,0 +1,170 @@
+import asyncio
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+from .metrics import metrics
+
+# Event-loop lag (ms) and in-flight requests (HTTP requests plus WebSocket turns) above which AI generations and background job
+# submissions are refused, so rule and cache answers stay fast.
+SHED_AI_LAG_MS = float(os.getenv("SHED_AI_LAG_MS", "100"))
+SHED_AI_IN_FLIGHT = int(os.getenv("SHED_AI_IN_FLIGHT", "64"))
+# Above these, every sheddable request is refused at the door.
+SHED_ALL_LAG_MS = float(os.getenv("SHED_ALL_LAG_MS", "500"))
+SHED_ALL_IN_FLIGHT = int(os.getenv("SHED_ALL_IN_FLIGHT", "256"))
+SHED_RETRY_AFTER = int(os.getenv("SHED_RETRY_AFTER", "5"))
+LAG_SAMPLE_INTERVAL = float(os.getenv("LAG_SAMPLE_INTERVAL", "0.1"))
+# Never shed: probes, metrics and operator endpoints must keep answering under load.
+SHED_EXEMPT_PATHS = tuple(p for p in os.getenv(
+    "SHED_EXEMPT_PATHS", "/health,/metrics,/rules/snapshot,/ollama/status,/admin"
+).split(",") if p)
+
+# Shedding levels, from nothing refused to everything sheddable refused
+NORMAL, SHED_AI, SHED_ALL = 0, 1, 2
+LEVEL_NAMES = {NORMAL: "normal", SHED_AI: "shed_ai", SHED_ALL: "shed_all"}
+
+
+class Overloaded(Exception):
+    """Raised when work is shed; retry_after is in seconds."""
+    def __init__(self, retry_after: int = SHED_RETRY_AFTER):
+        super().__init__("Server overloaded")
+        self.retry_after = retry_after
+
+
+class LoadShedder:
+    """
+    Watches event-loop lag and in-flight requests and decides what to refuse.
+
+    In-flight load is the HTTP requests being handled (long polls excluded: they only wait) plus the
+    WebSocket turns being answered, which never go through the HTTP middleware.
+
+    Lag is sampled by a task that sleeps LAG_SAMPLE_INTERVAL and measures how late it wakes up;
+    it rises immediately and decays gradually, so one quiet sample does not reopen the floodgates.
+    At SHED_AI the pipeline refuses messages that would need the LLM (rule and cache hits are still
+    answered) and new background jobs are refused; at SHED_ALL every sheddable request is refused.
+    """
+    def __init__(self, ai_lag_ms: float = SHED_AI_LAG_MS, ai_in_flight: int = SHED_AI_IN_FLIGHT,
+                 all_lag_ms: float = SHED_ALL_LAG_MS, all_in_flight: int = SHED_ALL_IN_FLIGHT,
+                 interval: float = LAG_SAMPLE_INTERVAL):
+        self.ai_lag_ms = ai_lag_ms
+        self.ai_in_flight = ai_in_flight
+        self.all_lag_ms = all_lag_ms
+        self.all_in_flight = all_in_flight
+        self.interval = interval
+        self.lag_ms = 0.0
+        self.in_flight = 0
+        self.ws_in_flight = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def level(self) -> int:
+        load = self.in_flight + self.ws_in_flight
+        if self.lag_ms >= self.all_lag_ms or load >= self.all_in_flight:
+            return SHED_ALL
+        if self.lag_ms >= self.ai_lag_ms or load >= self.ai_in_flight:
+            return SHED_AI
+        return NORMAL
+
+    @property
+    def shedding_ai(self) -> bool:
+        return self.level >= SHED_AI
+
+    @contextmanager
+    def ws_turn(self) -> Iterator[None]:
+        """Counts a WebSocket turn as in flight while it is being answered."""
+        self.ws_in_flight += 1
+        metrics.set_gauge("ws_turns_in_flight", self.ws_in_flight)
+        try:
+            yield
+        finally:
+            self.ws_in_flight -= 1
+            metrics.set_gauge("ws_turns_in_flight", self.ws_in_flight)
+
+    def check_ai(self) -> None:
+        """
+        Called before an LLM generation on an interactive request.
+
+        Raises:
+            Overloaded: If AI work is being shed.
+        """
+        if self.shedding_ai:
+            metrics.inc("load_shed_total", stage="ai")
+            raise Overloaded()
+
+    async def _sample_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            sample_ms = max(0.0, (loop.time() - start - self.interval) * 1000.0)
+            self.lag_ms = max(sample_ms, self.lag_ms * 0.8 + sample_ms * 0.2)
+            metrics.set_gauge("event_loop_lag_ms", round(self.lag_ms, 2))
+            metrics.set_gauge("load_shed_level", self.level)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._sample_lag())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+def _is_long_poll(method: str, path: str) -> bool:
+    # GET /chat/jobs/{id}?wait=... holds the connection open for up to JOB_MAX_WAIT while doing no work
+    return method == "GET" and path.startswith("/chat/jobs/")
+
+
+def _shed_at(method: str, path: str) -> Optional[int]:
+    """Level from which a request is refused at the door, or None if it is never shed."""
+    if path.startswith(SHED_EXEMPT_PATHS) or _is_long_poll(method, path):
+        return None
+    if method == "POST" and path.startswith("/chat/jobs"):
+        return SHED_AI  # a job is always an LLM generation, and nobody is waiting on it interactively
+    return SHED_ALL
+
+
+class LoadSheddingMiddleware:
+    """
+    ASGI middleware counting in-flight HTTP requests and refusing them with 503 when overloaded.
+    Long polls on job results are neither counted nor refused.
+    """
+    def __init__(self, app, shedder: LoadShedder):
+        self.app = app
+        self.shedder = shedder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        shed_at = _shed_at(scope["method"], scope["path"])
+        if shed_at is not None and self.shedder.level >= shed_at:
+            metrics.inc("load_shed_total", stage=LEVEL_NAMES[shed_at])
+            await _reject(send)
+            return
+        if _is_long_poll(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        self.shedder.in_flight += 1
+        metrics.set_gauge("http_requests_in_flight", self.shedder.in_flight)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.shedder.in_flight -= 1
+            metrics.set_gauge("http_requests_in_flight", self.shedder.in_flight)
+
+
+async def _reject(send) -> None:
+    body = b'{"detail":"Server overloaded, please retry shortly."}'
+    headers: Tuple[Tuple[bytes, bytes], ...] = (
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(SHED_RETRY_AFTER).encode()),
+    )
+    await send({"type": "http.response.start", "status": 503, "headers": list(headers)})
+    await send({"type": "http.response.body", "body": body})
+
+
+load_shedder = LoadShedder()
@@ -0,0 +1,288 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from fastapi import HTTPException, Request
+from jose import jwk, jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+
+from .metrics import metrics
+
+KEYCLOAK_URL = os.getenv("KEYCLOAK_URL", "")
+KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM", "")
+# Expected "iss" claim. Tokens carry the URL the browser used, which differs from the
+# in-cluster KEYCLOAK_URL when the backend reaches Keycloak through a service name.
+KEYCLOAK_ISSUER = os.getenv("KEYCLOAK_ISSUER", f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}")
+KEYCLOAK_JWKS_URL = os.getenv("KEYCLOAK_JWKS_URL", f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/protocol/openid-connect/certs")
+# Expected "aud" claim. Empty: audience not checked (Keycloak access tokens often carry only "account").
+KEYCLOAK_AUDIENCE = os.getenv("KEYCLOAK_AUDIENCE", "")
+# Keys are refreshed in the background after this many seconds, and at most this often on an unknown kid
+JWKS_CACHE_TTL = float(os.getenv("JWKS_CACHE_TTL", "3600"))
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+# Verified tokens remembered until they expire, so repeat requests skip the signature check
+VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv("VERIFIED_TOKEN_CACHE_SIZE", "4096"))
+
+SUPPORTED_ALGORITHMS = ("RS256", "RS384", "RS512", "PS256", "PS384", "PS512", "ES256", "ES384", "ES512")
+
+
+class AuthenticatedUser:
+    """The fields of fastapi_keycloak's OIDCUser that the routes use, built from verified claims."""
+    def __init__(self, claims: Dict[str, Any]):
+        self.claims = claims
+        self.sub: str = claims.get("sub", "")
+        self.email: Optional[str] = claims.get("email")
+        self.preferred_username: Optional[str] = claims.get("preferred_username")
+        self.exp: int = claims.get("exp", 0)
+        self.roles: List[str] = list((claims.get("realm_access") or {}).get("roles", []))
+
+
+class LocalJWTVerifier:
+    """
+    Verifies Keycloak access tokens in-process.
+
+    The realm's JWKS is fetched once and every key is turned into a ready-to-use key object
+    indexed by kid, so a request costs one dictionary lookup and one signature check (or a
+    cache hit for a token already seen). An unknown kid, as after a key rotation, triggers a
+    rate-limited refresh; otherwise keys are refreshed in the background when the TTL expires.
+    """
+    def __init__(self, jwks_url: str = KEYCLOAK_JWKS_URL, issuer: str = KEYCLOAK_ISSUER,
+                 audience: str = KEYCLOAK_AUDIENCE, cache_ttl: float = JWKS_CACHE_TTL,
+                 min_refresh_interval: float = JWKS_MIN_REFRESH_INTERVAL,
+                 token_cache_size: int = VERIFIED_TOKEN_CACHE_SIZE):
+        """
+        Args:
+            jwks_url (str): Realm certificate endpoint.
+            issuer (str): Expected "iss" claim; empty disables the check.
+            audience (str): Expected "aud" claim; empty disables the check.
+            cache_ttl (float): Seconds before keys are refreshed in the background.
+            min_refresh_interval (float): Minimum seconds between two fetches triggered by unknown kids.
+            token_cache_size (int): Verified tokens remembered until their expiry; 0 disables.
+        """
+        self.jwks_url = jwks_url
+        self.issuer = issuer
+        self.audience = audience
+        self.cache_ttl = cache_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.token_cache_size = token_cache_size
+        self._keys: Dict[str, Tuple[str, Any]] = {}  # kid -> (algorithm, key object)
+        self._fetched_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._background_refresh = False
+        self._verified: "OrderedDict[str, AuthenticatedUser]" = OrderedDict()
+        self._verified_lock = threading.Lock()
+
+    def refresh_keys(self, force: bool = False) -> bool:
+        """
+        Fetches the JWKS and rebuilds the key objects.
+
+        Returns:
+            bool: True if the keys were fetched, False if skipped (rate limit) or the fetch failed.
+        """
+        with self._refresh_lock:
+            if not force and time.monotonic() - self._fetched_at < self.min_refresh_interval:
+                return False
+            try:
+                response = requests.get(self.jwks_url, timeout=5)
+                response.raise_for_status()
+                jwks = response.json()
+            except (requests.RequestException, ValueError) as e:
+                print(f"[ERROR] Could not fetch JWKS from {self.jwks_url}: {e}")
+                metrics.inc("jwks_refresh_total", outcome="error")
+                return False
+            keys = {}
+            for key_data in jwks.get("keys", []):
+                if key_data.get("use", "sig") != "sig" or "kid" not in key_data:
+                    continue
+                algorithm = key_data.get("alg", "RS256")
+                if algorithm not in SUPPORTED_ALGORITHMS:
+                    continue
+                try:
+                    keys[key_data["kid"]] = (algorithm, jwk.construct(key_data, algorithm))
+                except Exception as e:
+                    print(f"[WARN] Skipping JWKS key {key_data.get('kid')}: {e}")
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            metrics.inc("jwks_refresh_total", outcome="ok")
+            print(f"[INFO] Loaded {len(keys)} signing keys from {self.jwks_url}")
+            return True
+
+    def _refresh_in_background(self) -> None:
+        if self._background_refresh:
+            return
+        self._background_refresh = True
+
+        def run():
+            try:
+                self.refresh_keys(force=True)
+            finally:
+                self._background_refresh = False
+
+        threading.Thread(target=run, name="jwks-refresh", daemon=True).start()
+
+    def _get_key(self, kid: str) -> Optional[Tuple[str, Any]]:
+        entry = self._keys.get(kid)
+        if entry is None:
+            # Possibly a rotated key: fetch once, rate-limited so forged kids cannot hammer Keycloak
+            self.refresh_keys()
+            entry = self._keys.get(kid)
+        elif time.monotonic() - self._fetched_at > self.cache_ttl:
+            self._refresh_in_background()
+        return entry
+
+    def _cached_user(self, token: str) -> Optional[AuthenticatedUser]:
+        with self._verified_lock:
+            user = self._verified.get(token)
+            if user is None:
+                return None
+            if user.exp <= time.time():
+                del self._verified[token]
+                return None
+            self._verified.move_to_end(token)
+            return user
+
+    def _remember(self, token: str, user: AuthenticatedUser) -> None:
+        if self.token_cache_size <= 0:
+            return
+        with self._verified_lock:
+            self._verified[token] = user
+            while len(self._verified) > self.token_cache_size:
+                self._verified.popitem(last=False)
+
+    def verify(self, token: str) -> AuthenticatedUser:
+        """
+        Verifies signature, expiry, issuer and (optionally) audience of a bearer token.
+
+        Raises:
+            HTTPException: 401 if the token is invalid or expired.
+        """
+        user = self._cached_user(token)
+        if user is not None:
+            metrics.inc("auth_verifications_total", outcome="cached")
+            return user
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError:
+            metrics.inc("auth_verifications_total", outcome="malformed")
+            raise self._unauthorized("Malformed token")
+        entry = self._get_key(header.get("kid", ""))
+        if entry is None:
+            metrics.inc("auth_verifications_total", outcome="unknown_key")
+            raise self._unauthorized("Unknown signing key")
+        algorithm, key = entry
+        if header.get("alg") != algorithm:
+            metrics.inc("auth_verifications_total", outcome="invalid")
+            raise self._unauthorized("Unexpected token algorithm")
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience or None,
+                issuer=self.issuer or None,
+                options={"verify_aud": bool(self.audience), "verify_at_hash": False},
+            )
+        except ExpiredSignatureError:
+            metrics.inc("auth_verifications_total", outcome="expired")
+            raise self._unauthorized("Token expired")
+        except JWTError as e:
+            metrics.inc("auth_verifications_total", outcome="invalid")
+            raise self._unauthorized(f"Invalid token: {e}")
+        user = AuthenticatedUser(claims)
+        self._remember(token, user)
+        metrics.inc("auth_verifications_total", outcome="verified")
+        return user
+
+    @staticmethod
+    def _unauthorized(detail: str) -> HTTPException:
+        return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+    def get_current_user(self, roles: Optional[List[str]] = None):
+        """
+        FastAPI dependency returning the authenticated user, mirroring fastapi_keycloak's helper.
+
+        Args:
+            roles (Optional[List[str]]): Realm roles allowed to call the route; the user needs at least one.
+        """
+        allowed = set(roles or [])
+
+        def dependency(request: Request) -> AuthenticatedUser:
+            scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                raise self._unauthorized("Missing bearer token")
+            user = self.verify(token.strip())
+            if allowed and not allowed.intersection(user.roles):
+                raise HTTPException(status_code=403, detail="Insufficient role")
+            return user
+
+        return dependency
+
+
+if __name__ == "__main__":
+    # Self-check against a local fake issuer: serves a JWKS over HTTP, signs tokens and verifies them.
+    import json
+    import threading as _threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    public_jwk = jwk.construct(public_pem, "RS256").to_dict()
+    public_jwk.update({"kid": "test-key", "alg": "RS256", "use": "sig"})
+    jwks_body = json.dumps({"keys": [public_jwk]}).encode()
+
+    class JWKSHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(jwks_body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), JWKSHandler)
+    _threading.Thread(target=server.serve_forever, daemon=True).start()
+    issuer = "http://fake-keycloak/realms/test"
+    verifier = LocalJWTVerifier(jwks_url=f"http://127.0.0.1:{server.server_port}/certs", issuer=issuer,
+                                token_cache_size=0)
+
+    def sign(**claims):
+        base = {"sub": "user-1", "email": "etudiant@est.ma", "iss": issuer, "exp": int(time.time()) + 300,
+                "realm_access": {"roles": ["etudiant"]}}
+        base.update(claims)
+        return jwt.encode(base, private_pem, algorithm="RS256", headers={"kid": "test-key"})
+
+    user = verifier.verify(sign())
+    print(f"Verified: sub={user.sub} email={user.email} roles={user.roles}")
+
+    for label, token in (("expired", sign(exp=int(time.time()) - 10)), ("wrong issuer", sign(iss="http://evil"))):
+        try:
+            verifier.verify(token)
+            print(f"{label}: unexpectedly accepted")
+        except HTTPException as e:
+            print(f"{label}: rejected ({e.status_code} {e.detail})")
+
+    token = sign()
+    iterations = 2000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        verifier.verify(token)
+    print(f"Signature check: {(time.perf_counter() - start) / iterations * 1e6:.0f} µs/token")
+
+    verifier.token_cache_size = 16
+    verifier.verify(token)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        verifier.verify(token)
+    print(f"Cached token: {(time.perf_counter() - start) / iterations * 1e6:.1f} µs/token")
+    server.shutdown()
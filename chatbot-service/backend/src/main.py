@@ -1,10 +1,15 @@
+import asyncio
 from fastapi import FastAPI
-from fastapi_keycloak import FastAPIKeycloak
 import os
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
 
+from .load_shedder import LoadSheddingMiddleware, load_shedder
+
+# Added before CORS so CORS stays outermost and shed 503s still carry CORS headers
+app.add_middleware(LoadSheddingMiddleware, shedder=load_shedder)
+
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "").split(",")
 
 app.add_middleware(
@@ -15,6 +20,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+from .profiler import ProfilingMiddleware, profiler_controller
+
+# Inert unless an admin arms request profiling through /admin/profile/requests
+app.add_middleware(ProfilingMiddleware, controller=profiler_controller)
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
@@ -24,16 +34,87 @@ realm = os.getenv("KEYCLOAK_REALM")
 client_id = os.getenv("KEYCLOAK_CLIENT_ID")
 client_secret = os.getenv("KEYCLOAK_CLIENT_SECRET")
 
-keycloak = FastAPIKeycloak(
-    server_url=keycloak_url,
-    client_id=client_id,
-    client_secret=client_secret,
-    admin_client_secret=client_secret,
-    realm=realm,
-    callback_uri="http://localhost:8000/callback"
-)
+# "local": bearer tokens are verified in-process against the realm's cached public keys.
+# "keycloak": fastapi_keycloak, which needs the Keycloak server reachable at startup.
+AUTH_MODE = os.getenv("AUTH_MODE", "local")
+
+if AUTH_MODE == "keycloak":
+    from fastapi_keycloak import FastAPIKeycloak
 
-keycloak.add_swagger_config(app)
+    auth = FastAPIKeycloak(
+        server_url=keycloak_url,
+        client_id=client_id,
+        client_secret=client_secret,
+        admin_client_secret=client_secret,
+        realm=realm,
+        callback_uri="http://localhost:8000/callback"
+    )
+    auth.add_swagger_config(app)
+else:
+    from .local_auth import LocalJWTVerifier
+
+    auth = LocalJWTVerifier()
 
 from .chatbot_routes import router as chatbot_router
-app.include_router(chatbot_router)
\ No newline at end of file
+app.include_router(chatbot_router)
+
+from .chat_ws import router as chat_ws_router
+app.include_router(chat_ws_router)
+
+from .model_warmer import model_warmer
+
+@app.on_event("startup")
+async def start_model_warmer():
+    # Load the model before the first question instead of on it, then keep it resident
+    model_warmer.start()
+
+@app.on_event("startup")
+async def load_signing_keys():
+    # Fetch the realm keys once at startup so the first request does not pay for it
+    if AUTH_MODE != "keycloak":
+        await asyncio.to_thread(auth.refresh_keys, True)
+
+@app.on_event("shutdown")
+async def stop_model_warmer():
+    await model_warmer.stop()
+
+from .chatbot_routes import EVENT_LOG_WARM_CACHE, job_manager, session_store, warm_answer_cache
+from .event_log import event_log
+
+@app.on_event("startup")
+async def start_event_log():
+    # Request handlers only buffer events; this task writes them out in batches
+    event_log.start()
+
+@app.on_event("startup")
+async def warm_cache_from_events():
+    if EVENT_LOG_WARM_CACHE:
+        loaded = await asyncio.to_thread(warm_answer_cache)
+        print(f"[INFO] Answer cache warmed with {loaded} answers from the event log")
+
+@app.on_event("startup")
+async def start_load_shedder():
+    # Samples event-loop lag for the load-shedding decisions
+    load_shedder.start()
+
+@app.on_event("shutdown")
+async def stop_load_shedder():
+    await load_shedder.stop()
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_manager.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_manager.stop()
+
+@app.on_event("shutdown")
+async def flush_sessions():
+    # After the job workers, whose last exchanges are written behind too
+    await session_store.flush()
+
+@app.on_event("shutdown")
+async def stop_event_log():
+    # Last, so events of the jobs stopped above are written too
+    await event_log.stop()
@@ -0,0 +1,71 @@
+import threading
+from typing import Dict, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry (counters, gauges and summaries)
+    rendered in the Prometheus text exposition format by the /metrics endpoint.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._gauges: Dict[Tuple[str, LabelKey], float] = {}
+        self._summaries: Dict[Tuple[str, LabelKey], Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """Increments a counter."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        """Sets a gauge to the given value."""
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Records one observation in a summary (count, sum and max)."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            summary = self._summaries.setdefault(key, {"count": 0.0, "sum": 0.0, "max": 0.0})
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def get(self, name: str, **labels) -> float:
+        """Returns the current value of a counter or gauge (0 if never set)."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0.0))
+
+    def render_prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            for (name, key), value in sorted(self._counters.items()):
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for (name, key), value in sorted(self._gauges.items()):
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for (name, key), summary in sorted(self._summaries.items()):
+                labels = _format_labels(key)
+                lines.append(f"{name}_count{labels} {summary['count']:g}")
+                lines.append(f"{name}_sum{labels} {summary['sum']:g}")
+                lines.append(f"{name}_max{labels} {summary['max']:g}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry for the whole backend process
+metrics = Metrics()
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from .metrics import metrics
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/v1/generate")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "{0.scheme}://{0.netloc}".format(urlsplit(OLLAMA_URL)))
+
+# How long Ollama keeps the model resident after a request, inside and outside the warm windows
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_IDLE_KEEP_ALIVE = os.getenv("OLLAMA_IDLE_KEEP_ALIVE", "5m")
+OLLAMA_PRELOAD = os.getenv("OLLAMA_PRELOAD", "true").lower() == "true"
+# Seconds between keep-warm checks; a ping is only sent if the model was not used in that interval
+OLLAMA_KEEP_WARM_INTERVAL = float(os.getenv("OLLAMA_KEEP_WARM_INTERVAL", "240"))
+# Local times when the model must stay loaded, e.g. "07:30-19:00,20:00-23:00". Empty: always.
+OLLAMA_WARM_WINDOWS = os.getenv("OLLAMA_WARM_WINDOWS", "")
+
+
+def parse_windows(spec: str) -> List[Tuple[int, int]]:
+    """Parses "HH:MM-HH:MM,..." into (start, end) minutes of the day. Windows may wrap past midnight."""
+    windows = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        try:
+            start, end = (datetime.strptime(t.strip(), "%H:%M") for t in part.split("-"))
+        except ValueError:
+            print(f"[WARN] Ignoring invalid warm window '{part}' (expected HH:MM-HH:MM)")
+            continue
+        windows.append((start.hour * 60 + start.minute, end.hour * 60 + end.minute))
+    return windows
+
+
+class ModelWarmer:
+    """
+    Keeps the Ollama model loaded while it is expected to be used.
+
+    The model is preloaded at startup, pinned with keep_alive on every request, and pinged
+    during the configured warm windows whenever it has been idle for a full interval.
+    Outside the windows a shorter keep_alive lets Ollama release the memory.
+    """
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE, idle_keep_alive: str = OLLAMA_IDLE_KEEP_ALIVE,
+                 interval: float = OLLAMA_KEEP_WARM_INTERVAL, windows: str = OLLAMA_WARM_WINDOWS):
+        """
+        Args:
+            base_url (str): Ollama server root, e.g. "http://ollama:11434".
+            model (str): Model to keep resident.
+            keep_alive (str): keep_alive used inside warm windows (Ollama duration, e.g. "30m", or "-1" for ever).
+            idle_keep_alive (str): keep_alive used outside warm windows.
+            interval (float): Seconds between keep-warm checks.
+            windows (str): Warm windows, see parse_windows(). Empty means always warm.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.idle_keep_alive = idle_keep_alive
+        self.interval = interval
+        self.windows = parse_windows(windows)
+        self.last_used = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def in_warm_window(self, now: Optional[datetime] = None) -> bool:
+        if not self.windows:
+            return True
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end in self.windows:
+            if start <= end and start <= minute < end:
+                return True
+            if start > end and (minute >= start or minute < end):
+                return True
+        return False
+
+    def current_keep_alive(self) -> str:
+        """keep_alive to attach to a generation request made now."""
+        return self.keep_alive if self.in_warm_window() else self.idle_keep_alive
+
+    def mark_used(self) -> None:
+        """Called on each real generation; a recent request makes the next ping unnecessary."""
+        self.last_used = time.monotonic()
+
+    def load(self, keep_alive: Optional[str] = None) -> bool:
+        """
+        Loads the model (or refreshes its keep_alive) with an empty generate request, which Ollama
+        answers without generating anything.
+
+        Returns:
+            bool: True if Ollama accepted the request.
+        """
+        start = time.perf_counter()
+        try:
+            response = requests.post(
+                f"{self.base_url}/api/generate",
+                json={"model": self.model, "keep_alive": keep_alive or self.current_keep_alive()},
+                timeout=300,  # a cold load of a large model can take minutes
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"[WARN] Could not warm Ollama model '{self.model}': {e}")
+            metrics.inc("ollama_warm_requests_total", outcome="error")
+            return False
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        metrics.observe("ollama_warm_latency_ms", elapsed_ms)
+        metrics.inc("ollama_warm_requests_total", outcome="ok")
+        self.mark_used()
+        print(f"[INFO] Ollama model '{self.model}' warm ({elapsed_ms:.0f} ms)")
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        """Models currently resident in Ollama, from /api/ps."""
+        try:
+            response = requests.get(f"{self.base_url}/api/ps", timeout=5)
+            response.raise_for_status()
+            models = response.json().get("models", [])
+        except (requests.RequestException, ValueError) as e:
+            return {"reachable": False, "error": str(e), "model": self.model}
+        resident = [
+            {
+                "name": m.get("name"),
+                "size_vram": m.get("size_vram"),
+                "expires_at": m.get("expires_at"),
+            }
+            for m in models
+        ]
+        loaded = any(m["name"] == self.model or (m["name"] or "").split(":")[0] == self.model for m in resident)
+        metrics.set_gauge("ollama_model_resident", 1 if loaded else 0, model=self.model)
+        return {
+            "reachable": True,
+            "model": self.model,
+            "model_loaded": loaded,
+            "in_warm_window": self.in_warm_window(),
+            "keep_alive": self.current_keep_alive(),
+            "resident_models": resident,
+        }
+
+    async def _keep_warm_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.in_warm_window():
+                continue
+            if time.monotonic() - self.last_used < self.interval:
+                continue  # real traffic already refreshed keep_alive
+            await asyncio.to_thread(self.load)
+
+    def start(self, preload: bool = OLLAMA_PRELOAD) -> None:
+        """Preloads the model in the background and starts the keep-warm loop. Needs a running event loop."""
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        if preload:
+            loop.run_in_executor(None, self.load)
+        self._task = loop.create_task(self._keep_warm_loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+model_warmer = ModelWarmer()
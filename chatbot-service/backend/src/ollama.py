@@ -1,24 +1,149 @@
+import json
 import os
+import httpx
 import requests
+from typing import AsyncIterator, List, Optional, Tuple
+
+from .circuit_breaker import CircuitBreaker
+from .event_log import event_log
+from .model_warmer import model_warmer
+from .prompt_builder import get_prompt_builder
 
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/v1/generate")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "30"))
 
-def generate_response(message: str) -> str:
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": message
-    }
+# Opens after repeated timeouts/errors so requests fail fast instead of waiting for the full timeout
+ollama_breaker = CircuitBreaker(
+    "ollama",
+    failure_threshold=int(os.getenv("OLLAMA_BREAKER_FAILURES", "3")),
+    recovery_timeout=float(os.getenv("OLLAMA_BREAKER_RECOVERY", "30")),
+)
+
+def _call_ollama(payload: dict, timeout: float = OLLAMA_TIMEOUT) -> str:
+    """Posts a generation request through the circuit breaker and returns the generated text."""
+    # Pin the model in memory; the warmer picks a shorter keep_alive outside the warm windows
+    payload.setdefault("keep_alive", model_warmer.current_keep_alive())
+    # Ollama streams NDJSON unless told otherwise, and response.json() cannot parse that
+    payload.setdefault("stream", False)
+    # Raises CircuitOpenError without calling Ollama while the circuit is open
+    ollama_breaker.before_call()
     try:
-        print(f"[INFO] Appel Ollama: {OLLAMA_URL} | Prompt: {message}")
-        response = requests.post(OLLAMA_URL, json=payload, timeout=30)
+        response = requests.post(OLLAMA_URL, json=payload, timeout=timeout)
         response.raise_for_status()
-        data = response.json()
-        # Selon la version d'Ollama, la clé peut être 'response' ou 'message'
-        return data.get("response") or data.get("message") or str(data)
     except requests.Timeout:
-        print("[ERROR] Timeout lors de l'appel à Ollama")
+        ollama_breaker.record_failure()
+        event_log.emit("ollama.error", level="error", detail="Timeout lors de l'appel à Ollama", timeout=timeout)
         raise Exception("Le service IA ne répond pas (timeout)")
     except requests.RequestException as e:
-        print(f"[ERROR] Ollama: {str(e)}")
-        raise Exception(f"Erreur lors de l'appel à Ollama: {str(e)}")
\ No newline at end of file
+        ollama_breaker.record_failure()
+        event_log.emit("ollama.error", level="error", detail=str(e))
+        raise Exception(f"Erreur lors de l'appel à Ollama: {str(e)}")
+    # Ollama answered: a body we cannot parse is our bug (e.g. a streamed reply), not an outage
+    ollama_breaker.record_success()
+    model_warmer.mark_used()
+    try:
+        data = response.json()
+    except ValueError as e:
+        event_log.emit("ollama.error", level="error", detail=f"réponse invalide: {str(e)}")
+        raise Exception(f"Réponse invalide d'Ollama: {str(e)}")
+    # Selon la version d'Ollama, la clé peut être 'response' ou 'message'
+    return data.get("response") or data.get("message") or str(data)
+
+def generate_response(message: str, context_chunks: Optional[List[str]] = None,
+                      history: Optional[List[Tuple[str, str]]] = None, summary: str = "",
+                      keep_alive: Optional[str] = None, timeout: float = OLLAMA_TIMEOUT,
+                      num_predict: Optional[int] = None) -> str:
+    # Fit system prompt, summary, chunks and history into the token budget and cap generation length
+    built = get_prompt_builder().build(message, context_chunks, history, summary)
+    if num_predict is not None:
+        # Longer answers (background jobs): whatever the prompt leaves of the context window
+        built.options["num_predict"] = min(num_predict, built.options["num_ctx"] - built.prompt_tokens)
+    payload = {
+        "model": OLLAMA_MODEL,
+        "system": built.system,
+        "prompt": built.prompt,
+        "options": built.options,
+        "stream": False,
+    }
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    event_log.emit("ollama.request", message=message, used_chunks=built.used_chunks,
+                   dropped_chunks=built.dropped_chunks, prompt_tokens=built.prompt_tokens,
+                   history_turns=built.history_turns, num_predict=built.options["num_predict"], stream=False)
+    return _call_ollama(payload, timeout)
+
+async def stream_response(message: str, context_chunks: Optional[List[str]] = None,
+                          history: Optional[List[Tuple[str, str]]] = None, summary: str = "",
+                          keep_alive: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Streaming variant of generate_response: yields the answer piece by piece as Ollama generates it.
+    Closing the generator early closes the HTTP stream, which makes Ollama stop generating.
+    """
+    built = get_prompt_builder().build(message, context_chunks, history, summary)
+    payload = {
+        "model": OLLAMA_MODEL,
+        "system": built.system,
+        "prompt": built.prompt,
+        "options": built.options,
+        "stream": True,
+        "keep_alive": keep_alive or model_warmer.current_keep_alive(),
+    }
+    event_log.emit("ollama.request", message=message, used_chunks=built.used_chunks,
+                   dropped_chunks=built.dropped_chunks, prompt_tokens=built.prompt_tokens,
+                   history_turns=built.history_turns, num_predict=built.options["num_predict"], stream=True)
+    ollama_breaker.before_call()
+    finished = False
+    try:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(OLLAMA_TIMEOUT)) as client:
+            async with client.stream("POST", OLLAMA_URL, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    piece = data.get("response") or ""
+                    if piece:
+                        yield piece
+                    if data.get("done"):
+                        break
+        finished = True
+        ollama_breaker.record_success()
+        model_warmer.mark_used()
+    except httpx.TimeoutException:
+        finished = True
+        ollama_breaker.record_failure()
+        event_log.emit("ollama.error", level="error", detail="Timeout lors de l'appel à Ollama", stream=True)
+        raise Exception("Le service IA ne répond pas (timeout)")
+    except httpx.HTTPError as e:
+        finished = True
+        ollama_breaker.record_failure()
+        event_log.emit("ollama.error", level="error", detail=str(e), stream=True)
+        raise Exception(f"Erreur lors de l'appel à Ollama: {str(e)}")
+    except ValueError as e:
+        finished = True
+        ollama_breaker.record_success()  # Ollama answered; the unparseable line is not an outage
+        event_log.emit("ollama.error", level="error", detail=f"réponse invalide: {str(e)}", stream=True)
+        raise Exception(f"Réponse invalide d'Ollama: {str(e)}")
+    finally:
+        if not finished:
+            # Cancelled by the client (new message, closed tab)
+            ollama_breaker.record_cancelled()
+
+def summarize_conversation(previous_summary: str, turns: List[Tuple[str, str]], max_tokens: int = 200) -> str:
+    """Folds older conversation turns into the rolling summary of a session."""
+    lines = "\n".join(f"{'Utilisateur' if role == 'user' else 'Assistant'} : {text}" for role, text in turns)
+    prompt = (
+        "Mets à jour le résumé de cette conversation avec les nouveaux échanges. "
+        "Garde les faits, questions et réponses utiles pour la suite, en quelques phrases.\n\n"
+        f"Résumé actuel :\n{previous_summary or '(vide)'}\n\n"
+        f"Nouveaux échanges :\n{lines}\n\n"
+        "Nouveau résumé :"
+    )
+    builder = get_prompt_builder()
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": builder.tokenizer.truncate(prompt, builder.max_prompt_tokens),
+        "options": {"num_ctx": builder.num_ctx, "num_predict": max_tokens},
+    }
+    return _call_ollama(payload).strip()
@@ -0,0 +1,257 @@
+"""
+Answers generated off-peak for anticipated questions, served by semantic similarity.
+
+The batch job takes a question list and/or the questions of the event log that reached the LLM,
+answers each with the usual retrieval + generation through a bounded pool of workers, and writes:
+    answers.json    embedding model, creation time and one {"question", "answer", "created_at"} entry per question
+    questions.npy   float32 matrix of the L2-normalized question embeddings, one row per entry
+
+Usage (from the backend directory, e.g. from a nightly cron job):
+    python -m src.precomputed_answers --questions data/anticipated_questions.txt
+    python -m src.precomputed_answers --from-log --since-hours 168 --min-count 3 --concurrency 2
+
+The chat pipeline reloads the files when they change; a standalone message whose embedding is close
+enough to a stored question gets the stored answer without calling the LLM.
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .answer_cache import normalize_message
+from .embedding_server import EMBEDDING_MODEL
+
+PRECOMPUTED_DIR = Path(os.getenv("PRECOMPUTED_DIR", str(Path(__file__).parent / "data" / "precomputed")))
+# Cosine similarity between a message and a stored question above which the stored answer is served.
+# Paraphrases of the same question usually score above 0.85; related but different questions rarely do.
+PRECOMPUTED_MIN_SIMILARITY = float(os.getenv("PRECOMPUTED_MIN_SIMILARITY", "0.88"))
+# Answers older than this are neither served nor kept when the job runs again (the corpus moves on)
+PRECOMPUTED_MAX_AGE_DAYS = float(os.getenv("PRECOMPUTED_MAX_AGE_DAYS", "14"))
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "2"))
+PRECOMPUTE_TIMEOUT = float(os.getenv("PRECOMPUTE_TIMEOUT", "300"))
+PRECOMPUTE_NUM_PREDICT = int(os.getenv("PRECOMPUTE_NUM_PREDICT", "512"))
+ANSWERS_FILE = "answers.json"
+VECTORS_FILE = "questions.npy"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def read_store(directory: Path) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Reads the stored entries and question vectors; an absent, damaged or mismatched store is empty.
+    Entries past PRECOMPUTED_MAX_AGE_DAYS or embedded with another model are left out.
+    """
+    empty: Tuple[List[Dict[str, Any]], np.ndarray] = ([], np.empty((0, 0), dtype=np.float32))
+    try:
+        data = json.loads((directory / ANSWERS_FILE).read_text(encoding="utf-8"))
+        vectors = np.load(directory / VECTORS_FILE)
+    except FileNotFoundError:
+        return empty
+    except Exception as e:
+        print(f"[ERROR] Could not load precomputed answers from {directory}: {e}")
+        return empty
+    entries = data.get("entries", [])
+    if data.get("model") != EMBEDDING_MODEL or vectors.shape[0] != len(entries):
+        print(f"[WARN] Ignoring precomputed answers in {directory}: built with model '{data.get('model')}' "
+              f"({vectors.shape[0]} vectors for {len(entries)} entries).")
+        return empty
+    oldest = time.time() - PRECOMPUTED_MAX_AGE_DAYS * 86400
+    keep = [i for i, entry in enumerate(entries) if entry.get("created_at", 0) >= oldest]
+    return [entries[i] for i in keep], np.asarray(vectors[keep], dtype=np.float32)
+
+
+def write_store(directory: Path, entries: List[Dict[str, Any]], vectors: np.ndarray) -> None:
+    """Replaces the store; each file is written to a temporary name and renamed, answers.json last."""
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_vectors = directory / (VECTORS_FILE + ".tmp")
+    with tmp_vectors.open("wb") as f:
+        np.save(f, np.asarray(vectors, dtype=np.float32))
+    os.replace(tmp_vectors, directory / VECTORS_FILE)
+    tmp_answers = directory / (ANSWERS_FILE + ".tmp")
+    tmp_answers.write_text(json.dumps({"model": EMBEDDING_MODEL, "created_at": time.time(), "entries": entries},
+                                      ensure_ascii=False, indent=1), encoding="utf-8")
+    # Readers reload on the answers file, so it is replaced after the vectors it describes
+    os.replace(tmp_answers, directory / ANSWERS_FILE)
+
+
+class PrecomputedAnswers:
+    """
+    Read side of the store: nearest stored question to a query embedding, reloaded when the job rewrites it.
+    """
+    def __init__(self, directory: Path = PRECOMPUTED_DIR, min_similarity: float = PRECOMPUTED_MIN_SIMILARITY):
+        """
+        Args:
+            directory (Path): Directory written by the batch job.
+            min_similarity (float): Minimum cosine similarity between the message and a stored question.
+        """
+        self.directory = Path(directory)
+        self.min_similarity = min_similarity
+        self._entries: List[Dict[str, Any]] = []
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self.reload_if_changed()
+
+    def reload_if_changed(self) -> None:
+        try:
+            mtime = (self.directory / ANSWERS_FILE).stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            entries, vectors = read_store(self.directory)
+            with self._lock:
+                self._entries, self._vectors, self._mtime = entries, vectors, mtime
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, query_vector: Sequence[float]) -> Optional[Tuple[str, float]]:
+        """
+        Returns (answer, similarity) for the stored question closest to the query embedding,
+        or None if none reaches min_similarity.
+        """
+        with self._lock:
+            entries, vectors = self._entries, self._vectors
+        if not entries:
+            return None
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape[-1] != vectors.shape[1]:
+            return None
+        similarities = vectors @ _normalize(query)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.min_similarity:
+            return None
+        return entries[best]["answer"], float(similarities[best])
+
+
+def logged_questions(events: Iterable[Dict[str, Any]], min_count: int = 2, limit: int = 500) -> List[str]:
+    """
+    Standalone questions of the event log that needed the LLM (or failed over to a degraded answer),
+    asked at least min_count times, most frequent first.
+    """
+    counts: Dict[str, int] = {}
+    latest: Dict[str, str] = {}
+    for event in events:
+        if event.get("in_conversation") or not event.get("message") or event.get("source") not in ("ai", "degraded"):
+            continue
+        key = normalize_message(event["message"])
+        counts[key] = counts.get(key, 0) + 1
+        latest[key] = event["message"]
+    ranked = sorted((key for key in counts if counts[key] >= min_count), key=lambda key: counts[key], reverse=True)
+    return [latest[key] for key in ranked[:limit]]
+
+
+def read_questions(path: Path) -> List[str]:
+    """One question per line; lines starting with '#' are comments. A .jsonl file is read for its "message" field."""
+    lines = [line.strip() for line in path.read_text(encoding="utf-8").splitlines()]
+    if path.suffix == ".jsonl":
+        return [json.loads(line)["message"] for line in lines if line]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+async def generate_answers(questions: List[str], retriever, reranker, concurrency: int = PRECOMPUTE_CONCURRENCY,
+                           timeout: float = PRECOMPUTE_TIMEOUT,
+                           num_predict: int = PRECOMPUTE_NUM_PREDICT) -> Dict[str, str]:
+    """
+    Answers the questions with retrieval + generation, at most `concurrency` at a time.
+
+    Returns:
+        Dict[str, str]: Answer per question; failed questions are left out (and reported).
+    """
+    from .ollama import generate_response  # only the batch job calls the LLM from here
+
+    semaphore = asyncio.Semaphore(concurrency)
+    answers: Dict[str, str] = {}
+
+    async def answer_one(index: int, question: str) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                hits = await reranker.rerank(question, await retriever.retrieve(question, limit=retriever.candidates))
+                chunks = [hit["payload"]["text_chunk"] for hit in hits
+                          if hit.get("payload") and hit["payload"].get("text_chunk")]
+                answer = await asyncio.to_thread(generate_response, question, chunks,
+                                                 timeout=timeout, num_predict=num_predict)
+            except Exception as e:
+                print(f"[{index + 1}/{len(questions)}] failed: {question!r}: {e}")
+                return
+            if answer:
+                answers[question] = answer
+                print(f"[{index + 1}/{len(questions)}] {time.perf_counter() - started:.1f}s: {question!r}")
+
+    await asyncio.gather(*(answer_one(i, question) for i, question in enumerate(questions)))
+    return answers
+
+
+async def precompute(questions: List[str], directory: Path = PRECOMPUTED_DIR,
+                     concurrency: int = PRECOMPUTE_CONCURRENCY, replace: bool = False) -> int:
+    """
+    Generates answers for the questions a rule does not already answer and merges them into the store
+    (a regenerated question replaces its previous answer). Returns the number of stored entries.
+    """
+    from .reranker import CrossEncoderReranker
+    from .retriever import create_retriever
+    from .rules_manager import RulesManager
+
+    rules_manager = RulesManager()
+    unique: Dict[str, str] = {}
+    for question in questions:
+        unique.setdefault(normalize_message(question), question)
+    pending = [question for question in unique.values() if not rules_manager.find_matching_rule(question)]
+    print(f"{len(unique)} distinct questions, {len(unique) - len(pending)} answered by rules, "
+          f"{len(pending)} to generate with {concurrency} workers.")
+
+    retriever = create_retriever()
+    answers = await generate_answers(pending, retriever, CrossEncoderReranker(), concurrency)
+    new_questions = list(answers)
+    new_vectors = retriever.embedding_manager.generate_embeddings(new_questions) if new_questions else None
+    if new_questions and new_vectors is None:
+        raise RuntimeError("Could not embed the questions; the store is left unchanged.")
+
+    entries, vectors = ([], None) if replace else read_store(directory)
+    regenerated = {normalize_message(question) for question in new_questions}
+    keep = [i for i, entry in enumerate(entries) if normalize_message(entry["question"]) not in regenerated]
+    now = time.time()
+    merged = [entries[i] for i in keep] + [
+        {"question": question, "answer": answers[question], "created_at": now} for question in new_questions
+    ]
+    parts = [vectors[keep]] if keep else []
+    if new_questions:
+        parts.append(_normalize(np.asarray(new_vectors, dtype=np.float32)))
+    write_store(directory, merged, np.concatenate(parts) if parts else np.empty((0, 0), dtype=np.float32))
+    print(f"Generated {len(new_questions)}/{len(pending)} answers; {len(merged)} precomputed answers stored in {directory}.")
+    return len(merged)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate answers for anticipated questions off-peak.")
+    parser.add_argument("--questions", type=Path, action="append", default=[],
+                        help="Question file (one per line, or .jsonl with a 'message' field). Repeatable.")
+    parser.add_argument("--from-log", action="store_true", help="Also use questions of the event log that reached the LLM.")
+    parser.add_argument("--since-hours", type=float, default=168.0)
+    parser.add_argument("--min-count", type=int, default=2)
+    parser.add_argument("--limit", type=int, default=500, help="Maximum number of questions mined from the log.")
+    parser.add_argument("--concurrency", type=int, default=PRECOMPUTE_CONCURRENCY)
+    parser.add_argument("--dir", type=Path, default=PRECOMPUTED_DIR)
+    parser.add_argument("--replace", action="store_true", help="Drop the answers not regenerated by this run.")
+    args = parser.parse_args()
+
+    all_questions: List[str] = []
+    for question_file in args.questions:
+        all_questions.extend(read_questions(question_file))
+    if args.from_log:
+        from .event_log import event_log
+        since = time.time() - args.since_hours * 3600
+        all_questions.extend(logged_questions(event_log.read(["chat.answer"], since), args.min_count, args.limit))
+    if not all_questions:
+        raise SystemExit("No questions: pass --questions and/or --from-log.")
+    asyncio.run(precompute(all_questions, args.dir, max(1, args.concurrency), args.replace))
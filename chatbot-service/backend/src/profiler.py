@@ -0,0 +1,209 @@
+import asyncio
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+from .metrics import metrics
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_DEFAULT_INTERVAL_MS = float(os.getenv("PROFILE_DEFAULT_INTERVAL_MS", "5"))
+PROFILE_MAX_DEPTH = 128
+
+# Leaf frames (file, function) of threads parked waiting for work; their stacks say nothing about where CPU goes
+IDLE_FRAMES = {
+    ("selectors.py", "select"),  # event loop waiting for I/O
+    ("thread.py", "_worker"),  # idle asyncio.to_thread / executor worker
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+}
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profiling run is requested while another one is in progress."""
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    # Keep the project-relative part of our files and the module name of library files
+    marker = os.sep + "src" + os.sep
+    if marker in filename:
+        filename = "src/" + filename.rsplit(marker, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _fold_stack(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the Python stacks of every thread from a background thread.
+
+    Nothing is hooked into the interpreter: the cost is one sys._current_frames() walk per
+    interval, and zero while the profiler is stopped. Stacks are aggregated in the collapsed
+    ("folded") format read by flamegraph.pl, inferno and speedscope.
+    """
+    def __init__(self, interval: float = PROFILE_DEFAULT_INTERVAL_MS / 1000.0, include_idle: bool = False):
+        """
+        Args:
+            interval (float): Seconds between samples.
+            include_idle (bool): Keep stacks of threads waiting for work (event loop selector, idle pool workers).
+        """
+        self.interval = max(0.001, interval)
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # Samples are only recorded while this returns True (request-scoped profiling)
+        self.should_sample = lambda: True
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            self.stacks[_fold_stack(frame)] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if self.should_sample():
+                self._sample()
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self) -> str:
+        """Aggregated stacks, one "frame;frame;frame count" line each, hottest first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestFilter:
+    """Selects the next count HTTP requests whose path starts with path_prefix (and method, if given)."""
+    def __init__(self, count: int, path_prefix: str = "/", method: Optional[str] = None):
+        self.remaining = count
+        self.path_prefix = path_prefix
+        self.method = method.upper() if method else None
+        self.in_flight = 0
+        self.matched = 0
+        self.finished = asyncio.Event()
+
+    def claim(self, scope: Dict) -> bool:
+        """Returns True if the request is one of those to profile, and counts it."""
+        if self.remaining <= 0 or scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            return False
+        if self.method and scope["method"] != self.method:
+            return False
+        self.remaining -= 1
+        self.matched += 1
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        if self.remaining <= 0 and self.in_flight == 0:
+            self.finished.set()
+
+
+class ProfilerController:
+    """Runs one profiling session at a time, either for a duration or over a set of matching requests."""
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        # Read by ProfilingMiddleware on every request: None whenever request profiling is not armed
+        self.request_filter: Optional[RequestFilter] = None
+
+    def _check_available(self) -> None:
+        if self._lock.locked():
+            raise ProfilerBusy("A profiling session is already running")
+
+    async def profile_for(self, seconds: float, interval: float, include_idle: bool = False) -> SamplingProfiler:
+        """
+        Samples the whole process for the given number of seconds (capped at PROFILE_MAX_SECONDS).
+
+        Raises:
+            ProfilerBusy: If another session is running.
+        """
+        self._check_available()
+        async with self._lock:
+            profiler = SamplingProfiler(interval, include_idle)
+            profiler.start()
+            try:
+                await asyncio.sleep(min(seconds, PROFILE_MAX_SECONDS))
+            finally:
+                profiler.stop()
+            metrics.inc("profiles_total", mode="duration")
+            return profiler
+
+    async def profile_requests(self, request_filter: RequestFilter, timeout: float, interval: float,
+                               include_idle: bool = False) -> SamplingProfiler:
+        """
+        Samples the process only while one of the next matching requests is being handled, until they
+        have all finished or timeout seconds (capped at PROFILE_MAX_SECONDS) have passed.
+
+        Other work running concurrently on the same process shows up too; profile under
+        representative load, or with a narrow filter, to keep it small.
+
+        Raises:
+            ProfilerBusy: If another session is running.
+        """
+        self._check_available()
+        async with self._lock:
+            profiler = SamplingProfiler(interval, include_idle)
+            profiler.should_sample = lambda: request_filter.in_flight > 0
+            self.request_filter = request_filter
+            profiler.start()
+            try:
+                await asyncio.wait_for(request_filter.finished.wait(), min(timeout, PROFILE_MAX_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.request_filter = None
+                profiler.stop()
+            metrics.inc("profiles_total", mode="requests")
+            return profiler
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware marking the requests selected by an armed RequestFilter.
+
+    When no request profiling is armed it is a single attribute check per request.
+    """
+    def __init__(self, app, controller: ProfilerController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        request_filter = self.controller.request_filter
+        if request_filter is None or not request_filter.claim(scope):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_filter.release()
+
+
+profiler_controller = ProfilerController()
@@ -0,0 +1,204 @@
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .metrics import metrics
+
+# Hugging Face tokenizer matching the Ollama model (e.g. "meta-llama/Meta-Llama-3-8B-Instruct").
+# Empty: a character/word heuristic is used, which errs on the side of over-counting.
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "")
+# Context window passed to Ollama. Kept identical on every request: changing num_ctx makes Ollama reload the model.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "2048"))
+# Upper bound on generated tokens, which bounds generation time.
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "256"))
+# Prompt budget (system + context + history + question). Defaults to what is left of the window after generation.
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", str(OLLAMA_NUM_CTX - OLLAMA_NUM_PREDICT)))
+# A chunk truncated below this many tokens is dropped rather than sent as a fragment.
+PROMPT_MIN_CHUNK_TOKENS = int(os.getenv("PROMPT_MIN_CHUNK_TOKENS", "48"))
+
+SYSTEM_PROMPT = os.getenv(
+    "SYSTEM_PROMPT",
+    "Tu es l'assistant de l'École Supérieure de Technologie de Salé. "
+    "Réponds en français, de façon concise et exacte.",
+)
+
+
+class HeuristicTokenizer:
+    """
+    Approximate token counts without the model's vocabulary.
+    Words and punctuation are counted separately and long words count as several tokens,
+    which slightly over-estimates for French text so budgets stay on the safe side.
+    """
+    _pieces = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+    def count(self, text: str) -> int:
+        return sum(max(1, math.ceil(len(piece) / 4)) for piece in self._pieces.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        total = 0
+        for match in self._pieces.finditer(text):
+            total += max(1, math.ceil(len(match.group()) / 4))
+            if total > max_tokens:
+                return text[:match.start()].rstrip()
+        return text
+
+
+class HFTokenizer:
+    """Exact token counts with the Hugging Face tokenizer of the served model."""
+    def __init__(self, name: str):
+        from transformers import AutoTokenizer  # installed with sentence-transformers
+        self._tokenizer = AutoTokenizer.from_pretrained(name)
+
+    def count(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        ids = self._tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) <= max_tokens:
+            return text
+        return self._tokenizer.decode(ids[:max_tokens], skip_special_tokens=True).rstrip()
+
+
+def load_tokenizer(name: str = PROMPT_TOKENIZER):
+    """Returns the model tokenizer if configured and loadable, else the heuristic one."""
+    if name:
+        try:
+            tokenizer = HFTokenizer(name)
+            print(f"[INFO] Prompt tokenizer '{name}' loaded.")
+            return tokenizer
+        except Exception as e:
+            print(f"[WARN] Could not load prompt tokenizer '{name}', using heuristic counts: {e}")
+    return HeuristicTokenizer()
+
+
+class BuiltPrompt:
+    """A prompt fitted to the token budget, ready to send to Ollama."""
+    def __init__(self, system: str, prompt: str, options: Dict[str, Any], prompt_tokens: int,
+                 used_chunks: int, dropped_chunks: int, truncated_chunks: int, history_turns: int):
+        self.system = system
+        self.prompt = prompt
+        self.options = options
+        self.prompt_tokens = prompt_tokens
+        self.used_chunks = used_chunks
+        self.dropped_chunks = dropped_chunks
+        self.truncated_chunks = truncated_chunks
+        self.history_turns = history_turns
+
+
+def render_prompt(message: str, context_chunks: Sequence[str], history: Sequence[Tuple[str, str]],
+                  summary: str = "") -> str:
+    """Lays out the conversation so far, retrieved chunks and the question so the model answers from our documents."""
+    parts = []
+    if summary:
+        parts.append(f"Résumé de la conversation :\n{summary}")
+    if history:
+        lines = "\n".join(f"{'Utilisateur' if role == 'user' else 'Assistant'} : {text}" for role, text in history)
+        parts.append(f"Conversation précédente :\n{lines}")
+    if context_chunks:
+        context = "\n\n".join(f"[{i}] {chunk}" for i, chunk in enumerate(context_chunks, start=1))
+        parts.append(
+            "Réponds à la question en t'appuyant uniquement sur le contexte suivant. "
+            "Si le contexte ne contient pas la réponse, dis-le.\n\n"
+            f"Contexte :\n{context}"
+        )
+    if not parts:
+        return message
+    parts.append(f"Question : {message}\nRéponse :")
+    return "\n\n".join(parts)
+
+
+class PromptBuilder:
+    """
+    Fits the system prompt, retrieved chunks and conversation history into a token budget.
+
+    The question, system prompt and conversation summary are always kept. Chunks are taken best-first;
+    the first one that does not fit is truncated (if enough room is left) and lower-ranked ones are dropped.
+    History fills the remaining room, most recent turns first.
+    """
+    def __init__(self, tokenizer=None, max_prompt_tokens: int = PROMPT_MAX_TOKENS, num_ctx: int = OLLAMA_NUM_CTX,
+                 num_predict: int = OLLAMA_NUM_PREDICT, system_prompt: str = SYSTEM_PROMPT):
+        """
+        Args:
+            tokenizer: Object with count(text) and truncate(text, max_tokens); see load_tokenizer().
+            max_prompt_tokens (int): Budget for everything sent to the model.
+            num_ctx (int): Context window requested from Ollama.
+            num_predict (int): Maximum number of generated tokens.
+            system_prompt (str): Instructions sent as the Ollama system prompt.
+        """
+        self.tokenizer = tokenizer or load_tokenizer()
+        self.max_prompt_tokens = min(max_prompt_tokens, num_ctx - num_predict)
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.system_prompt = system_prompt
+        # Tokens the template adds around the parts (instructions, headers, separators)
+        self.template_overhead = self.tokenizer.count(render_prompt("", [""], [("user", "")], " "))
+
+    def build(self, message: str, context_chunks: Optional[List[str]] = None,
+              history: Optional[List[Tuple[str, str]]] = None, summary: str = "") -> BuiltPrompt:
+        """
+        Args:
+            message (str): The user question.
+            context_chunks (Optional[List[str]]): Retrieved chunks, best first.
+            history (Optional[List[Tuple[str, str]]]): Previous (role, text) turns, oldest first.
+            summary (str): Rolling summary of the turns no longer kept in history.
+
+        Returns:
+            BuiltPrompt: The fitted prompt with per-request Ollama options.
+        """
+        context_chunks = context_chunks or []
+        history = history or []
+        count = self.tokenizer.count
+
+        # The question is never dropped, but an oversized paste is cut to half the budget
+        message = self.tokenizer.truncate(message, self.max_prompt_tokens // 2)
+        summary = self.tokenizer.truncate(summary, self.max_prompt_tokens // 4)
+        remaining = (self.max_prompt_tokens - count(self.system_prompt) - count(message) - count(summary)
+                     - self.template_overhead)
+
+        kept_chunks: List[str] = []
+        truncated = 0
+        for chunk in context_chunks:
+            cost = count(chunk) + 4
+            if cost <= remaining:
+                kept_chunks.append(chunk)
+                remaining -= cost
+                continue
+            if remaining - 4 >= PROMPT_MIN_CHUNK_TOKENS:
+                kept_chunks.append(self.tokenizer.truncate(chunk, remaining - 4))
+                truncated += 1
+            remaining = 0
+            break
+
+        kept_history: List[Tuple[str, str]] = []
+        for role, text in reversed(history):
+            cost = count(text) + 4
+            if cost > remaining:
+                break
+            kept_history.insert(0, (role, text))
+            remaining -= cost
+
+        prompt = render_prompt(message, kept_chunks, kept_history, summary)
+        prompt_tokens = count(self.system_prompt) + count(prompt)
+        dropped = len(context_chunks) - len(kept_chunks)
+
+        metrics.observe("prompt_tokens", prompt_tokens)
+        if dropped:
+            metrics.inc("prompt_chunks_dropped_total", dropped)
+        if truncated:
+            metrics.inc("prompt_chunks_truncated_total", truncated)
+
+        options = {"num_ctx": self.num_ctx, "num_predict": self.num_predict}
+        return BuiltPrompt(self.system_prompt, prompt, options, prompt_tokens, len(kept_chunks), dropped, truncated,
+                           len(kept_history))
+
+
+_prompt_builder: Optional[PromptBuilder] = None
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """Shared builder, created on first use so the tokenizer is only loaded when the AI is called."""
+    global _prompt_builder
+    if _prompt_builder is None:
+        _prompt_builder = PromptBuilder()
+    return _prompt_builder
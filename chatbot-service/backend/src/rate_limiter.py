@@ -0,0 +1,166 @@
+import math
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Tuple
+
+from .event_log import event_log
+from .metrics import metrics
+
+# Budgets per user, as requests per minute and burst size. Every /chat request spends from "chat";
+# requests that reach the LLM also spend from "ai", which is much smaller.
+RATE_LIMIT_CHAT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "30"))
+RATE_LIMIT_CHAT_BURST = float(os.getenv("RATE_LIMIT_CHAT_BURST", "10"))
+RATE_LIMIT_AI_PER_MINUTE = float(os.getenv("RATE_LIMIT_AI_PER_MINUTE", "6"))
+RATE_LIMIT_AI_BURST = float(os.getenv("RATE_LIMIT_AI_BURST", "3"))
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+# Shared store so limits hold across workers, e.g. "redis://redis:6379/0". Empty: per-process buckets.
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a user has exhausted a budget; retry_after is in seconds."""
+    def __init__(self, budget: str, retry_after: float):
+        super().__init__(f"Rate limit '{budget}' exceeded; retry in {retry_after:.1f}s")
+        self.budget = budget
+        self.retry_after = retry_after
+
+
+class LocalBucketStore:
+    """
+    Token buckets held in process memory, striped over independent shards.
+
+    Each shard has its own lock and dictionary, so concurrent requests from different users
+    rarely wait on each other. Also serves as the stand-in for the shared store in tests.
+    Buckets of different budgets share the shards; each remembers when it will be full again.
+    """
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, max_keys_per_shard: int = 10000):
+        # key -> (tokens, updated_at, full_at)
+        self._shards: List[Tuple[threading.Lock, Dict[str, Tuple[float, float, float]]]] = [
+            (threading.Lock(), {}) for _ in range(max(1, shards))
+        ]
+        self.max_keys_per_shard = max_keys_per_shard
+
+    def _shard(self, key: str) -> Tuple[threading.Lock, Dict[str, Tuple[float, float, float]]]:
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        Refills the bucket for the elapsed time and tries to take cost tokens from it.
+
+        Returns:
+            Tuple[bool, float]: Whether the tokens were taken, and otherwise the seconds until they will be.
+        """
+        lock, buckets = self._shard(key)
+        now = time.monotonic()
+        with lock:
+            tokens, updated_at, _ = buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                allowed, retry_after = True, 0.0
+            else:
+                allowed, retry_after = False, (cost - tokens) / rate
+            buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if len(buckets) > self.max_keys_per_shard:
+                self._prune(buckets, now)
+        return allowed, retry_after
+
+    @staticmethod
+    def _prune(buckets: Dict[str, Tuple[float, float, float]], now: float) -> None:
+        # A bucket that has refilled completely carries no information; forget it
+        for key in [k for k, (_, _, full_at) in buckets.items() if full_at <= now]:
+            del buckets[key]
+
+
+class RedisBucketStore:
+    """Token buckets in Redis, updated atomically by a Lua script so all workers share the limits."""
+    SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed, retry_after = 0, 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        """
+        Args:
+            client: A redis.asyncio.Redis client, so the round trip does not block the event loop.
+            prefix (str): Key prefix for the buckets.
+        """
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        allowed, retry_after = await self._script(keys=[self.prefix + key], args=[rate, burst, cost])
+        return bool(int(allowed)), float(retry_after)
+
+
+class RateLimiter:
+    """Per-user token-bucket limits with named budgets."""
+    def __init__(self, store=None, budgets: Dict[str, Tuple[float, float]] = None):
+        """
+        Args:
+            store: LocalBucketStore or RedisBucketStore (default: a new LocalBucketStore).
+            budgets (Dict[str, Tuple[float, float]]): Budget name -> (requests per minute, burst).
+        """
+        self.store = store or LocalBucketStore()
+        self.budgets = budgets or {
+            "chat": (RATE_LIMIT_CHAT_PER_MINUTE, RATE_LIMIT_CHAT_BURST),
+            "ai": (RATE_LIMIT_AI_PER_MINUTE, RATE_LIMIT_AI_BURST),
+        }
+
+    async def acquire(self, budget: str, user_key: str, cost: float = 1.0) -> None:
+        """
+        Spends from a user's budget.
+
+        Raises:
+            RateLimitExceeded: If the budget is exhausted.
+        """
+        per_minute, burst = self.budgets[budget]
+        if per_minute <= 0:
+            return  # budget disabled
+        try:
+            allowed, retry_after = await self.store.take(f"{budget}:{user_key}", per_minute / 60.0, burst, cost)
+        except Exception as e:
+            # A broken shared store must not take the chatbot down with it
+            event_log.emit("rate_limit.store_error", level="error", budget=budget,
+                           detail=f"Rate limiter store failed, allowing request: {e}")
+            metrics.inc("rate_limit_store_errors_total")
+            return
+        if not allowed:
+            metrics.inc("rate_limited_total", budget=budget)
+            raise RateLimitExceeded(budget, retry_after)
+
+
+def retry_after_header(error: RateLimitExceeded) -> Dict[str, str]:
+    """Retry-After header for a 429 response, rounded up to whole seconds."""
+    return {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Builds the limiter from environment configuration, sharing state through Redis when configured."""
+    if RATE_LIMIT_REDIS_URL:
+        try:
+            import redis.asyncio  # optional: only needed for multi-worker limits
+            client = redis.asyncio.Redis.from_url(RATE_LIMIT_REDIS_URL, socket_timeout=0.2)
+            print(f"[INFO] Rate limits shared through {RATE_LIMIT_REDIS_URL}")
+            return RateLimiter(RedisBucketStore(client))
+        except ImportError:
+            print("[WARN] RATE_LIMIT_REDIS_URL is set but the redis package is not installed; using per-process limits.")
+    return RateLimiter()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .event_log import event_log
+from .metrics import metrics
+
+# Empty RERANKER_MODEL disables re-ranking; e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2" enables it.
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+# Each batch skipped for the budget shrinks the cost estimate by this factor, so a few slow calls
+# (model warm-up, a busy host) cannot keep re-ranking off: a later batch probes the real cost again.
+RERANK_SKIP_DECAY = float(os.getenv("RERANK_SKIP_DECAY", "0.9"))
+
+
+class CrossEncoderReranker:
+    """
+    Re-scores retrieved chunks with a small cross-encoder under a hard latency budget.
+    When the budget would be exceeded, the retrieval order is kept unchanged.
+    """
+    def __init__(self, model_name: str = RERANKER_MODEL, budget_ms: float = RERANK_BUDGET_MS, top_n: int = RERANK_TOP_N):
+        """
+        Args:
+            model_name (str): Cross-encoder model name. Empty disables re-ranking.
+            budget_ms (float): Maximum time re-ranking may add to a request.
+            top_n (int): Number of chunks returned (and sent to the LLM).
+        """
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.top_n = top_n
+        self.model = None
+        # Exponentially weighted cost estimate, used to skip batches that cannot fit the budget.
+        self._ms_per_pair: Optional[float] = None
+        self._busy = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+
+        if not model_name:
+            return
+        try:
+            from sentence_transformers import CrossEncoder
+            self.model = CrossEncoder(model_name)
+            print(f"Re-ranking model '{model_name}' loaded (budget: {budget_ms} ms, top {top_n}).")
+        except Exception as e:
+            print(f"Error loading re-ranking model '{model_name}': {e}. Re-ranking disabled.")
+            self.model = None
+
+    def estimate_ms(self, pair_count: int) -> Optional[float]:
+        """Estimated scoring time for a batch, or None before the first measurement."""
+        if self._ms_per_pair is None:
+            return None
+        return self._ms_per_pair * pair_count
+
+    def _record_cost(self, pair_count: int, elapsed_ms: float) -> None:
+        per_pair = elapsed_ms / max(pair_count, 1)
+        if self._ms_per_pair is None:
+            self._ms_per_pair = per_pair
+        else:
+            self._ms_per_pair = 0.8 * self._ms_per_pair + 0.2 * per_pair
+
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        try:
+            return [float(score) for score in self.model.predict([(query, text) for text in texts])]
+        finally:
+            self._busy = False
+
+    async def rerank(self, query: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Re-orders retrieved hits by cross-encoder relevance.
+
+        Args:
+            query (str): The user message.
+            hits (List[Dict[str, Any]]): Retrieved hits (with "payload"["text_chunk"]), best first.
+
+        Returns:
+            List[Dict[str, Any]]: The top_n hits, re-ranked if the budget allowed it,
+            otherwise in their original order.
+        """
+        if self.model is None or len(hits) <= 1:
+            metrics.inc("reranker_requests_total", outcome="disabled" if self.model is None else "single")
+            return hits[:self.top_n]
+
+        estimate = self.estimate_ms(len(hits))
+        if estimate is not None and estimate > self.budget_ms:
+            self._ms_per_pair *= RERANK_SKIP_DECAY
+            metrics.inc("reranker_requests_total", outcome="skipped_budget")
+            return hits[:self.top_n]
+        if self._busy:
+            # A previous batch that overran its budget still holds the model.
+            metrics.inc("reranker_requests_total", outcome="skipped_busy")
+            return hits[:self.top_n]
+
+        texts = [(hit.get("payload") or {}).get("text_chunk", "") for hit in hits]
+        loop = asyncio.get_running_loop()
+        self._busy = True
+        start = time.perf_counter()
+        try:
+            scores = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, self._score, query, texts),
+                timeout=self.budget_ms / 1000.0,
+            )
+        except asyncio.TimeoutError:
+            # Charge the full budget so the estimate makes us back off on similar batches.
+            self._record_cost(len(hits), (time.perf_counter() - start) * 1000.0)
+            metrics.inc("reranker_requests_total", outcome="skipped_timeout")
+            return hits[:self.top_n]
+        except Exception as e:
+            event_log.emit("reranker.error", level="error", detail=f"Re-ranking failed: {e}")
+            metrics.inc("reranker_requests_total", outcome="error")
+            return hits[:self.top_n]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        self._record_cost(len(hits), elapsed_ms)
+        metrics.observe("reranker_latency_ms", elapsed_ms)
+        metrics.inc("reranker_requests_total", outcome="reranked")
+
+        order = sorted(range(len(hits)), key=lambda i: scores[i], reverse=True)
+        reranked = [dict(hits[i], rerank_score=scores[i]) for i in order]
+        if str(reranked[0]["id"]) != str(hits[0]["id"]):
+            metrics.inc("reranker_top_changed_total")
+        return reranked[:self.top_n]
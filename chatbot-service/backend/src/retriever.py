@@ -0,0 +1,157 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .bm25_index import BM25Index, bm25_index_path
+from .embedding_server import create_embedder
+from .event_log import event_log
+from .vector_compression import DimensionReducer, ReducerError, load_reducer
+from .vector_db_manager import VectorDBManager
+
+QDRANT_HOST = os.getenv("QDRANT_HOST", "qdrant_db")
+# Embedded local index directory (e.g. imported with `python -m src.vector_snapshot import`); overrides QDRANT_HOST
+QDRANT_PATH = os.getenv("QDRANT_PATH", "")
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "est_sale_documents")  # alias managed by ingest_data
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "10"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# How often the collection behind the alias is re-resolved to pick up the reducer and BM25 index of a new version
+REDUCER_REFRESH_SECONDS = float(os.getenv("REDUCER_REFRESH_SECONDS", "10"))
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = RRF_K, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Merges ranked result lists with reciprocal rank fusion: score(d) = sum(1 / (k + rank)).
+
+    Args:
+        result_lists (List[List[Dict[str, Any]]]): Ranked results, each with "id" and "payload".
+        k (int): Damping constant; larger values flatten the contribution of top ranks.
+        limit (Optional[int]): Maximum number of fused results to return.
+
+    Returns:
+        List[Dict[str, Any]]: Fused results with "id", "score", "payload" and the per-list "ranks".
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for list_index, results in enumerate(result_lists):
+        for rank, hit in enumerate(results, start=1):
+            doc_id = str(hit["id"])
+            entry = fused.setdefault(doc_id, {"id": doc_id, "score": 0.0, "payload": hit.get("payload"), "ranks": {}})
+            entry["score"] += 1.0 / (k + rank)
+            entry["ranks"][list_index] = rank
+            if entry["payload"] is None:
+                entry["payload"] = hit.get("payload")
+
+    ranked = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+    return ranked[:limit] if limit is not None else ranked
+
+
+class HybridRetriever:
+    """
+    Runs BM25 and vector retrieval concurrently over the ingested chunks and fuses them.
+    """
+    def __init__(self, embedding_manager, vector_db_manager: VectorDBManager, collection_name: str = QDRANT_COLLECTION,
+                 candidates: int = RETRIEVAL_CANDIDATES):
+        """
+        Args:
+            embedding_manager: EmbeddingManager or EmbeddingClient used to embed queries.
+            vector_db_manager (VectorDBManager): Qdrant access for dense retrieval.
+            collection_name (str): The collection (or alias) searched by both retrievers; the BM25 index
+                is the one ingestion wrote for the collection version behind it.
+            candidates (int): Number of candidates fetched from each retriever before fusion.
+        """
+        self.embedding_manager = embedding_manager
+        self.vector_db_manager = vector_db_manager
+        self.collection_name = collection_name
+        self.candidates = candidates
+        self.bm25_index = BM25Index()
+        self._bm25_path: Optional[Path] = None
+        self._bm25_mtime: Optional[float] = None
+        # (collection version behind the alias, its reducer, the error that kept it from loading), swapped
+        # as one tuple so a search never pairs one version's reducer with another version
+        self._live: Optional[Tuple[str, Optional[DimensionReducer], Optional[ReducerError]]] = None
+        self._live_checked_at = float("-inf")
+        self._reload_bm25_if_changed()
+
+    def _current_collection(self) -> Tuple[str, Optional[DimensionReducer], Optional[ReducerError]]:
+        """
+        Collection version behind the alias with its reducer (None for full-size vectors), re-resolved
+        every REDUCER_REFRESH_SECONDS; a reducer that failed to load is retried at the next refresh.
+        """
+        now = time.monotonic()
+        if self._live is None or now - self._live_checked_at >= REDUCER_REFRESH_SECONDS:
+            self._live_checked_at = now
+            live = self.vector_db_manager.get_alias_target(self.collection_name) or self.collection_name
+            if self._live is None or live != self._live[0] or self._live[2] is not None:
+                try:
+                    self._live = (live, load_reducer(self.vector_db_manager, live), None)
+                except ReducerError as e:
+                    self._live = (live, None, e)
+        return self._live
+
+    def _reload_bm25_if_changed(self) -> None:
+        """
+        Follows the alias to the BM25 index of the live version (so a rollback also rolls the lexical
+        index back) and picks up rewrites by ingestion without restarting the service.
+        """
+        path = bm25_index_path(self._current_collection()[0])
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if path != self._bm25_path or mtime != self._bm25_mtime:
+            self.bm25_index = BM25Index.load(path)
+            self._bm25_path, self._bm25_mtime = path, mtime
+
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """Full-size embedding of a query (before any reduction), or None if embedding failed."""
+        return self.embedding_manager.generate_embedding(query)
+
+    def _vector_search(self, query: str, limit: int, query_vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        if query_vector is None:
+            query_vector = self.embed_query(query)
+        if query_vector is None:
+            return []
+        # Search the version the reducer belongs to, not the alias, which may already point elsewhere
+        collection, reducer, error = self._current_collection()
+        if error is not None:
+            raise error
+        if reducer is not None:
+            query_vector = reducer.transform(query_vector).tolist()
+        return self.vector_db_manager.search(collection, query_vector, limit=limit)
+
+    def _lexical_search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        self._reload_bm25_if_changed()
+        return self.bm25_index.search(query, limit=limit)
+
+    async def retrieve(self, query: str, limit: int = RETRIEVAL_TOP_K,
+                       query_vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieves the best chunks for a query.
+
+        Args:
+            query (str): The user message.
+            limit (int): Number of fused results to return.
+            query_vector (Optional[List[float]]): The query embedding, if already computed.
+
+        Returns:
+            List[Dict[str, Any]]: Fused results, best first. Empty if both retrievers fail.
+        """
+        vector_hits, lexical_hits = await asyncio.gather(
+            asyncio.to_thread(self._vector_search, query, self.candidates, query_vector),
+            asyncio.to_thread(self._lexical_search, query, self.candidates),
+            return_exceptions=True,
+        )
+        result_lists = []
+        for name, hits in (("vector", vector_hits), ("lexical", lexical_hits)):
+            if isinstance(hits, Exception):
+                event_log.emit("retrieval.error", level="error", retriever=name, detail=f"{name} retrieval failed: {hits}")
+                hits = []
+            result_lists.append(hits)
+        return reciprocal_rank_fusion(result_lists, limit=limit)
+
+
+def create_retriever() -> HybridRetriever:
+    """Builds the retriever used by the chat endpoint from environment configuration."""
+    return HybridRetriever(create_embedder(), VectorDBManager(host=QDRANT_HOST, path=QDRANT_PATH or None))
@@ -1,16 +1,114 @@
+import hashlib
 import json
-from pathlib import Path
-from typing import Optional, Dict, List
 import re
+import unicodedata
+from pathlib import Path
+from typing import Any, Optional, Dict, List, Set, Tuple
+
+# Word overlap above which a message is considered a rephrasing of a pattern
+SIMILARITY_THRESHOLD = 0.7
+# Trigram similarity above which two words count as the same word despite a typo or another inflection
+WORD_SIMILARITY_THRESHOLD = 0.6
+WORD_FUZZY_MIN_LENGTH = 5  # shorter words must match exactly once stemmed
+# Share of the trigrams of the pattern (or of the message, if shorter) they have in common for the rule
+# to be a candidate. Deliberately loose: it only spares comparing the message with every rule, the
+# word overlap decides the match.
+CANDIDATE_THRESHOLD = 0.3
+# A message of at most this many content words ("filières", "contacter") matches the only rule whose
+# pattern contains all of them, even though it shares few of the pattern's words.
+SHORT_QUERY_WORDS = 2
+# Bumped whenever the snapshot layout or the matching algorithm changes, so clients refetch
+SNAPSHOT_FORMAT = 3
+
+# Elided articles and pronouns (l'inscription, s'inscrire, qu'est-ce) are dropped from the words
+_ELISION = re.compile(r"\b(?:jusqu|lorsqu|puisqu|qu|[cdjlmnst])['’]")
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae"})
+
+
+def fold(text: str) -> str:
+    """Lowercase text without accents or ligatures: "Filières" -> "filieres"."""
+    decomposed = unicodedata.normalize("NFD", text.lower().translate(_LIGATURES))
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def stem(word: str) -> str:
+    """
+    Light French stemming of a folded word: plural, or else -er/-ez verb endings, then a final e.
+    "filieres" -> "filier", "filiers" -> "filier", "inscrire" -> "inscrir", "contactez" -> "contact".
+    """
+    if len(word) > 3 and word[-1] in "sx" and not word.endswith("ss"):
+        word = word[:-1]  # a plural is a noun or adjective: its -er (filier, premier) is not a verb ending
+    elif len(word) > 4 and word[-2:] in ("er", "ez"):
+        word = word[:-2]
+    if len(word) > 3 and word[-1] == "e":
+        word = word[:-1]
+    return word
+
+
+def normalize_words(text: str) -> List[str]:
+    """Stemmed, accent-folded words of a text, without punctuation or elided articles."""
+    return [stem(word) for word in re.findall(r"\w+", _ELISION.sub(" ", fold(text)))]
+
+
+# Function words left out of the word overlap, in normalized form. "est" is kept: it is also the school's name.
+# Lone elision letters cover apostrophes typed as spaces ("s inscrire").
+STOPWORDS = frozenset(normalize_words(
+    "c d j l m n s t qu a au aux avec ce ces comment dans de des du elle en et il je la le les leur ma mes mon ne nous on ou où "
+    "par pas pour quand que quel quelle quelles quels qui quoi sa se ses son sont sur ta te tes ton tu un une "
+    "vos votre vous y"
+))
+
+
+def content_words(words: List[str]) -> List[str]:
+    """Words without stopwords; all of them if nothing else is left."""
+    return [word for word in words if word not in STOPWORDS] or words
+
+
+def word_trigrams(word: str) -> Set[str]:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _words_match(word: str, other: str, trigrams: Set[str], other_trigrams: Set[str]) -> bool:
+    if word == other:
+        return True
+    if min(len(word), len(other)) < WORD_FUZZY_MIN_LENGTH:
+        return False
+    return 2 * len(trigrams & other_trigrams) / (len(trigrams) + len(other_trigrams)) >= WORD_SIMILARITY_THRESHOLD
+
+
+class _IndexedRule:
+    """A rule's normalized pattern, its content words and their trigrams, computed once at load."""
+    def __init__(self, rule: Dict[str, str]):
+        words = normalize_words(rule['pattern'])
+        self.pattern = rule['pattern']
+        self.answer = rule['answer']
+        self.text = " ".join(words)
+        self.words = sorted(set(content_words(words)))
+        self.word_trigrams = {word: word_trigrams(word) for word in self.words}
+        self.trigrams = set().union(*self.word_trigrams.values()) if self.words else set()
+
 
 class RulesManager:
+    """
+    FAQ rules matched against messages in a typo- and accent-tolerant way.
+
+    Patterns and messages are accent-folded and lightly stemmed, and compared on their content words.
+    A character-trigram index over the patterns yields the candidate rules for a message, so lookups
+    do not compare it with every rule. A candidate matches if its pattern is contained in the message,
+    if enough of their words match (exactly once stemmed, or by trigram similarity for longer words),
+    or if the message is a short query whose words are all found in that rule's pattern and no other.
+    """
     def __init__(self, rules_file: str = "data/rules.json"):
         self.rules_file = Path(__file__).parent / rules_file
         self.rules: List[Dict[str, str]] = []
+        self._indexed: List[_IndexedRule] = []
+        self._trigram_index: Dict[str, List[int]] = {}
+        self._snapshot: Optional[Dict[str, Any]] = None
         self.load_rules()
 
     def load_rules(self) -> None:
-        """Load rules from JSON file."""
+        """Load rules from JSON file and rebuild the trigram index."""
         try:
             with open(self.rules_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -18,41 +116,110 @@ class RulesManager:
         except Exception as e:
             print(f"Error loading rules: {e}")
             self.rules = []
+        self._indexed = [_IndexedRule(rule) for rule in self.rules]
+        self._trigram_index = {}
+        for position, rule in enumerate(self._indexed):
+            for trigram in rule.trigrams:
+                self._trigram_index.setdefault(trigram, []).append(position)
+        self._snapshot = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Compact, precompiled form of the rules for client-side matching.
+
+        Each rule carries its original pattern ("q"), the normalized pattern ("p", stemmed words
+        joined by spaces), its distinct content words ("w") and its answer ("a"); the client
+        builds the trigram index from the words. The version is a hash of the content, usable as an ETag.
+        """
+        if self._snapshot is None:
+            rules = [{"q": rule.pattern, "p": rule.text, "w": rule.words, "a": rule.answer} for rule in self._indexed]
+            body = {
+                "format": SNAPSHOT_FORMAT,
+                "threshold": SIMILARITY_THRESHOLD,
+                "word_threshold": WORD_SIMILARITY_THRESHOLD,
+                "word_fuzzy_min_length": WORD_FUZZY_MIN_LENGTH,
+                "candidate_threshold": CANDIDATE_THRESHOLD,
+                "short_query_words": SHORT_QUERY_WORDS,
+                "stopwords": sorted(STOPWORDS),
+                "rules": rules,
+            }
+            canonical = json.dumps(body, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+            body["version"] = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+            self._snapshot = body
+        return self._snapshot
+
+    def _candidates(self, trigrams: Set[str], min_overlap: float) -> List[int]:
+        """
+        Rules sharing at least min_overlap of the trigrams of the smaller side (pattern or message)
+        with the message (any shared trigram, if 0), in rules.json order.
+        """
+        shared: Dict[int, int] = {}
+        for trigram in trigrams:
+            for position in self._trigram_index.get(trigram, ()):
+                shared[position] = shared.get(position, 0) + 1
+        return sorted(position for position, count in shared.items()
+                      if count >= min_overlap * min(len(trigrams), len(self._indexed[position].trigrams)))
+
+    def _best_candidate(self, message: str, min_overlap: float) -> Optional[Tuple[float, _IndexedRule]]:
+        """
+        Candidate rule most similar to the message, with its similarity; a contained pattern scores 2,
+        a short query covered by a single rule 1. Ties go to the rule listed first in rules.json.
+        """
+        words = normalize_words(message)
+        if not words:
+            return None
+        text = f" {' '.join(words)} "
+        message_trigrams = {word: word_trigrams(word) for word in set(content_words(words))}
+        all_trigrams = set().union(*message_trigrams.values())
+        scored: List[Tuple[float, int]] = []
+        covering: List[int] = []
+        for position in self._candidates(all_trigrams, min_overlap):
+            rule = self._indexed[position]
+            if rule.text and f" {rule.text} " in text:
+                scored.append((2.0, position))
+                continue
+            common, covered = self._overlap(message_trigrams, rule)
+            scored.append((common / max(len(message_trigrams), len(rule.words)), position))
+            if covered:
+                covering.append(position)
+        if len(message_trigrams) <= SHORT_QUERY_WORDS and len(covering) == 1:
+            scored = [(max(score, 1.0), position) if position == covering[0] else (score, position)
+                      for score, position in scored]
+        if not scored:
+            return None
+        score, position = max(scored, key=lambda c: (c[0], -c[1]))
+        return score, self._indexed[position]
 
     def find_matching_rule(self, message: str) -> Optional[str]:
         """
         Find a matching rule for the given message.
-        Returns the answer if a match is found, None otherwise.
-        """
-        message = message.lower().strip()
-        
-        for rule in self.rules:
-            pattern = rule['pattern'].lower()
-            # Check for exact match or if pattern is contained in message
-            if pattern == message or pattern in message:
-                return rule['answer']
-            
-            # Check for similar patterns using fuzzy matching
-            if self._is_similar(message, pattern):
-                return rule['answer']
-        
-        return None
-
-    def _is_similar(self, message: str, pattern: str) -> bool:
-        """
-        Check if message is similar to pattern using basic fuzzy matching.
-        This can be enhanced with more sophisticated matching algorithms.
-        """
-        # Remove punctuation and extra spaces
-        message = re.sub(r'[^\w\s]', '', message)
-        pattern = re.sub(r'[^\w\s]', '', pattern)
-        
-        # Split into words
-        message_words = set(message.split())
-        pattern_words = set(pattern.split())
-        
-        # Check if most words match
-        common_words = message_words.intersection(pattern_words)
-        similarity = len(common_words) / max(len(message_words), len(pattern_words))
-        
-        return similarity > 0.7 
\ No newline at end of file
+        Returns the answer of the best match (contained pattern first, then highest word overlap), None otherwise.
+        """
+        best = self._best_candidate(message, CANDIDATE_THRESHOLD)
+        return best[1].answer if best and best[0] > SIMILARITY_THRESHOLD else None
+
+    def find_closest_rule(self, message: str, min_similarity: float = 0.3) -> Optional[str]:
+        """
+        Find the rule whose pattern is most similar to the message, even below the matching threshold.
+        Used to build a degraded answer when the AI service is unavailable.
+        Returns the answer of the closest rule, or None if no rule reaches min_similarity.
+        """
+        best = self._best_candidate(message, 0.0)
+        return best[1].answer if best and best[0] >= min_similarity else None
+
+    @staticmethod
+    def _overlap(message_trigrams: Dict[str, Set[str]], rule: _IndexedRule) -> Tuple[int, bool]:
+        """
+        Number of pattern words matched by some message word (see _words_match), and whether every
+        message word matches some pattern word.
+        """
+        matched = {
+            word for word, trigrams in rule.word_trigrams.items()
+            for other, other_trigrams in message_trigrams.items()
+            if _words_match(word, other, trigrams, other_trigrams)
+        }
+        covered = all(
+            any(_words_match(word, other, trigrams, other_trigrams) for word, trigrams in rule.word_trigrams.items())
+            for other, other_trigrams in message_trigrams.items()
+        )
+        return len(matched), covered
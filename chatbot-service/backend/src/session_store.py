@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Set, Tuple
+
+from .event_log import event_log
+from .metrics import metrics
+
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+# SQLite file for sessions that survive restarts and LRU eviction. Empty: memory only.
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "")
+# History kept verbatim; older turns are folded into the rolling summary.
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "512"))
+# Most recent turns never summarized, so the model always sees the last exchange word for word.
+SESSION_KEEP_TURNS = int(os.getenv("SESSION_KEEP_TURNS", "2"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "200"))
+# Hard cap on the turns kept per session (two per exchange), whether or not summaries succeed: while the
+# summarizer is down (e.g. the Ollama circuit is open) the oldest turns are dropped unsummarized.
+SESSION_MAX_TURNS = max(2, int(os.getenv("SESSION_MAX_TURNS", "40")))
+
+Turn = Tuple[str, str]  # (role, text) with role 'user' or 'assistant'
+
+
+class Session:
+    """Conversation state of one user session: a rolling summary plus the most recent turns."""
+    def __init__(self, sub: str, session_id: str, summary: str = "", turns: Optional[List[Turn]] = None,
+                 updated_at: Optional[float] = None):
+        self.sub = sub
+        self.session_id = session_id
+        self.summary = summary
+        self.turns: List[Turn] = turns or []
+        self.updated_at = updated_at or time.time()
+        self.summarizing = False
+        self.dropped_turns = 0  # turns ever dropped from the head by the cap, to keep compact() aligned
+        self.deleted = False  # set by SessionStore.delete, so a pending write does not bring it back
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.sub, self.session_id
+
+    @property
+    def has_context(self) -> bool:
+        return bool(self.summary or self.turns)
+
+
+class SessionStore:
+    """
+    Bounded store of conversation sessions keyed by (user sub, session id).
+
+    Sessions live in an LRU of at most max_sessions entries. With a db_path, every change is also
+    written to SQLite so evicted or pre-restart sessions are reloaded on their next use. SQLite is only
+    accessed from worker threads, and changes are written behind the request that made them.
+    """
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, db_path: str = SESSION_DB_PATH):
+        """
+        Args:
+            max_sessions (int): Sessions kept in memory; the least recently used is evicted first.
+            db_path (str): Optional SQLite file for persistence.
+        """
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[Tuple[str, str], Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # serializes use of the connection across worker threads
+        self._pending_writes: Set[asyncio.Task] = set()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "sub TEXT NOT NULL, session_id TEXT NOT NULL, summary TEXT NOT NULL, turns TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (sub, session_id))"
+            )
+            self._db.commit()
+            print(f"[INFO] Sessions persisted to {db_path}")
+
+    def _load(self, sub: str, session_id: str) -> Optional[Session]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT summary, turns, updated_at FROM sessions WHERE sub = ? AND session_id = ?", (sub, session_id)
+            ).fetchone()
+        if row is None:
+            return None
+        summary, turns, updated_at = row
+        return Session(sub, session_id, summary, [tuple(turn) for turn in json.loads(turns)], updated_at)
+
+    def _save(self, session: Session) -> None:
+        # Writes the session as it is now, so out-of-order writes still leave the latest state behind
+        with self._db_lock:
+            with self._lock:
+                if session.deleted:
+                    return
+                row = (session.sub, session.session_id, session.summary,
+                       json.dumps(session.turns, ensure_ascii=False), session.updated_at)
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (sub, session_id, summary, turns, updated_at) VALUES (?, ?, ?, ?, ?)",
+                row,
+            )
+            self._db.commit()
+
+    def _write_behind(self, session: Session) -> None:
+        """Persists the session in a worker thread without making the caller wait for the commit."""
+        if self._db is None:
+            return
+        task = asyncio.create_task(asyncio.to_thread(self._save, session))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._write_done)
+
+    def _write_done(self, task: asyncio.Task) -> None:
+        self._pending_writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            event_log.emit("session.persist_error", level="error", detail=f"Could not persist session: {task.exception()}")
+            metrics.inc("session_write_errors_total")
+
+    async def flush(self) -> None:
+        """Waits for the pending writes, e.g. at shutdown."""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+
+    async def get(self, sub: str, session_id: str, create: bool = True) -> Optional[Session]:
+        """
+        Returns the session, loading it from SQLite (in a worker thread) or creating it if needed.
+        With create=False, an unknown session is neither created nor cached, and None is returned.
+        """
+        key = (sub, session_id)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+        loaded = await asyncio.to_thread(self._load, sub, session_id) if self._db is not None else None
+        if loaded is None and not create:
+            return None
+        with self._lock:
+            # Another request may have loaded or created it meanwhile
+            session = self._sessions.get(key) or loaded or Session(sub, session_id)
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                metrics.inc("session_evictions_total")
+            metrics.set_gauge("sessions_in_memory", len(self._sessions))
+            return session
+
+    async def snapshot(self, sub: str, session_id: str) -> Tuple[str, List[Turn]]:
+        """Consistent copy of (summary, turns) to build a prompt from; empty for an unknown session."""
+        session = await self.get(sub, session_id, create=False)
+        if session is None:
+            return "", []
+        with self._lock:
+            return session.summary, list(session.turns)
+
+    async def append_exchange(self, sub: str, session_id: str, user_message: str, answer: str) -> Session:
+        """Records a question and its answer; the SQLite write happens behind the caller."""
+        session = await self.get(sub, session_id)
+        with self._lock:
+            session.turns.extend([("user", user_message), ("assistant", answer)])
+            session.updated_at = time.time()
+            overflow = len(session.turns) - SESSION_MAX_TURNS
+            if overflow > 0:
+                del session.turns[:overflow]
+                session.dropped_turns += overflow
+        if overflow > 0:
+            event_log.emit("session.turns_dropped", level="warn", sub=sub, session_id=session_id, dropped=overflow,
+                           detail=f"Dropped the {overflow} oldest turns without summarizing them "
+                                  f"(cap of {SESSION_MAX_TURNS} turns).")
+            metrics.inc("session_turns_dropped_total", overflow)
+        self._write_behind(session)
+        return session
+
+    def _delete_row(self, key: Tuple[str, str]) -> bool:
+        with self._db_lock:
+            cursor = self._db.execute("DELETE FROM sessions WHERE sub = ? AND session_id = ?", key)
+            self._db.commit()
+            return cursor.rowcount > 0
+
+    async def delete(self, sub: str, session_id: str) -> bool:
+        """Forgets a session. Returns True if it existed."""
+        key = (sub, session_id)
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            if session is not None:
+                session.deleted = True
+        existed = session is not None
+        if self._db is not None:
+            existed = await asyncio.to_thread(self._delete_row, key) or existed
+        return existed
+
+    def _turns_to_summarize(self, session: Session, count_tokens: Callable[[str], int]) -> int:
+        """
+        Number of leading turns to fold into the summary so the verbatim history fits its budget.
+        Whole exchanges (question and answer) are folded together.
+        """
+        total = sum(count_tokens(text) for _, text in session.turns)
+        fold = 0
+        summarizable = len(session.turns) - SESSION_KEEP_TURNS
+        while total > SESSION_HISTORY_TOKENS and fold + 2 <= summarizable:
+            total -= sum(count_tokens(text) for _, text in session.turns[fold:fold + 2])
+            fold += 2
+        return fold
+
+    async def compact(self, sub: str, session_id: str, count_tokens: Callable[[str], int],
+                      summarize: Callable[[str, List[Turn], int], str]) -> None:
+        """
+        Folds the oldest turns into the rolling summary when the history exceeds its token budget.
+        Meant to run in the background after a turn; the prompt builder bounds the prompt meanwhile.
+
+        Args:
+            count_tokens (Callable[[str], int]): Token counter of the prompt tokenizer.
+            summarize (Callable[[str, List[Turn], int], str]): Blocking (summary, turns, max_tokens) -> new summary.
+        """
+        session = await self.get(sub, session_id, create=False)
+        if session is None:
+            return
+        with self._lock:
+            if session.summarizing:
+                return
+            fold = self._turns_to_summarize(session, count_tokens)
+            if fold == 0:
+                return
+            session.summarizing = True
+            previous_summary, folded = session.summary, session.turns[:fold]
+            dropped_before = session.dropped_turns
+        try:
+            start = time.perf_counter()
+            summary = await asyncio.to_thread(summarize, previous_summary, folded, SESSION_SUMMARY_TOKENS)
+            metrics.observe("session_summary_latency_ms", (time.perf_counter() - start) * 1000.0)
+        except Exception as e:
+            event_log.emit("session.summary_error", level="warn", sub=sub, session_id=session_id,
+                           detail=f"Session summary failed, keeping full history for now: {e}")
+            metrics.inc("session_summaries_total", outcome="error")
+            with self._lock:
+                session.summarizing = False
+            return
+        with self._lock:
+            # Turns are appended at the tail and only the cap removes them from the head, so whatever is
+            # left of the folded turns is still at the head of the list
+            session.summary = summary
+            session.turns = session.turns[max(0, len(folded) - (session.dropped_turns - dropped_before)):]
+            session.summarizing = False
+        self._write_behind(session)  # skipped if the session was deleted meanwhile
+        metrics.inc("session_summaries_total", outcome="ok")
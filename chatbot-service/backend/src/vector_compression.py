@@ -0,0 +1,177 @@
+import base64
+import hashlib
+import io
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Dimension reduction applied to new collection versions: "" (none), "pca" (fitted on the corpus) or
+# "truncate" (keep the first dimensions; only meaningful for Matryoshka-trained embedding models).
+VECTOR_REDUCTION = os.getenv("VECTOR_REDUCTION", "")
+VECTOR_DIMS = int(os.getenv("VECTOR_DIMS", "128"))
+# A collection's vectors only make sense together with its reducer, so queries are projected with the
+# reducer of the collection they search. The reducer is recorded in the collection's metadata, which
+# every node reads; this directory only caches it locally, one file per collection version.
+VECTOR_REDUCER_DIR = Path(os.getenv("VECTOR_REDUCER_DIR", str(Path(__file__).parent / "data" / "reducers")))
+REDUCTION_METHODS = ("pca", "truncate")
+
+
+class ReducerError(Exception):
+    """Raised when a collection stores reduced vectors but the projection they went through is unavailable."""
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class DimensionReducer:
+    """
+    Linear projection of embeddings to fewer dimensions, followed by L2 normalization so cosine
+    similarity keeps working. The same reducer must project the stored vectors and the queries.
+    """
+    def __init__(self, method: str, mean: np.ndarray, components: np.ndarray, explained_variance: float = 1.0):
+        """
+        Args:
+            method (str): "pca" or "truncate".
+            mean (np.ndarray): Vector subtracted before projecting (zeros for truncation).
+            components (np.ndarray): Projection matrix, (reduced dimension x source dimension).
+            explained_variance (float): Share of the corpus variance kept, for reporting.
+        """
+        self.method = method
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+        self.explained_variance = explained_variance
+
+    @property
+    def dimension(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def source_dimension(self) -> int:
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dimension: int, method: str = "pca") -> "DimensionReducer":
+        """
+        Fits a reducer on corpus vectors (points x source dimension).
+
+        Raises:
+            ValueError: On an unknown method.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dimension = min(dimension, vectors.shape[1])
+        if method == "truncate":
+            kept = float((vectors[:, :dimension] ** 2).sum() / max((vectors ** 2).sum(), 1e-12))
+            return cls(method, np.zeros(vectors.shape[1]), np.eye(vectors.shape[1])[:dimension], kept)
+        if method != "pca":
+            raise ValueError(f"Unknown reduction '{method}'. Expected one of {REDUCTION_METHODS}.")
+        mean = vectors.mean(axis=0)
+        # Principal axes of the centered corpus; a corpus smaller than the target dimension caps it
+        _, singular_values, axes = np.linalg.svd(vectors - mean, full_matrices=False)
+        dimension = min(dimension, axes.shape[0])
+        variance = singular_values ** 2
+        return cls(method, mean, axes[:dimension], float(variance[:dimension].sum() / max(variance.sum(), 1e-12)))
+
+    def transform(self, vectors: Any) -> np.ndarray:
+        """Projects one vector or a matrix of vectors; the result is L2-normalized float32."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return _normalize((vectors - self.mean) @ self.components.T).astype(np.float32)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"method": self.method, "dimension": self.dimension, "source_dimension": self.source_dimension,
+                "explained_variance": round(self.explained_variance, 4)}
+
+    def checksum(self) -> str:
+        """Content hash of the projection, recorded with the collection to check a cached reducer against."""
+        digest = hashlib.sha256(self.method.encode("utf-8"))
+        digest.update(self.mean.tobytes())
+        digest.update(self.components.tobytes())
+        return digest.hexdigest()
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez(buffer, method=np.array(self.method), mean=self.mean, components=self.components,
+                 explained_variance=np.array(self.explained_variance))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DimensionReducer":
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls(str(arrays["method"]), arrays["mean"], arrays["components"], float(arrays["explained_variance"]))
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: Path) -> "DimensionReducer":
+        return cls.from_bytes(Path(path).read_bytes())
+
+
+def reducer_path(collection_name: str) -> Path:
+    return VECTOR_REDUCER_DIR / f"{collection_name}.npz"
+
+
+def reduction_metadata(reducer: DimensionReducer) -> Dict[str, Any]:
+    """Collection metadata recording the reduction of its vectors, projection included, for create_collection."""
+    return {"reduction": dict(reducer.describe(), sha256=reducer.checksum(),
+                              projection=base64.b64encode(reducer.to_bytes()).decode("ascii"))}
+
+
+def load_reducer(vector_db_manager, collection_name: str) -> Optional[DimensionReducer]:
+    """
+    Returns the reducer of a collection version, or None if its vectors are full-size embeddings.
+
+    The reduction recorded in the collection metadata is authoritative; the local file is a cache of it.
+    Collections built before the reduction was recorded fall back to their local file.
+
+    Raises:
+        ReducerError: If the metadata cannot be read, or records a reduction whose projection is missing
+            or does not match its checksum. Querying the collection without it would only return nothing.
+    """
+    metadata = vector_db_manager.get_collection_metadata(collection_name)
+    if metadata is None:
+        raise ReducerError(f"Could not read the metadata of collection '{collection_name}'.")
+    recorded = metadata.get("reduction")
+    path = reducer_path(collection_name)
+    if recorded is None:
+        return _load_cached(path)
+    cached = _load_cached(path)
+    if cached is not None and cached.checksum() == recorded.get("sha256"):
+        return cached
+    if not recorded.get("projection"):
+        raise ReducerError(f"Collection '{collection_name}' stores vectors reduced with {recorded.get('method')} "
+                           f"to {recorded.get('dimension')} dims, but its projection is not recorded.")
+    try:
+        reducer = DimensionReducer.from_bytes(base64.b64decode(recorded["projection"]))
+    except Exception as e:
+        raise ReducerError(f"Invalid projection in the metadata of collection '{collection_name}': {e}")
+    if reducer.checksum() != recorded.get("sha256"):
+        raise ReducerError(f"The projection recorded for collection '{collection_name}' does not match its checksum.")
+    try:
+        reducer.save(path)
+    except OSError as e:
+        print(f"[WARN] Could not cache vector reducer {path}: {e}")
+    return reducer
+
+
+def _load_cached(path: Path) -> Optional[DimensionReducer]:
+    if not path.exists():
+        return None
+    try:
+        return DimensionReducer.load(path)
+    except Exception as e:
+        print(f"[ERROR] Could not load vector reducer {path}: {e}")
+        return None
+
+
+def save_reducer(collection_name: str, reducer: DimensionReducer) -> None:
+    """Caches a reducer locally; the collection must also record it (see reduction_metadata)."""
+    reducer.save(reducer_path(collection_name))
+
+
+def delete_reducer(collection_name: str) -> None:
+    reducer_path(collection_name).unlink(missing_ok=True)
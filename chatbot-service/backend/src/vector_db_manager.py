@@ -1,15 +1,88 @@
+import os
+import re
 import uuid
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterator, Tuple
 
 from qdrant_client import QdrantClient
 from qdrant_client.models import PointStruct, Distance, VectorParams, CollectionInfo, ScoredPoint
+from qdrant_client.models import (
+    HnswConfigDiff, SearchParams, QuantizationSearchParams, ScalarQuantization, ScalarQuantizationConfig,
+    ScalarType, ProductQuantization, ProductQuantizationConfig, CompressionRatio, BinaryQuantization,
+    BinaryQuantizationConfig, Disabled, VectorParamsDiff, CollectionParamsDiff, OptimizersConfigDiff,
+    CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation, PointIdsList,
+)
 # For older versions, it might be from qdrant_client.http.models for some of these
 
+# --- Index tuning (all optional; unset values keep Qdrant's defaults) ---
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name, "")
+    return int(value) if value else None
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name, "")
+    return float(value) if value else None
+
+def _env_bool(name: str) -> Optional[bool]:
+    value = os.getenv(name, "")
+    return value.lower() in ("1", "true", "yes") if value else None
+
+QDRANT_HNSW_M = _env_int("QDRANT_HNSW_M")
+QDRANT_HNSW_EF_CONSTRUCT = _env_int("QDRANT_HNSW_EF_CONSTRUCT")
+QDRANT_HNSW_EF = _env_int("QDRANT_HNSW_EF")                      # search-time ef
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "") or None  # "scalar", "product" or "binary"
+QDRANT_QUANTIZATION_RESCORE = _env_bool("QDRANT_QUANTIZATION_RESCORE")
+QDRANT_QUANTIZATION_OVERSAMPLING = _env_float("QDRANT_QUANTIZATION_OVERSAMPLING")
+QDRANT_ON_DISK_VECTORS = _env_bool("QDRANT_ON_DISK_VECTORS")
+QDRANT_ON_DISK_PAYLOAD = _env_bool("QDRANT_ON_DISK_PAYLOAD")
+
+QUANTIZATION_TYPES = ("scalar", "product", "binary")
+
+
+def index_tuning_from_env() -> Dict[str, Any]:
+    """Collection build settings for create_collection_if_not_exists, read from QDRANT_* variables."""
+    return {
+        "hnsw_m": QDRANT_HNSW_M,
+        "hnsw_ef_construct": QDRANT_HNSW_EF_CONSTRUCT,
+        "quantization": QDRANT_QUANTIZATION,
+        "on_disk_vectors": QDRANT_ON_DISK_VECTORS,
+        "on_disk_payload": QDRANT_ON_DISK_PAYLOAD,
+    }
+
+
+def build_quantization_config(quantization: Optional[str], always_ram: bool = True):
+    """
+    Maps a quantization name to a Qdrant quantization config.
+
+    Args:
+        quantization (Optional[str]): "scalar" (int8), "product", "binary", or None/"none" to disable.
+        always_ram (bool): Keep quantized vectors in RAM even when originals are on disk.
+    """
+    if not quantization or quantization == "none":
+        return None
+    if quantization == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=always_ram))
+    if quantization == "product":
+        return ProductQuantization(product=ProductQuantizationConfig(compression=CompressionRatio.X16, always_ram=always_ram))
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=always_ram))
+    raise ValueError(f"Unknown quantization '{quantization}'. Expected one of {QUANTIZATION_TYPES} or 'none'.")
+
+
+def _quantization_name(config) -> Optional[str]:
+    if isinstance(config, ScalarQuantization):
+        return "scalar"
+    if isinstance(config, ProductQuantization):
+        return "product"
+    if isinstance(config, BinaryQuantization):
+        return "binary"
+    return None
+
 class VectorDBManager:
     """
     Manages interactions with a Qdrant vector database.
     """
-    def __init__(self, host: str = "qdrant_db", grpc_port: int = 6333, http_port: int = 6334, api_key: Optional[str] = None):
+    def __init__(self, host: str = "qdrant_db", grpc_port: int = 6333, http_port: int = 6334, api_key: Optional[str] = None,
+                 path: Optional[str] = None):
         """
         Initializes the QdrantClient.
 
@@ -18,11 +91,25 @@ class VectorDBManager:
             grpc_port (int): gRPC port of the Qdrant instance.
             http_port (int): HTTP port of the Qdrant instance (for potential REST fallbacks or alternative connections).
             api_key (Optional[str]): API key for Qdrant Cloud (if applicable).
+            path (Optional[str]): Directory of an embedded local index instead of a Qdrant server
+                (single process only; e.g. a node bootstrapped from a vector snapshot).
         """
         self.host = host
         self.grpc_port = grpc_port # QdrantClient uses gRPC by default if host and port are given
         self.http_port = http_port
         self.client: Optional[QdrantClient] = None
+        # Search-time defaults, overridable per call in search()
+        self.hnsw_ef = QDRANT_HNSW_EF
+        self.quantization_rescore = QDRANT_QUANTIZATION_RESCORE
+        self.quantization_oversampling = QDRANT_QUANTIZATION_OVERSAMPLING
+
+        if path:
+            try:
+                self.client = QdrantClient(path=path)
+                print(f"Using local Qdrant index at {path}.")
+            except Exception as e:
+                print(f"Error opening local Qdrant index at {path}: {e}")
+            return
 
         try:
             # For QdrantClient, providing host and port implies gRPC.
@@ -43,44 +130,157 @@ class VectorDBManager:
                 print(f"Error connecting to Qdrant via HTTP on {self.host}:{self.http_port}: {e_http}")
                 self.client = None # Ensure client is None if connection failed
 
-    def create_collection_if_not_exists(self, collection_name: str, vector_size: int, distance_metric: Distance = Distance.COSINE) -> bool:
+    def create_collection_if_not_exists(self, collection_name: str, vector_size: int, distance_metric: Distance = Distance.COSINE,
+                                        hnsw_m: Optional[int] = None, hnsw_ef_construct: Optional[int] = None,
+                                        quantization: Optional[str] = None, on_disk_vectors: Optional[bool] = None,
+                                        on_disk_payload: Optional[bool] = None, update_on_drift: bool = False,
+                                        indexing_threshold: Optional[int] = None,
+                                        metadata: Optional[Dict[str, Any]] = None) -> bool:
         """
         Creates a Qdrant collection if it doesn't already exist.
+        If it exists, its configuration is compared with the requested one.
 
         Args:
             collection_name (str): Name of the collection.
             vector_size (int): Dimension of the vectors to be stored.
             distance_metric (Distance): Distance metric for vector comparison (default: COSINE).
+            hnsw_m (Optional[int]): HNSW graph degree. None keeps Qdrant's default.
+            hnsw_ef_construct (Optional[int]): HNSW build-time candidate list size.
+            quantization (Optional[str]): "scalar", "product", "binary" or None.
+            on_disk_vectors (Optional[bool]): Store original vectors on disk (memmap).
+            on_disk_payload (Optional[bool]): Store payloads on disk.
+            update_on_drift (bool): Apply the requested HNSW/quantization/on-disk settings to an
+                existing collection whose settings differ, instead of only warning.
+            indexing_threshold (Optional[int]): Optimizer indexing threshold (KB); 0 forces an HNSW index
+                even for tiny collections, which benchmarks need.
+            metadata (Optional[Dict[str, Any]]): Collection metadata stored with a new collection, e.g. the
+                dimension reduction its vectors went through (see vector_compression).
 
         Returns:
-            bool: True if collection was created or already exists and is valid, False otherwise.
+            bool: True if collection was created or already exists and is compatible, False otherwise.
         """
         if not self.client:
             print("Qdrant client not initialized. Cannot create collection.")
             return False
+        expected = {
+            "size": vector_size,
+            "distance": distance_metric,
+            "hnsw_m": hnsw_m,
+            "hnsw_ef_construct": hnsw_ef_construct,
+            "quantization": (quantization or "none") if quantization is not None else None,
+            "on_disk_vectors": on_disk_vectors,
+            "on_disk_payload": on_disk_payload,
+        }
         try:
             collections_response = self.client.get_collections()
             existing_collections = [col_desc.name for col_desc in collections_response.collections]
 
             if collection_name in existing_collections:
                 print(f"Collection '{collection_name}' already exists.")
-                # Optionally, verify if the existing collection has the correct vector_size and distance
-                # coll_info = self.client.get_collection(collection_name)
-                # if coll_info.config.params.vectors.size != vector_size or coll_info.config.params.vectors.distance != distance_metric:
-                # print(f"Warning: Collection '{collection_name}' exists but has different configuration.")
-                # return False # Or handle as an error/update strategy
+                drift = self.check_config_drift(collection_name, expected)
+                if drift is None:
+                    return False
+                incompatible = {field: values for field, values in drift.items() if field in ("size", "distance")}
+                if incompatible:
+                    for field, (wanted, actual) in incompatible.items():
+                        print(f"Error: Collection '{collection_name}' has {field}={actual}, expected {wanted}. It must be rebuilt.")
+                    return False
+                for field, (wanted, actual) in drift.items():
+                    print(f"Warning: Collection '{collection_name}' has {field}={actual}, expected {wanted}.")
+                if drift and update_on_drift:
+                    return self.apply_tuning(collection_name, hnsw_m=hnsw_m, hnsw_ef_construct=hnsw_ef_construct,
+                                             quantization=quantization, on_disk_vectors=on_disk_vectors,
+                                             on_disk_payload=on_disk_payload)
                 return True
 
+            hnsw_config = None
+            if hnsw_m is not None or hnsw_ef_construct is not None:
+                hnsw_config = HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct)
             self.client.create_collection(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=distance_metric)
+                vectors_config=VectorParams(size=vector_size, distance=distance_metric, on_disk=on_disk_vectors),
+                hnsw_config=hnsw_config,
+                quantization_config=build_quantization_config(quantization),
+                on_disk_payload=on_disk_payload,
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=indexing_threshold) if indexing_threshold is not None else None,
+                metadata=metadata,
             )
-            print(f"Collection '{collection_name}' created successfully with vector size {vector_size} and {distance_metric} distance.")
+            print(f"Collection '{collection_name}' created successfully with vector size {vector_size} and {distance_metric} distance "
+                  f"(hnsw m={hnsw_m}, ef_construct={hnsw_ef_construct}, quantization={quantization}, "
+                  f"on_disk_vectors={on_disk_vectors}, on_disk_payload={on_disk_payload}).")
             return True
         except Exception as e:
             print(f"Error creating or checking collection '{collection_name}': {e}")
             return False
 
+    def check_config_drift(self, collection_name: str, expected: Dict[str, Any]) -> Optional[Dict[str, Tuple[Any, Any]]]:
+        """
+        Compares an existing collection's configuration with the expected settings.
+
+        Args:
+            collection_name (str): Name of the collection.
+            expected (Dict[str, Any]): Expected values for "size", "distance", "hnsw_m", "hnsw_ef_construct",
+                "quantization", "on_disk_vectors" and "on_disk_payload". None values are not checked.
+
+        Returns:
+            Optional[Dict[str, Tuple[Any, Any]]]: Mismatching fields mapped to (expected, actual),
+            empty if the configuration matches, or None if the collection could not be read.
+        """
+        if not self.client:
+            print("Qdrant client not initialized. Cannot check collection configuration.")
+            return None
+        try:
+            config = self.client.get_collection(collection_name=collection_name).config
+        except Exception as e:
+            print(f"Error reading configuration of collection '{collection_name}': {e}")
+            return None
+
+        vectors = config.params.vectors
+        actual = {
+            "size": vectors.size,
+            "distance": vectors.distance,
+            "hnsw_m": config.hnsw_config.m if config.hnsw_config else None,
+            "hnsw_ef_construct": config.hnsw_config.ef_construct if config.hnsw_config else None,
+            "quantization": _quantization_name(config.quantization_config) or "none",
+            "on_disk_vectors": bool(vectors.on_disk),
+            "on_disk_payload": bool(config.params.on_disk_payload),
+        }
+        return {
+            field: (wanted, actual[field])
+            for field, wanted in expected.items()
+            if wanted is not None and field in actual and wanted != actual[field]
+        }
+
+    def apply_tuning(self, collection_name: str, hnsw_m: Optional[int] = None, hnsw_ef_construct: Optional[int] = None,
+                     quantization: Optional[str] = None, on_disk_vectors: Optional[bool] = None,
+                     on_disk_payload: Optional[bool] = None) -> bool:
+        """
+        Updates the tunable settings of an existing collection in place. Qdrant rebuilds
+        the affected index structures in the background; the collection stays searchable.
+
+        Returns:
+            bool: True if the update was accepted, False otherwise.
+        """
+        if not self.client:
+            print("Qdrant client not initialized. Cannot update collection.")
+            return False
+        try:
+            quantization_config = None
+            if quantization is not None:
+                quantization_config = build_quantization_config(quantization) or Disabled.DISABLED
+            self.client.update_collection(
+                collection_name=collection_name,
+                hnsw_config=HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct) if hnsw_m is not None or hnsw_ef_construct is not None else None,
+                quantization_config=quantization_config,
+                vectors_config={"": VectorParamsDiff(on_disk=on_disk_vectors)} if on_disk_vectors is not None else None,
+                collection_params=CollectionParamsDiff(on_disk_payload=on_disk_payload) if on_disk_payload is not None else None,
+            )
+            print(f"Collection '{collection_name}' tuning updated.")
+            return True
+        except Exception as e:
+            print(f"Error updating tuning of collection '{collection_name}': {e}")
+            return False
+
     def ingest_points(self, collection_name: str, vectors: List[List[float]], payloads: List[Optional[Dict[str, Any]]], ids: Optional[List[Any]] = None) -> bool:
         """
         Ingests (upserts) points (vectors and their payloads) into the specified collection.
@@ -126,7 +326,40 @@ class VectorDBManager:
             print(f"Error upserting points into '{collection_name}': {e}")
             return False
 
-    def search(self, collection_name: str, query_vector: List[float], limit: int = 5, score_threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    def upload_points(self, collection_name: str, vectors: Any, payloads: List[Dict[str, Any]], ids: List[Any],
+                      batch_size: int = 1024, parallel: int = 1) -> bool:
+        """
+        Bulk-loads points in large batches, e.g. from a vector snapshot.
+
+        Args:
+            collection_name (str): Name of the collection.
+            vectors: 2-D float32 numpy array (possibly memory-mapped), one row per point.
+            payloads (List[Dict[str, Any]]): Payload of each point.
+            ids (List[Any]): ID of each point.
+            batch_size (int): Points sent per request.
+            parallel (int): Concurrent upload workers.
+
+        Returns:
+            bool: True if all points were uploaded, False otherwise.
+        """
+        if not self.client:
+            print("Qdrant client not initialized. Cannot upload points.")
+            return False
+        if not (len(vectors) == len(payloads) == len(ids)):
+            print("Mismatch between number of vectors, payloads and IDs.")
+            return False
+        try:
+            self.client.upload_collection(collection_name=collection_name, vectors=vectors, payload=payloads,
+                                          ids=ids, batch_size=batch_size, parallel=parallel, wait=True)
+            print(f"Successfully uploaded {len(ids)} points into '{collection_name}'.")
+            return True
+        except Exception as e:
+            print(f"Error uploading points into '{collection_name}': {e}")
+            return False
+
+    def search(self, collection_name: str, query_vector: List[float], limit: int = 5, score_threshold: Optional[float] = None,
+               hnsw_ef: Optional[int] = None, rescore: Optional[bool] = None, oversampling: Optional[float] = None,
+               exact: bool = False) -> List[Dict[str, Any]]:
         """
         Performs a similarity search in the specified collection.
 
@@ -135,6 +368,10 @@ class VectorDBManager:
             query_vector (List[float]]): The vector to search for.
             limit (int): Maximum number of results to return.
             score_threshold (Optional[float]): Minimum score threshold for results.
+            hnsw_ef (Optional[int]): Search-time HNSW candidate list size (defaults to QDRANT_HNSW_EF).
+            rescore (Optional[bool]): Re-score quantized candidates with the original vectors.
+            oversampling (Optional[float]): Fetch limit * oversampling quantized candidates before rescoring.
+            exact (bool): Bypass the index and do a full scan (for ground truth in benchmarks).
 
         Returns:
             List[Dict[str, Any]]: A list of search results, each as a dictionary.
@@ -142,12 +379,22 @@ class VectorDBManager:
         if not self.client:
             print("Qdrant client not initialized. Cannot perform search.")
             return []
+        hnsw_ef = hnsw_ef if hnsw_ef is not None else self.hnsw_ef
+        rescore = rescore if rescore is not None else self.quantization_rescore
+        oversampling = oversampling if oversampling is not None else self.quantization_oversampling
+        search_params = None
+        if hnsw_ef is not None or rescore is not None or oversampling is not None or exact:
+            quantization_params = None
+            if rescore is not None or oversampling is not None:
+                quantization_params = QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+            search_params = SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization_params)
         try:
             search_result: List[ScoredPoint] = self.client.search(
                 collection_name=collection_name,
                 query_vector=query_vector,
                 limit=limit,
-                score_threshold=score_threshold
+                score_threshold=score_threshold,
+                search_params=search_params
             )
 
             transformed_results = [
@@ -159,6 +406,67 @@ class VectorDBManager:
             print(f"Error searching in collection '{collection_name}': {e}")
             return []
 
+    def scroll_points(self, collection_name: str, with_vectors: bool = True, batch_size: int = 256) -> Iterator[Any]:
+        """
+        Iterates over all points of a collection, page by page.
+
+        Args:
+            collection_name (str): Name of the collection.
+            with_vectors (bool): Include the stored vectors.
+            batch_size (int): Points fetched per request.
+
+        Yields:
+            Record: Each stored point (id, payload and optionally vector).
+        """
+        if not self.client:
+            print("Qdrant client not initialized. Cannot scroll points.")
+            return
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=with_vectors,
+            )
+            yield from records
+            if offset is None:
+                break
+
+    def delete_points(self, collection_name: str, ids: List[Any]) -> bool:
+        """
+        Deletes points by ID from a collection.
+
+        Returns:
+            bool: True if the points were deleted (or there were none to delete), False otherwise.
+        """
+        if not ids:
+            return True
+        if not self.client:
+            print("Qdrant client not initialized. Cannot delete points.")
+            return False
+        try:
+            self.client.delete(collection_name=collection_name, points_selector=PointIdsList(points=list(ids)), wait=True)
+            print(f"Deleted {len(ids)} points from '{collection_name}'.")
+            return True
+        except Exception as e:
+            print(f"Error deleting points from '{collection_name}': {e}")
+            return False
+
+    def get_collection_metadata(self, collection_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the metadata stored with a collection (empty if it has none), or None if it cannot be read.
+        """
+        if not self.client:
+            print("Qdrant client not initialized. Cannot get collection metadata.")
+            return None
+        try:
+            return dict(self.client.get_collection(collection_name=collection_name).config.metadata or {})
+        except Exception as e:
+            print(f"Error getting metadata of collection '{collection_name}': {e}")
+            return None
+
     def get_collection_info(self, collection_name: str) -> Optional[Dict[str, Any]]:
         """
         Retrieves information about a specific collection.
@@ -188,9 +496,12 @@ class VectorDBManager:
                     "params": {
                         "vectors": {
                             "size": collection_info.config.params.vectors.size,
-                            "distance": collection_info.config.params.vectors.distance.value # Use .value for Enum
-                        }
+                            "distance": collection_info.config.params.vectors.distance.value, # Use .value for Enum
+                            "on_disk": collection_info.config.params.vectors.on_disk
+                        },
+                        "on_disk_payload": collection_info.config.params.on_disk_payload
                     },
+                    "quantization": _quantization_name(collection_info.config.quantization_config),
                     "hnsw_config": collection_info.config.hnsw_config.dict() if collection_info.config.hnsw_config else None,
                     "optimizer_config": collection_info.config.optimizer_config.dict() if collection_info.config.optimizer_config else None,
                     "wal_config": collection_info.config.wal_config.dict() if collection_info.config.wal_config else None,
@@ -223,6 +534,83 @@ class VectorDBManager:
             print(f"Error deleting collection '{collection_name}': {e}")
             return False
 
+    def count_points(self, collection_name: str) -> Optional[int]:
+        """
+        Returns the exact number of points in a collection (or in the collection behind an alias).
+
+        Returns:
+            Optional[int]: The point count, or None if an error occurs.
+        """
+        if not self.client:
+            print("Qdrant client not initialized. Cannot count points.")
+            return None
+        try:
+            return self.client.count(collection_name=collection_name, exact=True).count
+        except Exception as e:
+            print(f"Error counting points in '{collection_name}': {e}")
+            return None
+
+    def get_alias_target(self, alias_name: str) -> Optional[str]:
+        """
+        Resolves an alias to the collection it currently points to.
+
+        Returns:
+            Optional[str]: The collection name, or None if the alias does not exist or an error occurs.
+        """
+        if not self.client:
+            print("Qdrant client not initialized. Cannot resolve alias.")
+            return None
+        try:
+            for alias in self.client.get_aliases().aliases:
+                if alias.alias_name == alias_name:
+                    return alias.collection_name
+            return None
+        except Exception as e:
+            print(f"Error resolving alias '{alias_name}': {e}")
+            return None
+
+    def point_alias(self, alias_name: str, collection_name: str) -> bool:
+        """
+        Atomically (re)points an alias to a collection. Removing the old alias and creating the new one
+        happen in a single request, so searches through the alias never see a missing collection.
+
+        Returns:
+            bool: True if the alias now points to collection_name, False otherwise.
+        """
+        if not self.client:
+            print("Qdrant client not initialized. Cannot update alias.")
+            return False
+        operations = []
+        if self.get_alias_target(alias_name) is not None:
+            operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias_name)))
+        operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection_name, alias_name=alias_name)))
+        try:
+            self.client.update_collection_aliases(change_aliases_operations=operations)
+            print(f"Alias '{alias_name}' now points to '{collection_name}'.")
+            return True
+        except Exception as e:
+            print(f"Error pointing alias '{alias_name}' to '{collection_name}': {e}")
+            return False
+
+    def list_collection_versions(self, base_name: str) -> List[Tuple[int, str]]:
+        """
+        Lists the versioned collections built for an alias, named "<base_name>_v<N>".
+
+        Returns:
+            List[Tuple[int, str]]: (version, collection name) pairs, oldest first.
+        """
+        if not self.client:
+            print("Qdrant client not initialized. Cannot list collections.")
+            return []
+        pattern = re.compile(rf"^{re.escape(base_name)}_v(\d+)$")
+        try:
+            names = [col_desc.name for col_desc in self.client.get_collections().collections]
+        except Exception as e:
+            print(f"Error listing collections: {e}")
+            return []
+        versions = [(int(match.group(1)), name) for name in names if (match := pattern.match(name))]
+        return sorted(versions)
+
 if __name__ == '__main__':
     print("----- Testing VectorDBManager -----")
     # Assuming Qdrant is running on localhost via Docker as 'qdrant_db'
@@ -0,0 +1,256 @@
+"""
+Binary snapshots of a vector collection, to bootstrap a node without re-embedding the corpus.
+
+A snapshot is a directory with:
+    vectors.npy     float32 matrix (points x dimension), loadable with numpy.load(mmap_mode="r")
+    payloads.json   columnar payloads: {"ids": [...], "columns": {"text_chunk": [...], ...}}
+    manifest.json   model name, dimension, distance, chunker version, point count and vectors checksum
+    reducer.npz     only for collections of reduced vectors: the projection queries must go through
+
+Usage (from the backend directory):
+    python -m src.vector_snapshot export snapshots/2024-06-01
+    python -m src.vector_snapshot import snapshots/2024-06-01                      # into Qdrant (QDRANT_HOST)
+    python -m src.vector_snapshot import snapshots/2024-06-01 --path data/qdrant   # into a local index (QDRANT_PATH)
+
+Import builds a new "<alias>_v<N>" collection with bulk uploads, checks the point count, repoints the
+alias and builds the new version's BM25 index from the payloads. The embedding model is never loaded.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from qdrant_client.models import Distance
+
+from .bm25_index import delete_bm25_index
+from .embedding_server import EMBEDDING_MODEL
+from .ingest_data import CHUNKER_VERSION, COLLECTION_ALIAS, garbage_collect_versions, update_lexical_index
+from .retriever import QDRANT_HOST
+from .vector_compression import DimensionReducer, ReducerError, load_reducer, reduction_metadata, save_reducer
+from .vector_db_manager import VectorDBManager, index_tuning_from_env
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+PAYLOADS_FILE = "payloads.json"
+REDUCER_FILE = "reducer.npz"
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "1024"))
+SNAPSHOT_PARALLEL = int(os.getenv("SNAPSHOT_PARALLEL", "2"))
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing, damaged or incompatible with this node."""
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def to_columns(payloads: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Turns row payloads into one list per field; a field missing from a payload is None."""
+    names = sorted({name for payload in payloads for name in payload})
+    return {name: [payload.get(name) for payload in payloads] for name in names}
+
+
+def from_columns(columns: Dict[str, List[Any]], count: int) -> List[Dict[str, Any]]:
+    """Inverse of to_columns; None values are left out of the rebuilt payloads."""
+    payloads: List[Dict[str, Any]] = [{} for _ in range(count)]
+    for name, values in columns.items():
+        for payload, value in zip(payloads, values):
+            if value is not None:
+                payload[name] = value
+    return payloads
+
+
+def export_snapshot(vector_db_manager: VectorDBManager, collection_name: str, out_dir: Path) -> Dict[str, Any]:
+    """
+    Writes the vectors, payloads and manifest of a collection (or alias) to out_dir.
+
+    Returns:
+        Dict[str, Any]: The manifest.
+
+    Raises:
+        SnapshotError: If the collection cannot be read or is empty.
+    """
+    try:
+        params = vector_db_manager.client.get_collection(collection_name=collection_name).config.params.vectors
+    except Exception as e:
+        raise SnapshotError(f"Cannot read collection '{collection_name}': {e}")
+
+    ids: List[str] = []
+    payloads: List[Dict[str, Any]] = []
+    vectors = []
+    for record in vector_db_manager.scroll_points(collection_name, with_vectors=True, batch_size=SNAPSHOT_BATCH_SIZE):
+        ids.append(str(record.id))
+        payloads.append(record.payload or {})
+        vectors.append(record.vector)
+    if not ids:
+        raise SnapshotError(f"Collection '{collection_name}' is empty; nothing to export.")
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / VECTORS_FILE, matrix)
+    with (out_dir / PAYLOADS_FILE).open("w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "columns": to_columns(payloads)}, f, ensure_ascii=False)
+
+    source_collection = vector_db_manager.get_alias_target(collection_name) or collection_name
+    try:
+        reducer = load_reducer(vector_db_manager, source_collection)
+    except ReducerError as e:
+        raise SnapshotError(str(e))
+    if reducer is not None:
+        reducer.save(out_dir / REDUCER_FILE)
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "collection": source_collection,
+        "model": EMBEDDING_MODEL,
+        "dimension": int(params.size),
+        "distance": params.distance.value,
+        "chunker_version": CHUNKER_VERSION,
+        "reduction": reducer.describe() if reducer is not None else None,
+        "count": len(ids),
+        "vectors_sha256": _sha256(out_dir / VECTORS_FILE),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    # Written last: a directory without a manifest is an incomplete export
+    with (out_dir / MANIFEST_FILE).open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_snapshot(snapshot_dir: Path, verify: bool = True,
+                  force: bool = False) -> Tuple[Dict[str, Any], np.ndarray, List[str], List[Dict[str, Any]]]:
+    """
+    Reads and validates a snapshot; the vectors are memory-mapped rather than read into memory.
+
+    Args:
+        snapshot_dir (Path): Directory written by export_snapshot.
+        verify (bool): Check the vectors file against the manifest checksum.
+        force (bool): Accept a snapshot built with another embedding model or chunker.
+
+    Returns:
+        Tuple: (manifest, vectors, ids, payloads).
+
+    Raises:
+        SnapshotError: If the snapshot is incomplete, damaged or incompatible.
+    """
+    manifest_path = snapshot_dir / MANIFEST_FILE
+    if not manifest_path.exists():
+        raise SnapshotError(f"No {MANIFEST_FILE} in {snapshot_dir} (missing or incomplete export).")
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')} (expected {SNAPSHOT_FORMAT}).")
+    if not force:
+        # Queries are embedded with EMBEDDING_MODEL; vectors from another model would be silently meaningless
+        if manifest["model"] != EMBEDDING_MODEL:
+            raise SnapshotError(f"Snapshot model '{manifest['model']}' differs from EMBEDDING_MODEL '{EMBEDDING_MODEL}'.")
+        if manifest["chunker_version"] != CHUNKER_VERSION:
+            raise SnapshotError(f"Snapshot chunker '{manifest['chunker_version']}' differs from '{CHUNKER_VERSION}'.")
+
+    if manifest.get("reduction") and not (snapshot_dir / REDUCER_FILE).exists():
+        raise SnapshotError(f"Snapshot vectors are reduced but {REDUCER_FILE} is missing.")
+
+    vectors_path = snapshot_dir / VECTORS_FILE
+    if verify and _sha256(vectors_path) != manifest["vectors_sha256"]:
+        raise SnapshotError(f"{VECTORS_FILE} does not match the manifest checksum.")
+    vectors = np.load(vectors_path, mmap_mode="r")
+    if vectors.dtype != np.float32 or vectors.shape != (manifest["count"], manifest["dimension"]):
+        raise SnapshotError(f"{VECTORS_FILE} has shape {vectors.shape} and dtype {vectors.dtype}, "
+                            f"expected ({manifest['count']}, {manifest['dimension']}) float32.")
+
+    with (snapshot_dir / PAYLOADS_FILE).open(encoding="utf-8") as f:
+        data = json.load(f)
+    ids = data["ids"]
+    if len(ids) != manifest["count"]:
+        raise SnapshotError(f"{PAYLOADS_FILE} has {len(ids)} ids, expected {manifest['count']}.")
+    return manifest, vectors, ids, from_columns(data["columns"], len(ids))
+
+
+def import_snapshot(vector_db_manager: VectorDBManager, snapshot_dir: Path, alias: str = COLLECTION_ALIAS,
+                    verify: bool = True, force: bool = False, batch_size: int = SNAPSHOT_BATCH_SIZE,
+                    parallel: int = SNAPSHOT_PARALLEL) -> Optional[str]:
+    """
+    Loads a snapshot into a new collection version and makes it live behind the alias.
+
+    Returns:
+        Optional[str]: The new live collection, or None if the import failed (the alias is left unchanged).
+
+    Raises:
+        SnapshotError: If the snapshot cannot be used.
+    """
+    manifest, vectors, ids, payloads = load_snapshot(snapshot_dir, verify, force)
+
+    versions = vector_db_manager.list_collection_versions(alias)
+    target_collection = f"{alias}_v{versions[-1][0] + 1 if versions else 1}"
+    # Stored vectors are projected: queries against the new collection must be projected the same way
+    reducer = DimensionReducer.load(snapshot_dir / REDUCER_FILE) if manifest.get("reduction") else None
+    if not vector_db_manager.create_collection_if_not_exists(
+        collection_name=target_collection,
+        vector_size=manifest["dimension"],
+        distance_metric=Distance(manifest["distance"]),
+        **index_tuning_from_env(),
+        metadata=reduction_metadata(reducer) if reducer is not None else None,
+    ):
+        return None
+    if reducer is not None:
+        save_reducer(target_collection, reducer)
+    if not vector_db_manager.upload_points(target_collection, vectors, payloads, ids, batch_size, parallel):
+        vector_db_manager.delete_collection(target_collection)
+        return None
+
+    point_count = vector_db_manager.count_points(target_collection)
+    if point_count != len(set(ids)):
+        print(f"Error: '{target_collection}' holds {point_count} points, expected {len(set(ids))}. "
+              f"The alias keeps pointing to '{vector_db_manager.get_alias_target(alias)}'.")
+        vector_db_manager.delete_collection(target_collection)
+        return None
+    # The lexical index of the new version exists before the alias makes it live
+    if not update_lexical_index(target_collection, ids, payloads, rebuild=True):
+        print("Warning: BM25 index update failed; hybrid retrieval will use stale lexical results.")
+    if not vector_db_manager.point_alias(alias, target_collection):
+        vector_db_manager.delete_collection(target_collection)
+        delete_bm25_index(target_collection)
+        return None
+    deleted = garbage_collect_versions(vector_db_manager, alias)
+    if deleted:
+        print(f"Removed old collection versions: {', '.join(deleted)}")
+    return target_collection
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import a binary snapshot of the vector collection.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("directory", type=Path, help="Snapshot directory.")
+    parser.add_argument("--collection", default=COLLECTION_ALIAS, help="Collection or alias to export / alias to import into.")
+    parser.add_argument("--path", default=os.getenv("QDRANT_PATH", ""),
+                        help="Local index directory instead of the Qdrant server at QDRANT_HOST.")
+    parser.add_argument("--no-verify", action="store_true", help="Skip the vectors checksum on import.")
+    parser.add_argument("--force", action="store_true", help="Import even if the embedding model or chunker differ.")
+    args = parser.parse_args()
+
+    db = VectorDBManager(host=QDRANT_HOST, path=args.path or None)
+    if not db.client:
+        raise SystemExit("Error: no vector database available.")
+    start = time.perf_counter()
+    try:
+        if args.command == "export":
+            manifest = export_snapshot(db, args.collection, args.directory)
+            print(f"Exported {manifest['count']} points ({manifest['dimension']} dims, model {manifest['model']}) "
+                  f"to {args.directory} in {time.perf_counter() - start:.1f}s.")
+        else:
+            live = import_snapshot(db, args.directory, args.collection, verify=not args.no_verify, force=args.force)
+            if live is None:
+                raise SystemExit("Error: import failed.")
+            print(f"Alias '{args.collection}' -> '{live}' ready in {time.perf_counter() - start:.1f}s.")
+    except SnapshotError as e:
+        raise SystemExit(f"Error: {e}")
@@ -0,0 +1,98 @@
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.embedding_server import (
+    FLOAT32_LE, LENGTH_PREFIX, MAX_TEXTS_PER_REQUEST, OP_INFO, REQUEST_HEADER, RESPONSE_HEADER, STATUS_ERROR,
+    STATUS_OK, EmbeddingClient,
+)
+
+DIM = 2
+
+
+class FakeServer:
+    """Speaks the embedding wire protocol; each encode request runs the behaviour given for its index."""
+    def __init__(self, path, behaviours=()):
+        self.behaviours = list(behaviours)
+        self.encode_requests = []
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            conn, _ = self.listener.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _recv(conn, size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def _serve(self, conn):
+        with conn:
+            try:
+                while True:
+                    op, count = REQUEST_HEADER.unpack(self._recv(conn, REQUEST_HEADER.size))
+                    if op == OP_INFO:
+                        conn.sendall(RESPONSE_HEADER.pack(STATUS_OK, 4, DIM) + b"fake")
+                        continue
+                    texts = []
+                    for _ in range(count):
+                        (length,) = LENGTH_PREFIX.unpack(self._recv(conn, LENGTH_PREFIX.size))
+                        texts.append(self._recv(conn, length).decode("utf-8"))
+                    index = len(self.encode_requests)
+                    self.encode_requests.append(len(texts))
+                    behaviour = self.behaviours[index] if index < len(self.behaviours) else "ok"
+                    if behaviour == "close":
+                        return
+                    if behaviour == "slow":
+                        time.sleep(0.5)
+                    if len(texts) > MAX_TEXTS_PER_REQUEST:
+                        message = b"too many texts"
+                        conn.sendall(RESPONSE_HEADER.pack(STATUS_ERROR, len(message), 0) + message)
+                        continue
+                    vectors = np.array([[float(text), 1.0] for text in texts], dtype=FLOAT32_LE)
+                    conn.sendall(RESPONSE_HEADER.pack(STATUS_OK, len(texts), DIM) + vectors.tobytes())
+            except (ConnectionError, struct.error, OSError):
+                return
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "embedding.sock")
+
+
+def test_large_inputs_are_split_into_allowed_requests(socket_path):
+    server = FakeServer(socket_path)
+    client = EmbeddingClient(socket_path)
+    texts = [str(i) for i in range(2 * MAX_TEXTS_PER_REQUEST + 5)]
+    embeddings = client.generate_embeddings(texts)
+    assert server.encode_requests == [MAX_TEXTS_PER_REQUEST, MAX_TEXTS_PER_REQUEST, 5]
+    assert embeddings.shape == (len(texts), DIM)
+    assert embeddings[-1, 0] == len(texts) - 1
+
+
+def test_connection_closed_before_replying_is_retried(socket_path):
+    server = FakeServer(socket_path, behaviours=["close"])
+    client = EmbeddingClient(socket_path)
+    assert client.generate_embedding("3") == [3.0, 1.0]
+    assert server.encode_requests == [1, 1]
+
+
+def test_timeout_is_not_retried(socket_path):
+    server = FakeServer(socket_path, behaviours=["slow", "slow"])
+    client = EmbeddingClient(socket_path, timeout=0.1)
+    assert client.generate_embeddings(["1"]) is None
+    time.sleep(0.1)
+    assert server.encode_requests == [1]
@@ -0,0 +1,43 @@
+import asyncio
+
+from src.job_manager import JobManager
+
+
+async def answer(job):
+    return {"response": job.message}
+
+
+def submit_twice(first_session, second_session, first="Quelles filières ?", second="quelles  filières ?"):
+    async def run():
+        manager = JobManager(answer)
+        job, created = manager.submit("user", first_session, first)
+        again, created_again = manager.submit("user", second_session, second)
+        return job, created, again, created_again
+    return asyncio.run(run())
+
+
+def test_resubmission_without_session_attaches_to_the_job():
+    job, created, again, created_again = submit_twice(None, None)
+    assert created and not created_again
+    assert again.id == job.id
+    assert job.session_id  # a new session is started for the job and returned both times
+
+
+def test_resubmission_in_the_job_session_attaches_to_the_job():
+    job, _, again, created_again = submit_twice("s1", "s1")
+    assert again.id == job.id and not created_again
+
+
+def test_same_question_in_other_sessions_is_a_new_job():
+    job, _, again, created_again = submit_twice("s1", "s2")
+    assert again.id != job.id and created_again
+    job, _, again, _ = submit_twice(None, "s2")
+    assert again.id != job.id
+
+
+def test_other_users_do_not_share_jobs():
+    async def run():
+        manager = JobManager(answer)
+        return manager.submit("a", None, "hello")[0], manager.submit("b", None, "hello")[0]
+    first, second = asyncio.run(run())
+    assert first.id != second.id
@@ -0,0 +1,107 @@
+import asyncio
+import types
+
+import pytest
+
+from src import rate_limiter as rl
+from src.rate_limiter import LocalBucketStore, RateLimiter, RateLimitExceeded, retry_after_header
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rl, "time", types.SimpleNamespace(monotonic=fake.monotonic))
+    return fake
+
+
+def take(store, key, rate, burst, cost=1.0):
+    return asyncio.run(store.take(key, rate, burst, cost))
+
+
+def test_bucket_allows_burst_then_refuses(clock):
+    store = LocalBucketStore()
+    assert [take(store, "u", 1.0, 3)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = take(store, "u", 1.0, 3)
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+
+def test_bucket_refills_with_elapsed_time(clock):
+    store = LocalBucketStore()
+    for _ in range(3):
+        take(store, "u", 0.5, 3)
+    clock.now += 1.0  # half a token
+    allowed, retry_after = take(store, "u", 0.5, 3)
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+    clock.now += 1.0
+    assert take(store, "u", 0.5, 3)[0]
+
+
+def test_refill_is_capped_at_burst(clock):
+    store = LocalBucketStore()
+    take(store, "u", 1.0, 2)
+    clock.now += 3600
+    assert [take(store, "u", 1.0, 2)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_prune_keeps_buckets_of_slower_budgets(clock):
+    store = LocalBucketStore(shards=1, max_keys_per_shard=2)
+    ai_rate, ai_burst = 6 / 60.0, 3  # full again 30 s after being emptied
+    chat_rate, chat_burst = 30 / 60.0, 10
+    for _ in range(3):
+        take(store, "ai:u1", ai_rate, ai_burst)
+    clock.now += 20.0
+    # Pruning triggered by chat buckets must not forget the half-refilled AI bucket
+    take(store, "chat:u2", chat_rate, chat_burst)
+    take(store, "chat:u3", chat_rate, chat_burst)
+    assert "ai:u1" in store._shards[0][1]
+    allowed, retry_after = take(store, "ai:u1", ai_rate, ai_burst, cost=3)
+    assert not allowed
+    assert retry_after == pytest.approx(10.0)
+
+
+def test_prune_forgets_full_buckets(clock):
+    store = LocalBucketStore(shards=1, max_keys_per_shard=2)
+    take(store, "a", 1.0, 2)
+    take(store, "b", 1.0, 2)
+    clock.now += 5.0
+    take(store, "c", 1.0, 2)
+    assert set(store._shards[0][1]) == {"c"}
+
+
+def test_limiter_raises_with_budget_and_retry_after(clock):
+    limiter = RateLimiter(LocalBucketStore(), budgets={"ai": (6, 1)})
+    asyncio.run(limiter.acquire("ai", "u"))
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        asyncio.run(limiter.acquire("ai", "u"))
+    assert excinfo.value.budget == "ai"
+    assert excinfo.value.retry_after == pytest.approx(10.0)
+    asyncio.run(limiter.acquire("ai", "other-user"))
+
+
+def test_disabled_budget_never_limits(clock):
+    limiter = RateLimiter(LocalBucketStore(), budgets={"chat": (0, 1)})
+    for _ in range(5):
+        asyncio.run(limiter.acquire("chat", "u"))
+
+
+def test_broken_store_allows_requests():
+    class BrokenStore:
+        async def take(self, *args):
+            raise ConnectionError("store down")
+
+    asyncio.run(RateLimiter(BrokenStore(), budgets={"chat": (1, 1)}).acquire("chat", "u"))
+
+
+def test_retry_after_header_rounds_up_to_whole_seconds():
+    assert retry_after_header(RateLimitExceeded("chat", 0.2)) == {"Retry-After": "1"}
+    assert retry_after_header(RateLimitExceeded("chat", 2.01)) == {"Retry-After": "3"}
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from src.reranker import CrossEncoderReranker
+
+
+class SlowFirstModel:
+    """Cross-encoder stand-in whose first call overruns the budget (e.g. a cold model)."""
+    def __init__(self, first_call_seconds: float):
+        self.first_call_seconds = first_call_seconds
+        self.calls = 0
+
+    def predict(self, pairs):
+        self.calls += 1
+        if self.calls == 1:
+            time.sleep(self.first_call_seconds)
+        return [float(len(text)) for _, text in pairs]
+
+
+def hits(count):
+    return [{"id": str(i), "payload": {"text_chunk": "x" * i}} for i in range(count)]
+
+
+def test_reranking_resumes_after_a_timed_out_call():
+    reranker = CrossEncoderReranker(model_name="", budget_ms=50, top_n=3)
+    reranker.model = SlowFirstModel(first_call_seconds=0.1)
+
+    async def run():
+        assert "rerank_score" not in (await reranker.rerank("q", hits(4)))[0]
+        await asyncio.sleep(0.1)  # let the overrunning call release the model
+        for _ in range(20):
+            result = await reranker.rerank("q", hits(4))
+            if "rerank_score" in result[0]:
+                return result
+        return None
+
+    result = asyncio.run(run())
+    assert result is not None, "re-ranking never resumed after the slow call"
+    assert [hit["id"] for hit in result] == ["3", "2", "1"]
+    assert reranker.estimate_ms(4) < reranker.budget_ms
+
+
+def test_estimate_is_none_before_the_first_measurement():
+    assert CrossEncoderReranker(model_name="").estimate_ms(10) is None
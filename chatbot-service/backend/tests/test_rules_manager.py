@@ -0,0 +1,70 @@
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from src.rules_manager import RulesManager
+
+RULES = [
+    {"pattern": "Qu'est-ce que l'EST Salé ?", "answer": "about"},
+    {"pattern": "Quelles sont les filières disponibles ?", "answer": "programs"},
+    {"pattern": "Quels sont les chiffres clés ?", "answer": "figures"},
+    {"pattern": "Comment s'inscrire ?", "answer": "enrollment"},
+    {"pattern": "Contact EST Salé", "answer": "contact"},
+]
+
+MESSAGES = {
+    "inscrir": "enrollment",
+    "filieres": "programs",
+    "contacte": "contact",
+    "Filières": "programs",
+    "filiers": "programs",
+    "contactez": "contact",
+    "comment s inscrire": "enrollment",
+    "Quelles sont les filières ?": "programs",
+    "qu est ce que l est sale": "about",
+    "est": None,
+    "sale": None,
+    "les": None,
+    "inscription": None,
+    "quelle est la météo": None,
+}
+
+MATCHER = Path(__file__).resolve().parents[2] / "frontend" / "src" / "api" / "rulesMatcher.js"
+
+
+@pytest.fixture
+def rules_manager(tmp_path):
+    rules_file = tmp_path / "rules.json"
+    rules_file.write_text(json.dumps({"questions": RULES}, ensure_ascii=False), encoding="utf-8")
+    return RulesManager(str(rules_file))
+
+
+@pytest.mark.parametrize("message, answer", MESSAGES.items())
+def test_find_matching_rule(rules_manager, message, answer):
+    assert rules_manager.find_matching_rule(message) == answer
+
+
+def test_short_query_found_in_several_patterns_is_not_answered(rules_manager):
+    # "salé" is in two patterns: no single rule covers it
+    assert rules_manager.find_matching_rule("salé") is None
+    assert rules_manager.find_matching_rule("est salé ?") == "about"
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_client_matcher_agrees(rules_manager, tmp_path):
+    # The frontend twin must answer exactly like the backend for the same snapshot
+    module = tmp_path / "rulesMatcher.mjs"
+    shutil.copy(MATCHER, module)
+    script = (
+        f"import {{ matchRule }} from {json.dumps(module.as_uri())};\n"
+        f"const snapshot = {json.dumps(rules_manager.snapshot())};\n"
+        f"const messages = {json.dumps(list(MESSAGES))};\n"
+        "console.log(JSON.stringify(messages.map((message) => matchRule(snapshot, message))));\n"
+    )
+    runner = tmp_path / "run.mjs"
+    runner.write_text(script, encoding="utf-8")
+    output = subprocess.run(["node", str(runner)], capture_output=True, text=True, check=True).stdout
+    assert json.loads(output) == [rules_manager.find_matching_rule(message) for message in MESSAGES]
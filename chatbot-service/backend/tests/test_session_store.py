@@ -0,0 +1,59 @@
+import asyncio
+
+from src import session_store as ss
+from src.session_store import SessionStore
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def failing_summary(summary, turns, max_tokens):
+    raise ConnectionError("AI service unavailable")
+
+
+def test_history_is_capped_while_summaries_fail(monkeypatch):
+    monkeypatch.setattr(ss, "SESSION_MAX_TURNS", 6)
+
+    async def run():
+        store = SessionStore(db_path="")
+        for i in range(10):
+            await store.append_exchange("u", "s", f"question {i}", f"answer {i}")
+            await store.compact("u", "s", count_words, failing_summary)
+        return await store.get("u", "s", create=False)
+
+    session = asyncio.run(run())
+    assert session.turns == [("user", "question 7"), ("assistant", "answer 7"), ("user", "question 8"),
+                             ("assistant", "answer 8"), ("user", "question 9"), ("assistant", "answer 9")]
+    assert session.dropped_turns == 14
+
+
+def test_summary_finishing_after_the_cap_keeps_the_newest_turns(monkeypatch):
+    monkeypatch.setattr(ss, "SESSION_MAX_TURNS", 4)
+    monkeypatch.setattr(ss, "SESSION_HISTORY_TOKENS", 4)
+
+    async def run():
+        store = SessionStore(db_path="")
+        await store.append_exchange("u", "s", "question 0", "answer 0")
+        await store.append_exchange("u", "s", "question 1", "answer 1")
+        started, release = asyncio.Event(), asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def slow_summary(summary, turns, max_tokens):
+            loop.call_soon_threadsafe(started.set)
+            asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+            return "summary of " + ", ".join(text for _, text in turns)
+
+        compaction = asyncio.create_task(store.compact("u", "s", count_words, slow_summary))
+        await started.wait()
+        # The cap drops turns the summary is folding while it runs
+        await store.append_exchange("u", "s", "question 2", "answer 2")
+        release.set()
+        await compaction
+        return await store.get("u", "s", create=False)
+
+    session = asyncio.run(run())
+    assert session.summary.startswith("summary of question 0")
+    # question 0 was dropped by the cap, not by the summary: question 1 must survive both
+    assert session.turns == [("user", "question 1"), ("assistant", "answer 1"),
+                             ("user", "question 2"), ("assistant", "answer 2")]
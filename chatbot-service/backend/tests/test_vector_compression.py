@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from qdrant_client.models import Distance, VectorParams
+
+from src import vector_compression as vc
+from src.retriever import HybridRetriever
+from src.vector_compression import DimensionReducer, ReducerError, load_reducer, reduction_metadata
+from src.vector_db_manager import VectorDBManager
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(vc, "VECTOR_REDUCER_DIR", tmp_path / "reducers")
+    return VectorDBManager(path=str(tmp_path / "qdrant"))
+
+
+@pytest.fixture
+def reducer():
+    vectors = np.random.default_rng(0).normal(size=(32, 16)).astype(np.float32)
+    return DimensionReducer.fit(vectors, 4, "pca")
+
+
+def create(db, name, size, metadata=None):
+    assert db.create_collection_if_not_exists(name, size, metadata=metadata)
+
+
+def test_full_size_collection_has_no_reducer(db):
+    create(db, "docs_v1", 16)
+    assert load_reducer(db, "docs_v1") is None
+
+
+def test_reducer_is_rebuilt_from_collection_metadata(db, reducer):
+    # A node that never saw the ingestion (no local file) still projects queries correctly
+    create(db, "docs_v1", 4, reduction_metadata(reducer))
+    assert not vc.reducer_path("docs_v1").exists()
+    loaded = load_reducer(db, "docs_v1")
+    assert loaded.checksum() == reducer.checksum()
+    assert vc.reducer_path("docs_v1").exists()
+    assert load_reducer(db, "docs_v1").checksum() == reducer.checksum()
+
+
+def test_recorded_reduction_without_projection_raises(db, reducer):
+    metadata = reduction_metadata(reducer)
+    del metadata["reduction"]["projection"]
+    create(db, "docs_v1", 4, metadata)
+    with pytest.raises(ReducerError):
+        load_reducer(db, "docs_v1")
+
+
+def test_stale_cached_reducer_is_replaced(db, reducer):
+    create(db, "docs_v1", 4, reduction_metadata(reducer))
+    other = DimensionReducer.fit(np.random.default_rng(1).normal(size=(32, 16)), 4, "pca")
+    other.save(vc.reducer_path("docs_v1"))
+    assert load_reducer(db, "docs_v1").checksum() == reducer.checksum()
+
+
+def test_retriever_searches_the_collection_its_reducer_belongs_to(db, reducer, monkeypatch):
+    create(db, "docs_v1", 16)
+    create(db, "docs_v2", 4, reduction_metadata(reducer))
+    assert db.point_alias("docs", "docs_v1")
+    searched = []
+    monkeypatch.setattr(db, "search", lambda name, vector, limit: searched.append((name, len(vector))) or [])
+    retriever = HybridRetriever(None, db, "docs")
+    retriever._vector_search("q", 3, query_vector=[0.1] * 16)
+    # The alias moves to a reduced version; until the next refresh, the old version is searched unreduced
+    assert db.point_alias("docs", "docs_v2")
+    retriever._vector_search("q", 3, query_vector=[0.1] * 16)
+    retriever._live_checked_at = float("-inf")
+    retriever._vector_search("q", 3, query_vector=[0.1] * 16)
+    assert searched == [("docs_v1", 16), ("docs_v1", 16), ("docs_v2", 4)]
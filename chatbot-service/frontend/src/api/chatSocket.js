@@ -0,0 +1,119 @@
+// WebSocket client for /ws/chat: authenticates once, then carries many messages and streamed replies.
+// See ChatConnection in backend/src/chat_ws.py for the protocol.
+
+const WS_URL = 'ws://localhost:8000/ws/chat'; // Use localhost for local dev
+
+export class ChatSocket {
+  // getToken: async function returning a valid access token, e.g. after keycloak.updateToken(30)
+  constructor(getToken, sessionId = null) {
+    this.getToken = getToken;
+    this.sessionId = sessionId;
+    this.socket = null;
+    this.handlers = null; // callbacks of the reply in progress
+    this.turn = 0; // id of the last message sent on this connection; replies to older turns are ignored
+    this.ready = null;
+  }
+
+  // Opens the connection and authenticates; resolves once the server is ready
+  connect() {
+    if (this.ready) {
+      return this.ready;
+    }
+    this.ready = new Promise((resolve, reject) => {
+      const socket = new WebSocket(WS_URL);
+      this.socket = socket;
+      this.turn = 0; // the server numbers turns per connection
+
+      socket.onopen = async () => {
+        try {
+          const token = await this.getToken();
+          socket.send(JSON.stringify({ type: 'auth', token, session_id: this.sessionId }));
+        } catch (e) {
+          socket.close();
+          reject(e);
+        }
+      };
+
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'ready') {
+          this.sessionId = message.session_id;
+          resolve(this);
+          return;
+        }
+        this.handleMessage(message);
+      };
+
+      socket.onclose = (event) => {
+        this.socket = null;
+        this.ready = null;
+        if (this.handlers) {
+          this.handlers.onError && this.handlers.onError({ code: 'closed', detail: event.reason || 'Connexion fermée' });
+          this.handlers = null;
+        }
+        reject(new Error(`Connexion au chatbot fermée (${event.code})`));
+      };
+    });
+    return this.ready;
+  }
+
+  async handleMessage(message) {
+    // Late start/delta/end/error/cancelled of a replaced or cancelled turn must not reach the current reply
+    if (message.id !== undefined && message.id !== this.turn) {
+      return;
+    }
+    const handlers = this.handlers || {};
+    switch (message.type) {
+      case 'start':
+        handlers.onStart && handlers.onStart(message.source);
+        break;
+      case 'delta':
+        handlers.onDelta && handlers.onDelta(message.text);
+        break;
+      case 'end':
+        this.sessionId = message.session_id;
+        this.handlers = null;
+        handlers.onEnd && handlers.onEnd(message.source);
+        break;
+      case 'error':
+        if (message.id !== undefined) {
+          this.handlers = null;
+        }
+        handlers.onError && handlers.onError(message);
+        break;
+      case 'cancelled':
+        break;
+      case 'reauth_required': {
+        // The token expired: send a refreshed one before the server's grace period ends
+        const token = await this.getToken();
+        this.socket && this.socket.send(JSON.stringify({ type: 'auth', token }));
+        break;
+      }
+      default:
+        break;
+    }
+  }
+
+  // Sends a message; a reply still in progress is cancelled by the server.
+  // handlers: { onStart(source), onDelta(text), onEnd(source), onError({ code, detail }) }
+  async send(text, handlers = {}) {
+    await this.connect();
+    this.turn += 1;
+    this.handlers = handlers;
+    this.socket.send(JSON.stringify({ type: 'message', text }));
+  }
+
+  // Stops the reply being generated
+  cancel() {
+    if (this.socket && this.handlers) {
+      this.socket.send(JSON.stringify({ type: 'cancel' }));
+      this.handlers = null;
+    }
+  }
+
+  close() {
+    if (this.socket) {
+      this.socket.close(1000);
+    }
+  }
+}
@@ -2,7 +2,8 @@ import keycloak from './keycloak'; // Corrected path to the Keycloak instance
 
 const API_URL = 'http://localhost:8000'; // Use localhost for local dev
 
-export async function sendMessageToChatbot(message, token) {
+// sessionId: id returned by a previous reply, so the server keeps the conversation context (null starts a new one)
+export async function sendMessageToChatbot(message, token, sessionId = null) {
   if (!token) {
     throw new Error("Aucun token disponible. Veuillez vous connecter.");
   }
@@ -12,10 +13,39 @@ export async function sendMessageToChatbot(message, token) {
       "Content-Type": "application/json",
       "Authorization": `Bearer ${token}`
     },
-    body: JSON.stringify({ message })
+    body: JSON.stringify(sessionId ? { message, session_id: sessionId } : { message })
   });
   if (!response.ok) {
     throw new Error("Erreur lors de l'envoi du message au chatbot");
   }
   return response.json();
-}
\ No newline at end of file
+}
+// Long answers: submits the message as a background job and returns { job_id, status, session_id } at once
+export async function submitChatJob(message, token, sessionId = null) {
+  if (!token) {
+    throw new Error("Aucun token disponible. Veuillez vous connecter.");
+  }
+  const response = await fetch(`${API_URL}/chat/jobs`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "Authorization": `Bearer ${token}`
+    },
+    body: JSON.stringify(sessionId ? { message, session_id: sessionId } : { message })
+  });
+  if (!response.ok) {
+    throw new Error("Erreur lors de l'envoi du message au chatbot");
+  }
+  return response.json();
+}
+
+// Fetches a job, waiting up to `wait` seconds on the server for it to finish (status 'done' carries the response)
+export async function getChatJob(jobId, token, wait = 20) {
+  const response = await fetch(`${API_URL}/chat/jobs/${jobId}?wait=${wait}`, {
+    headers: { "Authorization": `Bearer ${token}` }
+  });
+  if (!response.ok) {
+    throw new Error("Réponse du chatbot introuvable ou expirée");
+  }
+  return response.json();
+}
@@ -0,0 +1,202 @@
+// Client-side FAQ matching against the backend's rules snapshot (/rules/snapshot).
+// Mirrors RulesManager.find_matching_rule so rule hits are answered without calling /chat.
+
+const API_URL = 'http://localhost:8000'; // Use localhost for local dev
+const STORAGE_KEY = 'rulesSnapshot';
+// Snapshot layout this matcher understands; a newer format falls back to the backend
+const SUPPORTED_FORMAT = 3;
+
+function loadStoredSnapshot() {
+  try {
+    const stored = JSON.parse(localStorage.getItem(STORAGE_KEY));
+    return stored && stored.format === SUPPORTED_FORMAT ? stored : null;
+  } catch (e) {
+    return null;
+  }
+}
+
+// Fetches the snapshot, revalidating the stored copy with its ETag (a 304 costs no body).
+// Returns null if no usable snapshot is available; the caller then sends everything to /chat.
+export async function fetchRulesSnapshot() {
+  const stored = loadStoredSnapshot();
+  const headers = stored ? { 'If-None-Match': `"${stored.version}"` } : {};
+  try {
+    const response = await fetch(`${API_URL}/rules/snapshot`, { headers });
+    if (response.status === 304) {
+      return stored;
+    }
+    if (!response.ok) {
+      return stored;
+    }
+    const snapshot = await response.json();
+    if (snapshot.format !== SUPPORTED_FORMAT) {
+      return null;
+    }
+    localStorage.setItem(STORAGE_KEY, JSON.stringify(snapshot));
+    return snapshot;
+  } catch (e) {
+    return stored;
+  }
+}
+
+// Same normalization as rules_manager.normalize_words: accent folding, elided articles dropped, light stemming
+const ELISION = /\b(?:jusqu|lorsqu|puisqu|qu|[cdjlmnst])['’]/g;
+
+function fold(text) {
+  return text.toLowerCase().replace(/œ/g, 'oe').replace(/æ/g, 'ae').normalize('NFD').replace(/\p{M}/gu, '');
+}
+
+function stem(word) {
+  if (word.length > 3 && /[sx]$/.test(word) && !word.endsWith('ss')) {
+    word = word.slice(0, -1); // a plural is a noun or adjective: its -er is not a verb ending
+  } else if (word.length > 4 && /e[rz]$/.test(word)) {
+    word = word.slice(0, -2);
+  }
+  if (word.length > 3 && word.endsWith('e')) {
+    word = word.slice(0, -1);
+  }
+  return word;
+}
+
+function normalizeWords(text) {
+  return (fold(text).replace(ELISION, ' ').match(/[\p{L}\p{N}_]+/gu) || []).map(stem);
+}
+
+// Words without the snapshot's stopwords; all of them if nothing else is left
+function contentWords(snapshot, words) {
+  const stopwords = getIndex(snapshot).stopwords;
+  const content = words.filter((word) => !stopwords.has(word));
+  return content.length > 0 ? content : words;
+}
+
+function wordTrigrams(word) {
+  const padded = ` ${word} `;
+  const trigrams = new Set();
+  for (let i = 0; i + 3 <= padded.length; i += 1) {
+    trigrams.add(padded.slice(i, i + 3));
+  }
+  return trigrams;
+}
+
+function countShared(a, b) {
+  let shared = 0;
+  a.forEach((item) => {
+    if (b.has(item)) {
+      shared += 1;
+    }
+  });
+  return shared;
+}
+
+// Trigram index over the snapshot's patterns, built once per snapshot
+const indexes = new WeakMap();
+
+function getIndex(snapshot) {
+  let index = indexes.get(snapshot);
+  if (!index) {
+    const postings = new Map();
+    const rules = snapshot.rules.map((rule, position) => {
+      const wordGrams = new Map(rule.w.map((word) => [word, wordTrigrams(word)]));
+      const trigrams = new Set();
+      wordGrams.forEach((grams) => grams.forEach((gram) => trigrams.add(gram)));
+      trigrams.forEach((gram) => {
+        if (!postings.has(gram)) {
+          postings.set(gram, []);
+        }
+        postings.get(gram).push(position);
+      });
+      return { rule, wordGrams, trigramCount: trigrams.size };
+    });
+    index = { rules, postings, stopwords: new Set(snapshot.stopwords) };
+    indexes.set(snapshot, index);
+  }
+  return index;
+}
+
+function wordsMatch(snapshot, word, other, grams, otherGrams) {
+  if (word === other) {
+    return true;
+  }
+  if (Math.min(word.length, other.length) < snapshot.word_fuzzy_min_length) {
+    return false;
+  }
+  return (2 * countShared(grams, otherGrams)) / (grams.size + otherGrams.size) >= snapshot.word_threshold;
+}
+
+// Pattern words matched by some message word, and whether every message word matches a pattern word
+function overlap(snapshot, messageGrams, indexed) {
+  let common = 0;
+  indexed.wordGrams.forEach((grams, word) => {
+    for (const [other, otherGrams] of messageGrams) {
+      if (wordsMatch(snapshot, word, other, grams, otherGrams)) {
+        common += 1;
+        break;
+      }
+    }
+  });
+  let covered = true;
+  messageGrams.forEach((otherGrams, other) => {
+    let found = false;
+    indexed.wordGrams.forEach((grams, word) => {
+      found = found || wordsMatch(snapshot, word, other, grams, otherGrams);
+    });
+    covered = covered && found;
+  });
+  return { common, covered };
+}
+
+// Returns the answer of the best matching rule, or null if the message must go to the backend
+export function matchRule(snapshot, message) {
+  if (!snapshot) {
+    return null;
+  }
+  const words = normalizeWords(message);
+  if (words.length === 0) {
+    return null;
+  }
+  const index = getIndex(snapshot);
+  const text = ` ${words.join(' ')} `;
+  const messageGrams = new Map([...new Set(contentWords(snapshot, words))].map((word) => [word, wordTrigrams(word)]));
+  // Candidates: rules sharing enough trigrams with the message, relative to the smaller side
+  const shared = new Map();
+  const allGrams = new Set();
+  messageGrams.forEach((grams) => grams.forEach((gram) => allGrams.add(gram)));
+  allGrams.forEach((gram) => {
+    (index.postings.get(gram) || []).forEach((position) => {
+      shared.set(position, (shared.get(position) || 0) + 1);
+    });
+  });
+  const scored = [];
+  const covering = [];
+  [...shared.keys()].sort((a, b) => a - b).forEach((position) => {
+    const indexed = index.rules[position];
+    if (shared.get(position) < snapshot.candidate_threshold * Math.min(allGrams.size, indexed.trigramCount)) {
+      return;
+    }
+    // A pattern contained in the message wins over any word overlap
+    if (indexed.rule.p && text.includes(` ${indexed.rule.p} `)) {
+      scored.push({ score: 2, position });
+      return;
+    }
+    const { common, covered } = overlap(snapshot, messageGrams, indexed);
+    scored.push({ score: common / Math.max(messageGrams.size, indexed.wordGrams.size), position });
+    if (covered) {
+      covering.push(position);
+    }
+  });
+  // A short query whose words are all found in one rule's pattern, and no other, matches that rule
+  if (messageGrams.size <= snapshot.short_query_words && covering.length === 1) {
+    scored.forEach((candidate) => {
+      if (candidate.position === covering[0]) {
+        candidate.score = Math.max(candidate.score, 1);
+      }
+    });
+  }
+  let best = null;
+  scored.forEach((candidate) => {
+    if (best === null || candidate.score > best.score) {
+      best = candidate; // ties keep the rule listed first
+    }
+  });
+  return best && best.score > snapshot.threshold ? index.rules[best.position].rule.a : null;
+}
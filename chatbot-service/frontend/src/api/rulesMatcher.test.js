@@ -0,0 +1,33 @@
+import { matchRule } from './rulesMatcher';
+
+// Format 3 snapshot as served by /rules/snapshot for three of the rules
+const snapshot = {
+  format: 3,
+  threshold: 0.7,
+  word_threshold: 0.6,
+  word_fuzzy_min_length: 5,
+  candidate_threshold: 0.3,
+  short_query_words: 2,
+  stopwords: ['a', 'ce', 'comment', 'de', 'des', 'l', 'la', 'le', 'les', 'qu', 'que', 'quel', 'quell', 's', 'sont'],
+  rules: [
+    { q: 'Quelles sont les filières disponibles ?', p: 'quell sont les filier disponibl', w: ['disponibl', 'filier'], a: 'programs' },
+    { q: 'Quels sont les chiffres clés ?', p: 'quel sont les chiffr cle', w: ['chiffr', 'cle'], a: 'figures' },
+    { q: "Comment s'inscrire ?", p: 'comment inscrir', w: ['inscrir'], a: 'enrollment' },
+  ],
+  version: 'test',
+};
+
+test.each([
+  ['inscrir', 'enrollment'],
+  ['comment s inscrire', 'enrollment'],
+  ['filieres', 'programs'],
+  ['Filiers', 'programs'],
+  ['Quelles sont les filières ?', 'programs'],
+  ['chiffres', 'figures'],
+])('matches %p', (message, answer) => {
+  expect(matchRule(snapshot, message)).toBe(answer);
+});
+
+test.each(['les', 'inscription', 'sont disponibles les chiffres', 'quelle est la météo'])('leaves %p to the backend', (message) => {
+  expect(matchRule(snapshot, message)).toBeNull();
+});
@@ -1,7 +1,8 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { sendMessageToChatbot } from '../api/chatbotAPI';
+import { fetchRulesSnapshot, matchRule } from '../api/rulesMatcher';
 
-// Hardcoded rules from backend/src/data/rules.json
+// Hardcoded rules from backend/src/data/rules.json, shown as suggestions until the rules snapshot is loaded
 const RULES = [
     {
         pattern: "Qu'est-ce que l'EST Salé ?",
@@ -36,15 +37,33 @@ const ChatWindow = ({ token }) => {
     const [error, setError] = useState('');
     const [search, setSearch] = useState('');
     const [showSuggestions, setShowSuggestions] = useState(true);
+    const [sessionId, setSessionId] = useState(null);
+    const [rulesSnapshot, setRulesSnapshot] = useState(null);
+
+    useEffect(() => {
+        fetchRulesSnapshot().then(setRulesSnapshot);
+    }, []);
+
+    const suggestions = rulesSnapshot
+        ? rulesSnapshot.rules.map((rule) => ({ pattern: rule.q, answer: rule.a }))
+        : RULES;
 
     const handleSend = async () => {
         if (!input.trim()) return;
-        setMessages([...messages, { from: 'user', text: input }]);
-        setLoading(true);
         setError('');
         setShowSuggestions(false);
+        // FAQ questions are answered from the rules snapshot without a round trip to /chat
+        const localAnswer = matchRule(rulesSnapshot, input);
+        if (localAnswer) {
+            setMessages([...messages, { from: 'user', text: input }, { from: 'bot', text: localAnswer }]);
+            setInput('');
+            return;
+        }
+        setMessages([...messages, { from: 'user', text: input }]);
+        setLoading(true);
         try {
-            const res = await sendMessageToChatbot(input, token);
+            const res = await sendMessageToChatbot(input, token, sessionId);
+            setSessionId(res.session_id);
             setMessages((msgs) => [...msgs, { from: 'bot', text: res.response }]);
         } catch (e) {
             setError("Erreur lors de la communication avec le chatbot.");
@@ -128,7 +147,7 @@ const ChatWindow = ({ token }) => {
                         {/* Suggestions */}
                         {showSuggestions && (
                             <div style={{ marginTop: 18, display: 'flex', flexWrap: 'wrap', gap: 10 }}>
-                                {RULES.map((rule, idx) => (
+                                {suggestions.map((rule, idx) => (
                                     <button
                                         key={idx}
                                         onClick={() => handleSuggestion(rule.pattern, rule.answer)}
@@ -170,7 +189,7 @@ const ChatWindow = ({ token }) => {
                         {/* Suggestions after conversation started */}
                         {showSuggestions && (
                             <div style={{ marginTop: 12, display: 'flex', flexWrap: 'wrap', gap: 10 }}>
-                                {RULES.map((rule, idx) => (
+                                {suggestions.map((rule, idx) => (
                                     <button
                                         key={idx}
                                         onClick={() => handleSuggestion(rule.pattern, rule.answer)}
@@ -196,12 +215,12 @@ const ChatWindow = ({ token }) => {
                     {/* Show suggestions based on search */}
                     {search && (
                         <div style={{ marginTop: 8 }}>
-                            {RULES.filter(rule => rule.pattern.toLowerCase().includes(search.toLowerCase())).map((rule, idx) => (
+                            {suggestions.filter(rule => rule.pattern.toLowerCase().includes(search.toLowerCase())).map((rule, idx) => (
                                 <div key={idx} style={{ padding: '6px 0', color: '#ff8000', fontWeight: 500 }}>
                                     {rule.pattern}
                                 </div>
                             ))}
-                            {RULES.filter(rule => rule.pattern.toLowerCase().includes(search.toLowerCase())).length === 0 && (
+                            {suggestions.filter(rule => rule.pattern.toLowerCase().includes(search.toLowerCase())).length === 0 && (
                                 <div style={{ color: '#888' }}>Aucun résultat trouvé.</div>
                             )}
                         </div>